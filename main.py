@@ -2,17 +2,25 @@ import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
+from models.database import Base, engine, upgrade_schema, SessionLocal
+import models.Task, models.User, models.rag_chat  # 注册全部模型，建表前导入
+
+# 导入task模块时评估工作线程即启动并查询评估表，须先建表并补齐旧数据库缺少的列
+Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
+
 from rag import rag_router
-from models.database import Base, engine
 from fastapi import FastAPI
 from auth import user_router
 from rag.application.knowledge_manager import original_knowledge_init
 from rag.services import service_router
 from task import task_router
+from task.series import backfill_scores
 
 g_prefix = "/api"
 
-Base.metadata.create_all(bind=engine)
+with SessionLocal() as db:
+    backfill_scores(db)
 original_knowledge_init()
 origins = [
     "http://47.97.175.75",
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Index, Float
+from sqlalchemy import Column, String, Integer, Index, Float, LargeBinary
 
 from models.database import Base
 
@@ -21,7 +21,8 @@ class Task(Base):
 
 class RAGEvaluation(Base):
     __tablename__ = "rag_evaluation"
-    __table_args__ = (Index("ix_rag_task_id", "task_id"),)
+    __table_args__ = (Index("ix_rag_task_id", "task_id"),
+                      Index("ix_rag_task_method", "task_id", "method", "id"))
     id = Column(Integer, primary_key=True, autoincrement=True)
     task_id = Column(Integer)
     abstract = Column(String(16))
@@ -31,6 +32,7 @@ class RAGEvaluation(Base):
     input_text = Column(String)
     output_id = Column(Integer)
     output_text = Column(Float)
+    score = Column(Float)  # 数值得分，用于统计与图表
     status = Column(String(16))  # waiting, evaluating, success, failed
     created = Column(Integer)
     started = Column(Integer)
@@ -47,7 +49,8 @@ class RAGEvaluation(Base):
 
 class PromptEvaluation(Base):
     __tablename__ = "prompt_evaluation"
-    __table_args__ = (Index("ix_prompt_task_id", "task_id"),)
+    __table_args__ = (Index("ix_prompt_task_id", "task_id"),
+                      Index("ix_prompt_task_method", "task_id", "method", "id"))
     id = Column(Integer, primary_key=True, autoincrement=True)
     task_id = Column(Integer)
     abstract = Column(String(16))
@@ -57,6 +60,7 @@ class PromptEvaluation(Base):
     input_text = Column(String)
     output_id = Column(Integer)
     output_text = Column(String)
+    score = Column(Float)  # 从output_text中解析出的分数(/10)
     autofill = Column(String)  # 是否允许系统自动填充 auto, manual, none
     user_fill = Column(String)  # 用户填充的内容
     status = Column(String(16))  # waiting, evaluating, success, failed
@@ -97,6 +101,7 @@ class TaskPlot(Base):
     task_id = Column(Integer)
     method = Column(String(32))
     link = Column(String)
+    version = Column(String(64))  # 生成图表时评估集合的版本
 
 
 class Optimization(Base):
@@ -117,3 +122,32 @@ class CustomMetric(Base):
     category = Column(String(16))  # rag, prompt
     description = Column(String(256))
     created = Column(Integer)
+
+
+class RAGEmbeddingCache(Base):
+    __tablename__ = "rag_embedding_cache"
+    __table_args__ = (Index("ix_rag_embedding_cache_last_used", "last_used"),)
+    text_hash = Column(String(64), primary_key=True)  # sha256(model + text)
+    model = Column(String(64))
+    vector = Column(LargeBinary)  # float32
+    last_used = Column(Integer)  # 毫秒时间戳，用于LRU淘汰
+
+
+class RAGRowScore(Base):
+    __tablename__ = "rag_row_score"
+    fingerprint = Column(String(64), primary_key=True)  # sha256(metric + 样本字段)
+    metric = Column(String(64), index=True)
+    score = Column(Float)
+    created = Column(Integer)
+
+
+class EvalRowScore(Base):
+    __tablename__ = "eval_row_score"
+    __table_args__ = (Index("ix_eval_row_score_eval", "eval_id", "row_index"),
+                      Index("ix_eval_row_score_task_method", "task_id", "method", "score"))
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    eval_id = Column(Integer)  # RAGEvaluation.id
+    task_id = Column(Integer)
+    method = Column(String(32))
+    row_index = Column(Integer)  # 上传数据集中的行号，从0开始
+    score = Column(Float)  # 评估失败的行为NULL
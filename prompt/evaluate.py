@@ -29,6 +29,14 @@ def evaluate_prompt(prompt: str, metrics: list[Metric]) -> dict[str, float]:
             results[metric.metric] = f"评估失败：{e}"
     return results
 
+def parse_prompt_score(output_text: str | None) -> float | None:
+    """从 "评估分数：x/10，理由" 中解析出分数"""
+    if not output_text:
+        return None
+    match = re.search(r"评估分数：([\d.]+)/10", output_text)
+    return float(match.group(1)) if match else None
+
+
 def process_prompt_task(evaluation: PromptEvaluation) -> str:
     metric_mapping = {
         "通顺性": liquidityMetric,
@@ -51,7 +59,8 @@ def process_prompt_task(evaluation: PromptEvaluation) -> str:
                     PromptEvaluation.method,
                     func.max(PromptEvaluation.id).label("max_id"),
                     PromptEvaluation.output_text,
-                    PromptEvaluation.input_text
+                    PromptEvaluation.input_text,
+                    PromptEvaluation.score
                 )
                 .filter(PromptEvaluation.task_id == evaluation.task_id)
                 .group_by(PromptEvaluation.method)
@@ -61,10 +70,11 @@ def process_prompt_task(evaluation: PromptEvaluation) -> str:
             r_prompt = ''
             # 提取分数并找出最低分数的指标
             score_dict = {}
-            for method, _, output_text, raw_prompt in subquery:
+            for method, _, output_text, raw_prompt, score in subquery:
                 try:
-                    # 提取分数和理由
-                    score = float(output_text.split("：")[1].split("/")[0])  # 提取分数
+                    # 旧数据可能没有数值得分，从文本中提取
+                    if score is None:
+                        score = float(output_text.split("：")[1].split("/")[0])
                     reason = output_text.split("/10，")[1]  # 提取理由
                     score_dict[reason] = score
                     r_prompt = raw_prompt
@@ -12,11 +12,16 @@ from rag.utils.socket_manager import manager
 from models.rag_chat import ChatMessage
 from image_recognize.recognize import recognize_image
 from rag.utils.chat_session import get_session_messages, update_session_summary
-from rag.utils.vector_db import VectorDatabase
+from rag.utils.vector_store import create_vector_database
+from rag.utils.lexical_index import LexicalIndex, RRF_K, reciprocal_rank_fusion
+from rag.utils.entity_index import EntityIndex
+from rag.utils.response_cache import response_cache
+from rag.utils.reranker import RERANK_SKIP_MARGIN, Reranker, create_reranker, is_decisive
 from rag.utils.llm import LLMService
 from dataclasses import dataclass
 from typing import List, Dict, Any, Optional, AsyncGenerator, Union
 import asyncio
+import heapq
 import logging
 import sys
 
@@ -70,6 +75,9 @@ CONTEXT_GENERATION_PROMPT = """历史对话记录：
 {current_question}
 """
 
+# 生成失败时返回给用户的回答前缀，这类回答不写入缓存
+GENERATION_ERROR_PREFIX = "抱歉，生成回答时出现错误"
+
 FINAL_RESPONSE_PROMPT = """你是一个专业的智能助手，请参考提供的相关文档和用户问题，生成准确、有用的回答。
 
 用户问题：
@@ -96,7 +104,18 @@ class COTConfig:
     llm_model: str = "gpt-4o-mini"
     llm_temperature: float = 0.7
     llm_max_tokens: Optional[int] = None
-    vector_db_path: str = "data/chroma"
+    vector_db_path: Optional[str] = None  # 默认取所选后端的默认路径
+    vector_backend: Optional[str] = None  # chroma/faiss，默认取RAG_VECTOR_BACKEND
+    hybrid_search: bool = True  # 向量检索与BM25关键词检索并行，结果做倒数排名融合
+    hybrid_candidates: int = 20  # 融合前每路检索在每个知识库取的候选数量
+    rrf_k: int = RRF_K  # 倒数排名融合的排名偏移量
+    lexical_index_path: Optional[str] = None  # 默认取RAG_LEXICAL_INDEX_PATH
+    entity_lookup: bool = True  # 问题提到已知实体时直接取其文档块，跳过向量检索
+    entity_index_path: Optional[str] = None  # 默认取RAG_ENTITY_INDEX_PATH
+    response_cache: bool = True  # 改写后的问题与缓存问题足够相似时直接复用回答
+    reranker: Optional[str] = None  # none/lexical/llm，默认取RAG_RERANKER
+    rerank_candidates: int = 10  # 参与重排的候选数量，重排后取前top_k_documents个
+    rerank_skip_margin: float = RERANK_SKIP_MARGIN  # 首个候选相似度领先其余候选达到该值时跳过重排
 
 
 class COTModule:
@@ -116,8 +135,11 @@ class COTModule:
         """
         self.config = config or COTConfig()
         self.llm_service = llm_service
-        self.vector_db = VectorDatabase(
-            persist_directory=self.config.vector_db_path)
+        self.vector_db = create_vector_database(
+            self.config.vector_db_path, backend=self.config.vector_backend)
+        self.lexical_index = LexicalIndex(self.config.lexical_index_path)
+        self.entity_index = EntityIndex(self.config.entity_index_path)
+        self.reranker: Optional[Reranker] = None  # 依赖llm_service，在initialize中创建
 
         logger.info(f"COT模块初始化完成，配置: {self.config}")
 
@@ -133,6 +155,9 @@ class COTModule:
             )
 
         await self.vector_db.initialize()
+        await self.lexical_index.initialize()
+        await self.entity_index.initialize()
+        self.reranker = create_reranker(self.config.reranker, self.llm_service)
         logger.info("COT模块异步组件初始化完成")
 
     def set_config(self, model: str, temperature: float):
@@ -278,67 +303,34 @@ class COTModule:
             # 如果生成失败，返回我们已构建的问题（可能包含图片信息）
             return question_to_pass_to_llm
 
-    async def rerank(self, formatted_results: List[Dict[str, Any]], query: str):
-        for doc in formatted_results:
-            doc["score"] = 0
-        n = len(formatted_results)
-        tasks = []
-
-        prompt_template = """Given a query "{query}", which of the following two passages is more relevant to the query?
-
-    Passage A: "{doc1}"
-
-    Passage B: "{doc2}"
-    Output Passage A or Passage B:"""
-
-        for i in range(n):
-            for j in range(i + 1, n):
-                doc_i = formatted_results[i]
-                doc_j = formatted_results[j]
+    async def rerank(
+            self, documents: List[Dict[str, Any]], query: str
+    ) -> List[Dict[str, Any]]:
+        """
+        按与问题的相关程度重排候选文档
 
-                prompt1 = prompt_template.format(
-                    query=query, doc1=doc_i["content"], doc2=doc_j["content"]
-                )
-                prompt2 = prompt_template.format(
-                    query=query, doc1=doc_j["content"], doc2=doc_i["content"]
-                )
+        检索相似度已足够拉开差距时保持检索顺序，不做重排；重排失败时同样保持原顺序
 
-                async def compare_and_score(i=i, j=j, prompt=prompt1):
-                    result = await self.llm_service.generate_response(prompt)
-                    result = result.strip()
-                    print(result)
-                    if "A" in result:
-                        formatted_results[i]["score"] += 1
-                    elif "B" in result:
-                        formatted_results[j]["score"] += 1
-                    else:
-                        formatted_results[i]["score"] += 0.5
-                        formatted_results[j]["score"] += 0.5
-
-                async def compare_and_score_reverse(i=i, j=j, prompt=prompt2):
-                    result = await self.llm_service.generate_response(prompt)
-                    result = result.strip()
-                    print(result)
-                    if "A" in result:
-                        formatted_results[j]["score"] += 1
-                    elif "B" in result:
-                        formatted_results[i]["score"] += 1
-                    else:
-                        formatted_results[i]["score"] += 0.5
-                        formatted_results[j]["score"] += 0.5
-
-                tasks.append(compare_and_score())
-                tasks.append(compare_and_score_reverse())
-
-        # 执行所有 pairwise 比较
-        await asyncio.gather(*tasks)
-
-        # 按照得分排序
-        ranked_results = sorted(
-            formatted_results, key=lambda x: x["score"], reverse=True
-        )
+        Args:
+            documents: 按检索顺序排列的候选文档
+            query: 搜索问题
 
-        return ranked_results
+        Returns:
+            重排后的文档列表
+        """
+        try:
+            if self.reranker is None:
+                self.reranker = create_reranker(self.config.reranker, self.llm_service)
+            if self.reranker.name == "none" or is_decisive(
+                documents, self.config.rerank_skip_margin
+            ):
+                return documents
+            reranked = await self.reranker.rerank(query, documents)
+            logger.info(f"使用{self.reranker.name}重排器完成{len(documents)}个候选文档的重排")
+            return reranked
+        except Exception as e:
+            logger.error(f"文档重排失败，保持检索顺序: {e}")
+            return documents
 
     async def _search_documents(
             self, question: str, knowledge_bases: Union[str, List[str]]
@@ -356,50 +348,124 @@ class COTModule:
         if isinstance(knowledge_bases, str):
             knowledge_bases = [knowledge_bases]
 
-        all_retrieved_documents = []
         try:
-            for kb_name in knowledge_bases:
+            # 查询向量只计算一次，各知识库并发检索
+            query_embedding = await self.vector_db.embed_query(question)
+            top_k = self.config.top_k_documents
+            # 多取一些候选交给重排，重排后再截取top_k
+            pool_k = max(self.config.rerank_candidates, top_k)
+            hybrid = self.config.hybrid_search
+            candidate_k = max(self.config.hybrid_candidates, pool_k) if hybrid else pool_k
+
+            async def _search_kb(kb_name: str) -> List[Dict[str, Any]]:
                 logger.info(f"开始在知识库'{kb_name}'中搜索文档，问题: {question}")
-                results = await self.vector_db.search_documents(
-                    collection_name=kb_name,
-                    query_text=question,
-                    k=self.config.top_k_documents,  # Retrieve top_k from each KB
-                )
-                for document, similarity in results:
-                    all_retrieved_documents.append(
-                        {
-                            "content": document,
-                            "similarity": similarity,
-                            "source_kb": kb_name,
-                        }
+                try:
+                    results = await self.vector_db.search_documents(
+                        collection_name=kb_name,
+                        query_text=question,
+                        k=candidate_k,  # Retrieve candidates from each KB
+                        query_embedding=query_embedding,
                     )
+                except Exception as e:
+                    logger.error(f"在知识库'{kb_name}'中搜索失败: {e}")
+                    return []
                 logger.info(f"在知识库'{kb_name}'中找到{len(results)}个文档")
+                return [
+                    {
+                        "content": document,
+                        "similarity": similarity,
+                        "source_kb": kb_name,
+                    }
+                    for document, similarity in results
+                ]
+
+            async def _search_kb_lexical(kb_name: str) -> List[Dict[str, Any]]:
+                try:
+                    results = await self.lexical_index.search_documents(
+                        kb_name, question, k=candidate_k
+                    )
+                except Exception as e:
+                    logger.error(f"在知识库'{kb_name}'中关键词检索失败: {e}")
+                    return []
+                logger.info(f"在知识库'{kb_name}'中关键词检索找到{len(results)}个文档")
+                return [
+                    {"content": document, "similarity": None, "source_kb": kb_name}
+                    for document, _score in results
+                ]
+
+            async def _lookup_entities(kb_name: str) -> List[Dict[str, Any]]:
+                try:
+                    chunk_ids = await self.entity_index.lookup(kb_name, question)
+                    if not chunk_ids:
+                        return []
+                    # 只对实体的文档块精确打分，不走向量索引检索
+                    results = await self.vector_db.score_documents(
+                        kb_name, chunk_ids, query_embedding
+                    )
+                except Exception as e:
+                    logger.error(f"在知识库'{kb_name}'中查找实体失败: {e}")
+                    return []
+                logger.info(f"在知识库'{kb_name}'中命中实体，直接取得{len(results)}个文档")
+                return [
+                    {"content": document, "similarity": similarity, "source_kb": kb_name}
+                    for document, similarity in results[:candidate_k]
+                ]
+
+            async def _search_kb_rankings(kb_name: str) -> List[List[Dict[str, Any]]]:
+                if self.config.entity_lookup:
+                    entity_documents = await _lookup_entities(kb_name)
+                    if entity_documents:
+                        return [entity_documents]
+                searches = [_search_kb(kb_name)]
+                if hybrid:
+                    searches.append(_search_kb_lexical(kb_name))
+                return list(await asyncio.gather(*searches))
+
+            kb_rankings = await asyncio.gather(
+                *(_search_kb_rankings(kb_name) for kb_name in knowledge_bases)
+            )
+            rankings = [ranking for rankings_of_kb in kb_rankings for ranking in rankings_of_kb]
+            all_retrieved_documents = [doc for docs in rankings for doc in docs]
 
             if not all_retrieved_documents:
                 logger.info("所有指定知识库中均未找到相关文档")
                 return []
 
-            # 按相似度降序排序所有检索到的文档
-            all_retrieved_documents.sort(
-                key=lambda x: x["similarity"], reverse=True)
+            if hybrid:
+                # 各路排名做倒数排名融合，同一文档块只保留一条，相似度取向量检索的结果
+                merged: Dict[str, Dict[str, Any]] = {}
+                for doc in all_retrieved_documents:
+                    kept = merged.setdefault(doc["content"], doc)
+                    if kept["similarity"] is None or (
+                        doc["similarity"] is not None and doc["similarity"] > kept["similarity"]
+                    ):
+                        merged[doc["content"]] = doc
+                fused = reciprocal_rank_fusion(
+                    [[doc["content"] for doc in docs] for docs in rankings],
+                    k=self.config.rrf_k,
+                )
+                candidates = [merged[content] for content, _ in fused[:pool_k]]
+            else:
+                # 取全局相似度最高的候选文档
+                candidates = heapq.nlargest(
+                    pool_k,
+                    all_retrieved_documents,
+                    key=lambda x: x["similarity"],
+                )
 
-            # 取全局 top_k_documents 个文档
-            top_documents = all_retrieved_documents[: self.config.top_k_documents]
+            candidates = [
+                {"content": doc["content"], "similarity": doc["similarity"]}
+                for doc in candidates
+            ]
+            top_documents = (await self.rerank(candidates, question))[:top_k]
 
             formatted_results = []
             for i, doc_info in enumerate(top_documents):
-                formatted_results.append(
-                    {
-                        "index": i + 1,
-                        "content": doc_info["content"],
-                        "similarity": doc_info["similarity"],
-                    }
-                )
+                formatted_results.append({"index": i + 1, **doc_info})
 
             logger.info(
                 f"文档搜索完成，从所有知识库共找到{len(all_retrieved_documents)}个文档，返回最相关的{len(formatted_results)}个"
             )
-            await self.rerank(formatted_results, question)
             return formatted_results
 
         except Exception as e:
@@ -421,6 +487,9 @@ class COTModule:
 
         formatted_docs = []
         for doc in documents:
+            if doc["similarity"] is None:  # 仅由关键词检索命中
+                formatted_docs.append(f"文档{doc['index']} (关键词匹配):\n{doc['content']}")
+                continue
             formatted_docs.append(
                 f"文档{doc['index']} (相似度: {doc['similarity']:.3f}):\n{doc['content']}"
             )
@@ -462,11 +531,52 @@ class COTModule:
             if stream:
 
                 async def error_generator():
-                    yield f"抱歉，生成回答时出现错误: {str(e)}"
+                    yield f"{GENERATION_ERROR_PREFIX}: {str(e)}"
 
                 return error_generator()
             else:
-                return f"抱歉，生成回答时出现错误: {str(e)}"
+                return f"{GENERATION_ERROR_PREFIX}: {str(e)}"
+
+    def _cache_response(
+            self,
+            scope: str,
+            kb_versions: Dict[str, int],
+            question: str,
+            question_embedding: List[float],
+            response: Union[str, AsyncGenerator[str, None]],
+            documents: List[Dict[str, Any]],
+    ) -> Union[str, AsyncGenerator[str, None]]:
+        """
+        将回答写入缓存，出错的回答不缓存
+
+        流式回答在生成器完整输出后才写入，中途失败或被中断时不缓存
+
+        Returns:
+            原回答（流式时为包装后的异步生成器）
+        """
+
+        def store(answer: str):
+            if not answer or answer.startswith(GENERATION_ERROR_PREFIX):
+                return
+            try:
+                response_cache.put(
+                    scope, kb_versions, question, question_embedding, answer, documents
+                )
+            except Exception as e:
+                logger.warning(f"写入回答缓存失败: {e}")
+
+        if isinstance(response, str):
+            store(response)
+            return response
+
+        async def caching_generator():
+            parts = []
+            async for part in response:
+                parts.append(part)
+                yield part
+            store("".join(parts))
+
+        return caching_generator()
 
     async def _generate_summary(self, content: str) -> str:
         """
@@ -545,6 +655,29 @@ class COTModule:
                 summary = await self._generate_summary(context_question)
                 update_session_summary(session_id, summary)
 
+            # 语义缓存：同一模型与知识库下，改写后的问题足够相似时直接复用回答
+            cache_scope = None
+            question_embedding = None
+            kb_versions = None
+            if self.config.response_cache:
+                cache_scope = f"{self.llm_service.model}|{','.join(sorted(set(kb_info)))}"
+                # 在检索前记录知识库版本，检索或生成期间重新索引的知识库使本次回答不再命中
+                kb_versions = response_cache.versions(kb_info)
+                # 查询向量有缓存，后续检索不会重复计算
+                question_embedding = await self.vector_db.embed_query(context_question)
+                cached = response_cache.get(cache_scope, question_embedding)
+                if cached is not None:
+                    cached_answer, documents = cached
+                    logger.info("命中回答缓存，跳过检索与生成")
+                    await manager.send_stream(client_id, "think", "命中回答缓存...")
+                    if stream:
+
+                        async def cached_generator():
+                            yield cached_answer
+
+                        return cached_generator(), documents
+                    return cached_answer, documents
+
             # 步骤3: 搜索相关文档
             logger.info("=== 步骤3: 搜索相关文档 ===")
             await manager.send_stream(client_id, "think", "搜索相关文档...")
@@ -560,6 +693,12 @@ class COTModule:
                 context_question, formatted_documents, stream
             )
 
+            if cache_scope is not None and documents:
+                final_response = self._cache_response(
+                    cache_scope, kb_versions, context_question, question_embedding,
+                    final_response, documents,
+                )
+
             logger.info("COT请求处理完成")
             return final_response, documents
 
@@ -598,7 +737,7 @@ async def create_cot_module(
         max_history_messages: int = 10,
         top_k_documents: int = 5,  # This top_k is for the final combined result
         llm_model: str = "gpt-4o-mini",
-        vector_db_path: str = "data/chroma",
+        vector_db_path: Optional[str] = None,
 ) -> COTModule:
     """
     创建并初始化COT模块
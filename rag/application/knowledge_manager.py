@@ -2,6 +2,7 @@
 知识管理器，用于维护与 KnowledgeBase 表同步的向量数据库集合。
 """
 
+import hashlib
 import json
 import sys
 import time
@@ -10,19 +11,42 @@ sys.path.append("E:\\Projects\\RagevalBackend")
 
 import logging
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from pathlib import Path
 
 from rag.doc_process.json_to_markdown import JsonToMarkdownConverter
 from rag.doc_process.pdf_to_markdown import PdfToMarkdownConverter
 from rag.doc_process.markdown_process import MarkdownProcessor
-from rag.utils.vector_db import VectorDatabase
+from rag.utils.vector_store import create_vector_database
+from rag.utils.lexical_index import LexicalIndex
+from rag.utils.entity_index import EntityIndex, extract_entities
+from rag.utils.response_cache import response_cache
 from models.database import SessionLocal
 from models.rag_chat import KnowledgeBase
 
 logger = logging.getLogger(__name__)
 
 
+def _chunk_id(document: str) -> str:
+    """文档块的 id 由内容哈希得到，内容不变则 id 不变。"""
+    return hashlib.sha256(document.encode("utf-8")).hexdigest()[:32]
+
+
+def _file_hash(file_path: Path) -> str:
+    """源文件内容哈希，用于判断知识文件是否需要重新索引。"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _is_entity_json(file_path: Path) -> bool:
+    """JSON 知识的根对象为字典时，每个键是一个实体（武器、英雄等）。"""
+    with open(file_path, "r", encoding="utf-8") as f:
+        return isinstance(json.load(f), dict)
+
+
 def _export_original_knowledge(
         output_filename: str = "original_knowledge.json",
 ) -> bool:
@@ -183,18 +207,28 @@ class KnowledgeManager:
     def __init__(
             self,
             knowledge_library_path: str = "./data/knowledge_library",
-            vector_db_path: str = "./data/chroma",
+            vector_db_path: Optional[str] = None,
+            vector_backend: Optional[str] = None,
+            lexical_index_path: Optional[str] = None,
+            entity_index_path: Optional[str] = None,
     ):
         """
         初始化知识管理器重建。
 
         参数:
             knowledge_library_path: 知识库目录的路径
-            vector_db_path: 向量数据库存储的路径
+            vector_db_path: 向量数据库存储的路径，默认取所选后端的默认路径
+            vector_backend: 向量数据库后端（chroma/faiss），默认取RAG_VECTOR_BACKEND
+            lexical_index_path: BM25关键词索引的目录，默认取RAG_LEXICAL_INDEX_PATH
+            entity_index_path: 实体名索引的目录，默认取RAG_ENTITY_INDEX_PATH
         """
         self.knowledge_library_path = Path(knowledge_library_path)
-        self.vector_db_path = vector_db_path
-        self.vector_db = VectorDatabase(persist_directory=vector_db_path)
+        self.vector_db = create_vector_database(vector_db_path, backend=vector_backend)
+        self.vector_db_path = self.vector_db.persist_directory
+        # 与向量集合同名的BM25索引，入库时同步维护
+        self.lexical_index = LexicalIndex(lexical_index_path)
+        # 结构化 JSON 知识的实体名 -> 文档块 id
+        self.entity_index = EntityIndex(entity_index_path)
         self.markdown_processor = MarkdownProcessor()
 
         # 确保知识库目录存在
@@ -203,6 +237,8 @@ class KnowledgeManager:
     async def initialize(self):
         """初始化向量数据库。"""
         await self.vector_db.initialize()
+        await self.lexical_index.initialize()
+        await self.entity_index.initialize()
         logger.info("知识管理器重建已初始化")
 
     async def add_knowledge(self, knowledge: KnowledgeBase) -> bool:
@@ -215,6 +251,7 @@ class KnowledgeManager:
         返回:
             如果成功则为 True，否则为 False
         """
+        collection_created = False
         try:
             # 使用 name 属性作为集合名称
             collection_name = knowledge.name
@@ -284,60 +321,105 @@ class KnowledgeManager:
                 logger.warning(f"未从 {knowledge.name} 生成任何文档")
                 return False
 
-            # 步骤 3：创建集合
+            # 步骤 3：以内容哈希作为文档 id，相同内容的块只保留一份
+            chunks: Dict[str, str] = {}
+            for document in processed_documents:
+                chunks.setdefault(_chunk_id(document), document)
+            chunk_ids = list(chunks.keys())
+
+            collection_metadata = {
+                "source_file": knowledge.path,
+                "file_type": knowledge.type,
+                "assistant_id": knowledge.assistant_id,
+                "description": knowledge.description,
+                "knowledge_id": knowledge.id,
+                "source_hash": _file_hash(file_path),
+            }
             logger.info(f"正在创建集合 {collection_name}")
             collection_created = await self.vector_db.create_collection(
                 collection_name=collection_name,
-                metadata={
-                    "source_file": knowledge.path,
-                    "file_type": knowledge.type,
-                    "assistant_id": knowledge.assistant_id,
-                    "description": knowledge.description,
-                    "knowledge_id": knowledge.id,
-                },
+                metadata=collection_metadata,
             )
 
-            # 步骤 4：将文档插入集合
+            # 步骤 4：与已有集合对比，只嵌入新增的块，删除已不存在的块
+            existing_ids = (
+                set()
+                if collection_created
+                else set(await self.vector_db.get_document_ids(collection_name))
+            )
+            new_ids = [i for i in chunk_ids if i not in existing_ids]
+            kept_ids = [i for i in chunk_ids if i in existing_ids]
+            removed_ids = list(existing_ids - set(chunk_ids))
             logger.info(
-                f"正在向集合 {collection_name} 添加 {len(processed_documents)} 个文档"
+                f"集合 {collection_name}: 新增 {len(new_ids)} 个文档，"
+                f"删除 {len(removed_ids)} 个，未变化 {len(kept_ids)} 个"
             )
 
             # 为每个文档准备元数据
-            metadatas = [
-                {
+            chunk_index = {chunk_id: i for i, chunk_id in enumerate(chunk_ids)}
+
+            def _metadata(chunk_id: str) -> Dict[str, Any]:
+                return {
                     "source_file": knowledge.path,
-                    "chunk_index": i,
+                    "chunk_index": chunk_index[chunk_id],
                     "file_type": knowledge.type,
                     "assistant_id": knowledge.assistant_id,
                     "knowledge_id": knowledge.id,
                 }
-                for i in range(len(processed_documents))
-            ]
 
-            success = await self.vector_db.add_documents(
-                collection_name=collection_name,
-                documents=processed_documents,
-                metadatas=metadatas,
-            )
+            if removed_ids:
+                await self.vector_db.delete_documents(collection_name, removed_ids)
+            if kept_ids:
+                # 块的位置可能变化，只更新元数据，不重新嵌入
+                await self.vector_db.update_metadatas(
+                    collection_name, kept_ids, [_metadata(i) for i in kept_ids]
+                )
+
+            success = True
+            if new_ids:
+                success = await self.vector_db.add_documents(
+                    collection_name=collection_name,
+                    documents=[chunks[i] for i in new_ids],
+                    metadatas=[_metadata(i) for i in new_ids],
+                    ids=new_ids,
+                )
 
             if success:
+                # 关键词索引只增删变化的块，历史集合首次同步时补建
+                await self.lexical_index.sync_collection(
+                    collection_name, [chunks[i] for i in chunk_ids], chunk_ids
+                )
+                if file_type == "json" and _is_entity_json(file_path):
+                    await self.entity_index.build_collection(
+                        collection_name, extract_entities(chunks)
+                    )
+                else:
+                    await self.entity_index.delete_collection(collection_name)
+                # 知识内容已变化，基于旧内容缓存的回答作废
+                response_cache.invalidate_collection(collection_name)
+                if not collection_created:
+                    await self.vector_db.update_collection_metadata(
+                        collection_name, collection_metadata
+                    )
                 logger.info(
-                    f"成功添加知识 {knowledge.name}，包含 {len(processed_documents)} 个文档"
+                    f"成功添加知识 {knowledge.name}，包含 {len(chunk_ids)} 个文档"
                 )
                 return True
             else:
-                # 步骤 5：如果插入失败，删除集合以保持同步
-                logger.error(f"未能为 {knowledge.name} 插入文档，正在清理集合")
-                await self.vector_db.delete_collection(collection_name)
+                # 步骤 5：如果新建的集合插入失败，删除集合以保持同步
+                logger.error(f"未能为 {knowledge.name} 插入文档")
+                if collection_created:
+                    await self.vector_db.delete_collection(collection_name)
                 return False
 
         except Exception as e:
             logger.error(f"添加知识 {knowledge.name} 时出错: {e}")
-            # 如果已创建集合，则尝试清理集合
-            try:
-                await self.vector_db.delete_collection(knowledge.name)
-            except:
-                pass
+            # 如果本次新建了集合，则尝试清理集合；已有集合保留，下次同步时会补齐缺失的块
+            if collection_created:
+                try:
+                    await self.vector_db.delete_collection(knowledge.name)
+                except:
+                    pass
             return False
 
     async def delete_knowledge(self, knowledge: KnowledgeBase) -> bool:
@@ -355,6 +437,9 @@ class KnowledgeManager:
 
             # 删除集合
             collection_deleted = await self.vector_db.delete_collection(collection_name)
+            await self.lexical_index.delete_collection(collection_name)
+            await self.entity_index.delete_collection(collection_name)
+            response_cache.invalidate_collection(collection_name)
 
             if collection_deleted:
                 logger.info(f"已删除集合 {collection_name}")
@@ -540,10 +625,33 @@ class KnowledgeManager:
                     else:
                         logger.error(f"未能为知识 {name} 向向量数据库插入集合")
 
+                # 源文件有变化的知识增量重新索引
+                reindexed_collections_count = 0
+                for name in set(kb_names_to_record_map.keys()) & collection_names_in_vector_db:
+                    knowledge_record = kb_names_to_record_map[name]
+                    metadata = await self.vector_db.get_collection_metadata(name) or {}
+                    try:
+                        unchanged = metadata.get("source_hash") == _file_hash(
+                            Path(knowledge_record.path)
+                        )
+                    except OSError:
+                        continue
+                    # 文件未变化且派生索引齐全时跳过；缺少关键词索引的历史集合会补建（无需重新嵌入）
+                    if unchanged and self.lexical_index.has_collection(name):
+                        continue
+                    if await self.add_knowledge(knowledge_record):
+                        reindexed_collections_count += 1
+                        logger.info(f"已增量重新索引知识 {name}")
+                    else:
+                        logger.error(f"未能重新索引知识 {name}")
+
                 # 从向量数据库删除多余的集合
                 deleted_collections_count = 0
                 for collection_name in vector_collections_to_delete:
                     success = await self.vector_db.delete_collection(collection_name)
+                    await self.lexical_index.delete_collection(collection_name)
+                    await self.entity_index.delete_collection(collection_name)
+                    response_cache.invalidate_collection(collection_name)
                     if success:
                         deleted_collections_count += 1
                         logger.info(f"已从向量数据库删除孤立集合: {collection_name}")
@@ -560,6 +668,7 @@ class KnowledgeManager:
 
                 sync_results["step2_kb_vector_sync"] = {
                     "inserted_collections_to_vector_db": inserted_collections_count,
+                    "reindexed_collections": reindexed_collections_count,
                     "deleted_orphaned_collections_from_vector_db": deleted_collections_count,
                     "final_synced_collections_count": final_synced_collection_count,
                 }
@@ -570,6 +679,7 @@ class KnowledgeManager:
                         ]
                         + sync_results["step1_file_kb_sync"]["deleted_orphaned_disk_files"]
                         + inserted_collections_count
+                        + reindexed_collections_count
                         + deleted_collections_count
                 )
 
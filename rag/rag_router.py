@@ -20,6 +20,7 @@ from rag.utils.chat_session import (
     get_knowledge_base_content,
 )
 from access_token import get_user_id
+from rag.utils.query_cache import query_embedding_cache
 import os
 import uuid
 import time
@@ -307,6 +308,20 @@ async def delete_knowledge_base_route(kb_id: int, access_token: str = Cookie(Non
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/cache_stats")
+async def get_cache_stats(access_token: str = Cookie(None)):
+    """查询嵌入缓存的命中率等统计"""
+    try:
+        user_id = await get_user_id(access_token)
+        if not check_admin(user_id):
+            raise HTTPException(status_code=403, detail="需要管理员权限")
+        return {"success": True, "query_embedding_cache": query_embedding_cache.stats()}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/knowledge_base/{kb_id}/download")
 async def download_knowledge_base(kb_id: int, access_token: str = Cookie(None)):
     """下载知识库文件"""
@@ -0,0 +1,536 @@
+"""
+Append-only on-disk document store used by the FAISS vector database.
+
+Layout of a store directory:
+
+    docs.bin      length-prefixed UTF-8 document texts, append-only
+    offsets.bin   int64 start offset in docs.bin of each position, append-only
+    meta.sqlite   document id and JSON metadata per position, an inverted
+                  index (postings) from scalar metadata key/value to positions,
+                  and the tombstones of deleted positions
+
+Appending writes only the new records, and opening a store reads nothing but
+the offsets; texts are sliced from a memory map on demand. Deleting only
+records a tombstone; rewrite() drops tombstoned records for good. It writes
+the kept records to a new store in a side directory and moves its files over
+the live ones only once they are complete; the moves are listed in a pending
+file first, so a rewrite interrupted while moving is finished on the next open.
+
+In memory a store holds the offsets as a flat int64 array and, once metadata
+is first read, a columnar copy of it (MetadataColumns) in which each distinct
+value is stored once per key.
+"""
+
+import json
+import mmap
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+_LENGTH = struct.Struct("<I")
+
+# Bumped when the SQLite layout changes; older stores are migrated on open
+_SCHEMA_VERSION = 2
+
+_STORE_FILES = ("docs.bin", "offsets.bin", "meta.sqlite")
+# Side directory a rewrite builds the new store in
+_REWRITE_DIR = "rewrite"
+# {new file: live file} moves of a rewrite being committed
+_PENDING_FILE = "rewrite.pending"
+
+
+def _apply_moves(moves: Dict[str, str]) -> None:
+    for source, target in moves.items():
+        # Already moved if an earlier attempt was interrupted after it
+        if os.path.exists(source):
+            os.replace(source, target)
+
+
+def finish_pending_moves(directory: str) -> None:
+    """Complete the file moves of a rewrite that was interrupted while committing."""
+    pending_path = os.path.join(directory, _PENDING_FILE)
+    if os.path.exists(pending_path):
+        with open(pending_path, "r", encoding="utf-8") as f:
+            _apply_moves(json.load(f))
+        os.remove(pending_path)
+
+# Value marking rows without a value, per column typecode
+_MISSING = {"i": -1, "q": -(2 ** 63)}
+
+
+def _posting_value(value: Any) -> Optional[str]:
+    """Canonical key of a scalar metadata value, None for values that are not indexed."""
+    if isinstance(value, (str, int, float, bool)):
+        return json.dumps(value, ensure_ascii=False)
+    return None
+
+
+def _postings(position: int, metadata: Optional[Dict[str, Any]]):
+    for key, value in (metadata or {}).items():
+        encoded = _posting_value(value)
+        if encoded is not None:
+            yield key, encoded, position
+
+
+class MetadataColumns:
+    """
+    Columnar metadata of a store. Integer keys (chunk_index, ...) are plain
+    int64 columns; every other key is a categorical column of int32 codes
+    into its distinct values, so values repeated across rows (source_file,
+    file_type, ...) are kept once per collection.
+    """
+
+    def __init__(self):
+        self._codes: Dict[str, array] = {}
+        self._values: Dict[str, List[Any]] = {}
+        self._lookup: Dict[str, Dict[str, int]] = {}
+        # Codes of non-scalar values, which are kept JSON encoded so rows never share them
+        self._encoded: Dict[str, set] = {}
+        self._rows = 0
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _new_column(self, key: str, typecode: str) -> array:
+        column = self._codes[key] = array(typecode, [_MISSING[typecode]]) * self._rows
+        self._values[key] = []
+        self._lookup[key] = {}
+        self._encoded[key] = set()
+        return column
+
+    def _code(self, key: str, value: Any) -> int:
+        encoded = json.dumps(value, ensure_ascii=False, sort_keys=True)
+        lookup = self._lookup[key]
+        code = lookup.get(encoded)
+        if code is None:
+            code = lookup[encoded] = len(self._values[key])
+            if _posting_value(value) is None:
+                self._encoded[key].add(code)
+                value = encoded
+            self._values[key].append(value)
+        return code
+
+    def _to_categorical(self, key: str) -> array:
+        values = self._codes[key]
+        column = self._codes[key] = array("i", [_MISSING["i"]]) * len(values)
+        for position, value in enumerate(values):
+            if value != _MISSING["q"]:
+                column[position] = self._code(key, value)
+        return column
+
+    def _put(self, key: str, position: int, value: Any) -> None:
+        is_int = type(value) is int and _MISSING["q"] < value < 2 ** 63
+        column = self._codes.get(key)
+        if column is None:
+            column = self._new_column(key, "q" if is_int else "i")
+        if column.typecode == "q":
+            if is_int:
+                column[position] = value
+                return
+            column = self._to_categorical(key)
+        column[position] = self._code(key, value)
+
+    def append(self, metadatas: Sequence[Optional[Dict[str, Any]]]) -> None:
+        start = self._rows
+        self._rows += len(metadatas)
+        for column in self._codes.values():
+            column.extend(array(column.typecode, [_MISSING[column.typecode]]) * len(metadatas))
+        for i, metadata in enumerate(metadatas):
+            for key, value in (metadata or {}).items():
+                self._put(key, start + i, value)
+
+    def set(self, position: int, metadata: Optional[Dict[str, Any]]) -> None:
+        for column in self._codes.values():
+            column[position] = _MISSING[column.typecode]
+        for key, value in (metadata or {}).items():
+            self._put(key, position, value)
+
+    def row(self, position: int) -> Dict[str, Any]:
+        """Metadata dict of a position, empty if it has none."""
+        metadata: Dict[str, Any] = {}
+        if not 0 <= position < self._rows:
+            return metadata
+        for key, column in self._codes.items():
+            code = column[position]
+            if code == _MISSING[column.typecode]:
+                continue
+            if column.typecode == "q":
+                metadata[key] = code
+            else:
+                value = self._values[key][code]
+                metadata[key] = json.loads(value) if code in self._encoded[key] else value
+        return metadata
+
+    def nbytes(self) -> int:
+        """Approximate resident size: the columns plus the distinct values."""
+        columns = sum(column.itemsize * len(column) for column in self._codes.values())
+        values = sum(64 + len(encoded) for lookup in self._lookup.values() for encoded in lookup)
+        return columns + values
+
+
+class DocumentStore:
+    """
+    Position-addressed store of (id, text, metadata) records. Positions are
+    dense and match the row numbers of the collection's FAISS index.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Open (or create) a store.
+
+        Args:
+            directory: Directory holding the store files
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.docs_path = os.path.join(directory, "docs.bin")
+        self.offsets_path = os.path.join(directory, "offsets.bin")
+        self.meta_path = os.path.join(directory, "meta.sqlite")
+        self._lock = threading.RLock()
+        self._mmap: Optional[mmap.mmap] = None
+        finish_pending_moves(directory)
+        # Left over from a rewrite interrupted before its files were complete
+        shutil.rmtree(os.path.join(directory, _REWRITE_DIR), ignore_errors=True)
+        self._connect()
+
+    def _connect(self) -> None:
+        self._conn = sqlite3.connect(self.meta_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs (position INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, metadata TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_docs_doc_id ON docs (doc_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings (key TEXT NOT NULL, value TEXT NOT NULL, position INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_postings_key_value ON postings (key, value)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_postings_position ON postings (position)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tombstones (position INTEGER PRIMARY KEY)")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < _SCHEMA_VERSION:
+            self._rebuild_postings()
+            self._conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        self._conn.commit()
+        # (key, encoded value) -> sorted positions, cleared on every write
+        self._filter_cache: Dict[tuple, np.ndarray] = {}
+        self._open_files()
+
+    def _rebuild_postings(self) -> None:
+        self._conn.execute("DELETE FROM postings")
+        for position, metadata in self._conn.execute("SELECT position, metadata FROM docs").fetchall():
+            self._conn.executemany(
+                "INSERT INTO postings (key, value, position) VALUES (?, ?, ?)",
+                list(_postings(position, json.loads(metadata or "{}"))),
+            )
+
+    def _open_files(self) -> None:
+        for path in (self.docs_path, self.offsets_path):
+            if not os.path.exists(path):
+                open(path, "wb").close()
+        offsets = np.fromfile(self.offsets_path, dtype="<i8")
+        rows = self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+        # An interrupted append can leave offsets without metadata rows (or
+        # the reverse); drop the unfinished tail.
+        count = min(len(offsets), rows)
+        if count < len(offsets):
+            offsets = offsets[:count]
+            with open(self.offsets_path, "r+b") as f:
+                f.truncate(count * 8)
+        if count < rows:
+            self._conn.execute("DELETE FROM docs WHERE position >= ?", (count,))
+            self._conn.execute("DELETE FROM postings WHERE position >= ?", (count,))
+            self._conn.commit()
+        self._offsets = array("q", offsets.astype("=i8").tobytes())
+        self._columns: Optional[MetadataColumns] = None  # Built on first metadata read
+        self._tombstones = {
+            row[0] for row in self._conn.execute("SELECT position FROM tombstones")
+        }
+        self._close_mmap()
+
+    def _close_mmap(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _text_at(self, offset: int) -> str:
+        if self._mmap is None or offset + _LENGTH.size > len(self._mmap):
+            self._close_mmap()
+            if os.path.getsize(self.docs_path) == 0:
+                raise IndexError(offset)
+            with open(self.docs_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (length,) = _LENGTH.unpack_from(self._mmap, offset)
+        start = offset + _LENGTH.size
+        if start + length > len(self._mmap):
+            # Appended after the current mapping was made
+            self._close_mmap()
+            return self._text_at(offset)
+        return self._mmap[start : start + length].decode("utf-8")
+
+    def _metadata_columns(self) -> MetadataColumns:
+        if self._columns is None:
+            columns = MetadataColumns()
+            columns.append(
+                [
+                    json.loads(metadata or "{}")
+                    for (metadata,) in self._conn.execute(
+                        "SELECT metadata FROM docs WHERE position < ? ORDER BY position",
+                        (len(self._offsets),),
+                    )
+                ]
+            )
+            self._columns = columns
+        return self._columns
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held in memory (offsets, tombstones and metadata columns)."""
+        with self._lock:
+            usage = self._offsets.itemsize * len(self._offsets) + 64 * len(self._tombstones)
+            if self._columns is not None:
+                usage += self._columns.nbytes()
+            return usage
+
+    def __len__(self) -> int:
+        """Number of positions, tombstoned ones included (the FAISS row count)."""
+        return len(self._offsets)
+
+    @property
+    def live_count(self) -> int:
+        return len(self._offsets) - len(self._tombstones)
+
+    @property
+    def deleted_fraction(self) -> float:
+        return len(self._tombstones) / len(self._offsets) if self._offsets else 0.0
+
+    def live_positions(self) -> np.ndarray:
+        """Sorted positions that are not tombstoned."""
+        with self._lock:
+            positions = np.arange(len(self._offsets), dtype="int64")
+            if not self._tombstones:
+                return positions
+            return np.setdiff1d(
+                positions, np.fromiter(self._tombstones, dtype="int64"), assume_unique=True
+            )
+
+    def append(
+        self,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        metadatas: Optional[Sequence[Optional[Dict[str, Any]]]] = None,
+    ) -> List[int]:
+        """
+        Append records; only the new bytes are written.
+
+        Args:
+            ids: Document ids
+            documents: Document texts
+            metadatas: Optional metadata for each document
+
+        Returns:
+            Positions assigned to the new records
+        """
+        with self._lock:
+            start_position = len(self._offsets)
+            offset = os.path.getsize(self.docs_path)
+            new_offsets = []
+            chunks = []
+            for text in documents:
+                data = text.encode("utf-8")
+                new_offsets.append(offset)
+                chunks.append(_LENGTH.pack(len(data)))
+                chunks.append(data)
+                offset += _LENGTH.size + len(data)
+            with open(self.docs_path, "ab") as f:
+                f.write(b"".join(chunks))
+            with open(self.offsets_path, "ab") as f:
+                f.write(np.asarray(new_offsets, dtype="<i8").tobytes())
+            positions = list(range(start_position, start_position + len(documents)))
+            self._conn.executemany(
+                "INSERT INTO docs (position, doc_id, metadata) VALUES (?, ?, ?)",
+                [
+                    (
+                        position,
+                        doc_id,
+                        json.dumps(metadatas[i] if metadatas and metadatas[i] else {}, ensure_ascii=False),
+                    )
+                    for i, (position, doc_id) in enumerate(zip(positions, ids))
+                ],
+            )
+            self._conn.executemany(
+                "INSERT INTO postings (key, value, position) VALUES (?, ?, ?)",
+                [
+                    posting
+                    for i, position in enumerate(positions)
+                    for posting in _postings(position, metadatas[i] if metadatas else None)
+                ],
+            )
+            self._conn.commit()
+            self._filter_cache.clear()
+            self._offsets.extend(new_offsets)
+            if self._columns is not None:
+                self._columns.append(
+                    [metadatas[i] if metadatas else None for i in range(len(positions))]
+                )
+            return positions
+
+    def get_documents(self, positions: Iterable[int]) -> List[str]:
+        """Texts of the given positions."""
+        with self._lock:
+            return [self._text_at(self._offsets[p]) for p in positions]
+
+    def get_metadatas(self, positions: Sequence[int]) -> List[Dict[str, Any]]:
+        """Metadata dicts of the given positions, in order."""
+        with self._lock:
+            columns = self._metadata_columns()
+            return [columns.row(int(p)) for p in positions]
+
+    def ids(self) -> List[str]:
+        """Ids of live documents in position order."""
+        with self._lock:
+            return [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT doc_id FROM docs WHERE position NOT IN (SELECT position FROM tombstones) ORDER BY position"
+                )
+            ]
+
+    def positions_of(self, ids: Sequence[str]) -> Dict[str, int]:
+        """Map the given ids to their live positions (unknown and deleted ids are left out)."""
+        with self._lock:
+            found = {}
+            for i in range(0, len(ids), 500):
+                batch = list(ids[i : i + 500])
+                rows = self._conn.execute(
+                    f"SELECT doc_id, position FROM docs WHERE doc_id IN ({','.join('?' * len(batch))}) "
+                    "AND position NOT IN (SELECT position FROM tombstones) ORDER BY position",
+                    batch,
+                ).fetchall()
+                found.update(rows)
+            return found
+
+    def delete(self, positions: Sequence[int]) -> None:
+        """Tombstone positions; they disappear from ids, lookups and filters."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO tombstones (position) VALUES (?)", [(int(p),) for p in positions]
+            )
+            self._conn.executemany(
+                "DELETE FROM postings WHERE position = ?", [(int(p),) for p in positions]
+            )
+            self._conn.commit()
+            self._filter_cache.clear()
+            self._tombstones.update(int(p) for p in positions)
+
+    def update_metadatas(self, positions: Sequence[int], metadatas: Sequence[Dict[str, Any]]) -> None:
+        """Replace the metadata of existing positions."""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE docs SET metadata = ? WHERE position = ?",
+                [(json.dumps(m or {}, ensure_ascii=False), p) for p, m in zip(positions, metadatas)],
+            )
+            self._conn.executemany(
+                "DELETE FROM postings WHERE position = ?", [(p,) for p in positions]
+            )
+            self._conn.executemany(
+                "INSERT INTO postings (key, value, position) VALUES (?, ?, ?)",
+                [posting for p, m in zip(positions, metadatas) for posting in _postings(p, m)],
+            )
+            self._conn.commit()
+            self._filter_cache.clear()
+            if self._columns is not None:
+                for p, m in zip(positions, metadatas):
+                    self._columns.set(int(p), m)
+
+    def rewrite(self, keep: Sequence[int], replacements: Optional[Dict[str, str]] = None) -> None:
+        """
+        Compact the store down to the given positions, renumbering them
+        0..len(keep)-1 in the given order.
+
+        The live files are only replaced once the new store is complete, so an
+        interrupted rewrite leaves either the old or the new records.
+
+        Args:
+            keep: Positions to keep, in their new order
+            replacements: Other files to move into place together with the
+                store's, as {new file: live file}
+        """
+        with self._lock:
+            documents = self.get_documents(keep)
+            metadatas = self.get_metadatas(keep)
+            id_rows = dict(
+                self._conn.execute("SELECT position, doc_id FROM docs").fetchall()
+            )
+            ids = [id_rows[p] for p in keep]
+            rewrite_dir = os.path.join(self.directory, _REWRITE_DIR)
+            shutil.rmtree(rewrite_dir, ignore_errors=True)
+            staged = DocumentStore(rewrite_dir)
+            try:
+                if keep:
+                    staged.append(ids, documents, metadatas)
+            finally:
+                staged.close()
+            moves = {
+                os.path.join(rewrite_dir, name): os.path.join(self.directory, name)
+                for name in _STORE_FILES
+            }
+            moves.update(replacements or {})
+            self._close_mmap()
+            self._conn.close()
+            pending_path = os.path.join(self.directory, _PENDING_FILE)
+            try:
+                with open(pending_path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(moves, f)
+                # Committed from here on: an interrupted move is finished on open
+                os.replace(pending_path + ".tmp", pending_path)
+            except Exception:
+                self._connect()
+                raise
+            finish_pending_moves(self.directory)
+            shutil.rmtree(rewrite_dir, ignore_errors=True)
+            self._connect()
+
+    def filter_positions(self, where: Dict[str, Any]) -> np.ndarray:
+        """
+        Positions whose metadata equals every key/value of ``where``, from the
+        inverted index.
+
+        Args:
+            where: Equality filter, e.g. {"knowledge_id": 3}
+
+        Returns:
+            Sorted int64 array of matching positions
+        """
+        with self._lock:
+            matched: Optional[np.ndarray] = None
+            for key, value in where.items():
+                encoded = _posting_value(value)
+                if encoded is None:
+                    return np.zeros(0, dtype="int64")
+                cache_key = (key, encoded)
+                positions = self._filter_cache.get(cache_key)
+                if positions is None:
+                    rows = self._conn.execute(
+                        "SELECT position FROM postings WHERE key = ? AND value = ? ORDER BY position",
+                        cache_key,
+                    ).fetchall()
+                    positions = np.fromiter((row[0] for row in rows), dtype="int64", count=len(rows))
+                    self._filter_cache[cache_key] = positions
+                matched = (
+                    positions
+                    if matched is None
+                    else np.intersect1d(matched, positions, assume_unique=True)
+                )
+                if not len(matched):
+                    break
+            if matched is None:
+                return self.live_positions()
+            return matched
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_mmap()
+            self._conn.close()
@@ -4,11 +4,21 @@ Embedding module using OpenAI API for text embeddings.
 
 import asyncio
 import logging
-from typing import List, Optional
+import os
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Coroutine, Dict, List, Optional, Tuple
 from openai import AsyncOpenAI
 
 logger = logging.getLogger(__name__)
 
+# Inputs per embedding request and number of requests in flight
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 256))
+EMBEDDING_MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", 8))
+# Micro-batching of small concurrent requests (e.g. chat queries)
+EMBEDDING_BATCH_WINDOW_MS = float(os.environ.get("EMBEDDING_BATCH_WINDOW_MS", 5))
+EMBEDDING_MICRO_BATCH_SIZE = int(os.environ.get("EMBEDDING_MICRO_BATCH_SIZE", 64))
+
 
 class EmbeddingService:
     """
@@ -36,6 +46,9 @@ class EmbeddingService:
         self.model = model
         self.max_retries = max_retries
         self.timeout = timeout
+        self.batch_size = EMBEDDING_BATCH_SIZE
+        self.max_concurrency = EMBEDDING_MAX_CONCURRENCY
+        self._semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
 
         # Initialize the async OpenAI client
         self.client = AsyncOpenAI(
@@ -80,34 +93,47 @@ class EmbeddingService:
             logger.error(f"Error generating embeddings for texts: {e}")
             raise
 
+    def _semaphore(self) -> asyncio.Semaphore:
+        """Concurrency limit shared by all requests issued on the running loop."""
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[loop]
+
     async def embed_documents_batch(
-        self, documents: List[str], batch_size: int = 100
+        self, documents: List[str], batch_size: Optional[int] = None
     ) -> List[List[float]]:
         """
-        Generate embeddings for documents in batches to handle large datasets.
+        Generate embeddings for documents, split into provider-sized batches
+        that are requested in parallel (bounded by max_concurrency).
 
         Args:
             documents: List of documents to embed
-            batch_size: Number of documents to process in each batch
+            batch_size: Number of documents per request (defaults to EMBEDDING_BATCH_SIZE)
 
         Returns:
-            List of embedding vectors
+            List of embedding vectors, in input order
         """
-        all_embeddings = []
-
-        for i in range(0, len(documents), batch_size):
-            batch = documents[i : i + batch_size]
-            try:
-                batch_embeddings = await self.embed_texts(batch)
-                all_embeddings.extend(batch_embeddings)
-                logger.info(
-                    f"Processed batch {i//batch_size + 1}/{(len(documents) + batch_size - 1)//batch_size}"
-                )
-            except Exception as e:
-                logger.error(f"Error processing batch {i//batch_size + 1}: {e}")
-                raise
-
-        return all_embeddings
+        batch_size = batch_size or self.batch_size
+        if len(documents) <= batch_size:
+            async with self._semaphore():
+                return await self.embed_texts(documents) if documents else []
+
+        num_batches = (len(documents) + batch_size - 1) // batch_size
+
+        async def _embed_batch(batch_idx: int) -> List[List[float]]:
+            batch = documents[batch_idx * batch_size : (batch_idx + 1) * batch_size]
+            async with self._semaphore():
+                try:
+                    batch_embeddings = await self.embed_texts(batch)
+                except Exception as e:
+                    logger.error(f"Error processing batch {batch_idx + 1}: {e}")
+                    raise
+            logger.info(f"Processed batch {batch_idx + 1}/{num_batches}")
+            return batch_embeddings
+
+        results = await asyncio.gather(*(_embed_batch(i) for i in range(num_batches)))
+        return [embedding for batch in results for embedding in batch]
 
     async def get_embedding_dimension(self) -> int:
         """
@@ -143,6 +169,122 @@ class EmbeddingService:
         await self.close()
 
 
+class EmbeddingMicroBatcher:
+    """
+    Coalesces embedding requests that arrive within a short window into one
+    provider call; each caller gets back only its own vectors.
+
+    Not thread-safe: all calls must come from the same event loop.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Awaitable[List[List[float]]]],
+        window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+        max_batch: int = EMBEDDING_MICRO_BATCH_SIZE,
+    ):
+        """
+        Initialize the batcher.
+
+        Args:
+            embed_fn: Coroutine function embedding a list of texts
+            window_ms: How long to wait for more requests before flushing
+            max_batch: Flush immediately once this many texts are pending
+        """
+        self.embed_fn = embed_fn
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: List[Tuple[List[str], asyncio.Future]] = []
+        self._pending_count = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()  # keep references to in-flight batches
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Queue texts for the next batch and wait for their embeddings.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Embedding vectors for texts, in order
+        """
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((list(texts), future))
+        self._pending_count += len(texts)
+        if self._pending_count >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending, self._pending_count = self._pending, [], 0
+        if pending:
+            task = asyncio.ensure_future(self._run_batch(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, pending: List[Tuple[List[str], asyncio.Future]]):
+        # Identical texts from different callers are embedded once
+        unique_texts = list(dict.fromkeys(t for texts, _ in pending for t in texts))
+        # Every failure must reach the callers: they wait on their futures only
+        try:
+            vectors = await self.embed_fn(unique_texts)
+            if len(vectors) != len(unique_texts):
+                raise ValueError(
+                    f"Embedding provider returned {len(vectors)} vectors for {len(unique_texts)} texts"
+                )
+            embeddings = dict(zip(unique_texts, vectors))
+            logger.debug(f"Micro-batch embedded {len(unique_texts)} texts for {len(pending)} requests")
+            for texts, future in pending:
+                if not future.done():
+                    future.set_result([embeddings[t] for t in texts])
+        except asyncio.CancelledError:
+            for _, future in pending:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+
+
+class _BackgroundLoop:
+    """
+    A single event loop running in a daemon thread. Synchronous callers
+    (ChromaDB invokes embedding functions from worker threads) submit
+    coroutines to it instead of spinning up nested loops per thread, and
+    the async client keeps one connection pool on one loop.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="embedding-loop", daemon=True
+                ).start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro: Coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+
+
+_embedding_loop = _BackgroundLoop()
+
+
 class ChromaEmbeddingFunction:
     """
     Custom embedding function for ChromaDB that uses OpenAI API.
@@ -165,6 +307,15 @@ class ChromaEmbeddingFunction:
         self.embedding_service = EmbeddingService(
             api_key=api_key, model=model, base_url=base_url
         )
+        self.batcher = EmbeddingMicroBatcher(
+            lambda texts: self.embedding_service.embed_documents_batch(texts)
+        )
+
+    async def _embed(self, input: List[str]) -> List[List[float]]:
+        # Small requests (chat queries) are coalesced; bulk ingestion goes straight out
+        if len(input) < self.batcher.max_batch:
+            return await self.batcher.embed(input)
+        return await self.embedding_service.embed_documents_batch(input)
 
     def __call__(self, input: List[str]) -> List[List[float]]:
         """
@@ -176,14 +327,19 @@ class ChromaEmbeddingFunction:
         Returns:
             List of embedding vectors
         """
-        # Run the async function in a new event loop
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+        return _embedding_loop.submit(self._embed(input)).result()
+
+    async def aembed(self, input: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings without blocking the calling event loop.
 
-        return loop.run_until_complete(self.embedding_service.embed_texts(input))
+        Args:
+            input: List of texts to embed
+
+        Returns:
+            List of embedding vectors
+        """
+        return await asyncio.wrap_future(_embedding_loop.submit(self._embed(input)))
 
 
 # Convenience functions
@@ -0,0 +1,193 @@
+"""
+Exact entity-name index of structured (per-entity JSON) knowledge.
+
+Knowledge files such as terrariawiki_weapons.json or gok_hero.json map entity
+names to their data; after JsonToMarkdownConverter every entity is a level-1
+heading and MarkdownProcessor repeats that heading in front of each chunk it
+splits off. The index maps each name, plus its aliases (without a trailing
+qualifier like "(射手)" or "（敌怪）") and traditional Chinese spellings, to the
+ids of the chunks under that heading, so a question naming an entity reaches
+its chunks with hash lookups instead of a vector search.
+
+One JSON file per collection under RAG_ENTITY_INDEX_PATH.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+import opencc
+
+logger = logging.getLogger(__name__)
+
+ENTITY_INDEX_PATH = os.environ.get("RAG_ENTITY_INDEX_PATH", "./data/entities")
+# Shorter names are not indexed: single characters match inside ordinary words
+MIN_ENTITY_LENGTH = 2
+
+_HEADING = re.compile(r"^# (.+)$", re.MULTILINE)
+_QUALIFIER = re.compile(r"\s*\([^()]*\)$")
+
+_s2t = opencc.OpenCC("s2t.json")
+
+
+def normalize_name(text: str) -> str:
+    """NFKC-normalize (full-width brackets become ASCII) and lowercase text for matching."""
+    return unicodedata.normalize("NFKC", text).strip().lower()
+
+
+def entity_aliases(name: str) -> Set[str]:
+    """
+    Names under which an entity is indexed: the normalized name, the name
+    without a trailing parenthesized qualifier, and their traditional spellings.
+    """
+    base = normalize_name(name)
+    names = {base, _QUALIFIER.sub("", base)}
+    names |= {normalize_name(_s2t.convert(n)) for n in names}
+    return {n for n in names if len(n) >= MIN_ENTITY_LENGTH}
+
+
+def extract_entities(chunks: Dict[str, str]) -> Dict[str, List[str]]:
+    """
+    Map the level-1 headings of chunks (entity names of per-entity JSON
+    knowledge) to the ids of the chunks containing them.
+
+    Args:
+        chunks: Chunk id -> chunk text
+
+    Returns:
+        Entity name -> chunk ids, in chunk order
+    """
+    entities: Dict[str, List[str]] = {}
+    for chunk_id, text in chunks.items():
+        for name in dict.fromkeys(_HEADING.findall(text)):
+            entities.setdefault(name.strip(), []).append(chunk_id)
+    return entities
+
+
+class EntityIndex:
+    """Entity-name indexes of all collections under one directory."""
+
+    def __init__(self, persist_directory: Optional[str] = None):
+        """
+        Initialize the entity index.
+
+        Args:
+            persist_directory: Directory of the per-collection index files,
+                defaults to RAG_ENTITY_INDEX_PATH
+        """
+        self.persist_directory = persist_directory or ENTITY_INDEX_PATH
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # collection -> (alias -> chunk ids, longest alias length)
+        self._indexes: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    async def initialize(self):
+        """Ensure the persist directory exists."""
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            self.executor, lambda: os.makedirs(self.persist_directory, exist_ok=True)
+        )
+
+    def _index_path(self, collection_name: str) -> str:
+        return os.path.join(self.persist_directory, f"{collection_name}.json")
+
+    def _load(self, collection_name: str) -> Optional[tuple]:
+        with self._lock:
+            if collection_name not in self._indexes:
+                path = self._index_path(collection_name)
+                if not os.path.exists(path):
+                    return None
+                with open(path, "r", encoding="utf-8") as f:
+                    aliases = json.load(f)
+                self._indexes[collection_name] = (aliases, max(map(len, aliases), default=0))
+            return self._indexes[collection_name]
+
+    async def build_collection(self, collection_name: str, entities: Dict[str, List[str]]) -> int:
+        """
+        Replace the index of a collection.
+
+        Args:
+            collection_name: Name of the collection
+            entities: Entity name -> chunk ids, e.g. from extract_entities
+
+        Returns:
+            Number of indexed names, aliases included
+        """
+        aliases: Dict[str, List[str]] = {}
+        for name, chunk_ids in entities.items():
+            for alias in entity_aliases(name):
+                ids = aliases.setdefault(alias, [])
+                ids.extend(i for i in chunk_ids if i not in ids)
+
+        def _write_sync():
+            os.makedirs(self.persist_directory, exist_ok=True)
+            path = self._index_path(collection_name)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(aliases, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+            with self._lock:
+                self._indexes[collection_name] = (aliases, max(map(len, aliases), default=0))
+
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.executor, _write_sync)
+        logger.info(f"Indexed {len(entities)} entities ({len(aliases)} names) of '{collection_name}'")
+        return len(aliases)
+
+    async def delete_collection(self, collection_name: str) -> bool:
+        def _delete_sync():
+            with self._lock:
+                self._indexes.pop(collection_name, None)
+            path = self._index_path(collection_name)
+            if not os.path.exists(path):
+                return False
+            os.remove(path)
+            return True
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, _delete_sync)
+
+    def match(self, collection_name: str, text: str) -> List[str]:
+        """
+        Chunk ids of the entities mentioned in a text. The text is scanned
+        left to right taking the longest known name at each position, so
+        "剧毒瓶" is not also read as "毒瓶".
+
+        Args:
+            collection_name: Name of the collection
+            text: Text to scan, e.g. the rewritten question
+
+        Returns:
+            Chunk ids in order of first mention, empty if none
+        """
+        loaded = self._load(collection_name)
+        if not loaded or not loaded[0]:
+            return []
+        aliases, longest = loaded
+        text = normalize_name(text)
+        found: Dict[str, None] = {}
+        i = 0
+        while i < len(text):
+            for length in range(min(longest, len(text) - i), MIN_ENTITY_LENGTH - 1, -1):
+                chunk_ids = aliases.get(text[i : i + length])
+                if chunk_ids:
+                    found.update(dict.fromkeys(chunk_ids))
+                    i += length
+                    break
+            else:
+                i += 1
+        return list(found)
+
+    async def lookup(self, collection_name: str, text: str) -> List[str]:
+        """Async form of match(); the index file is read off the event loop on first use."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self.match, collection_name, text)
+
+    def __del__(self):
+        if hasattr(self, "executor") and self.executor:
+            self.executor.shutdown(wait=False)
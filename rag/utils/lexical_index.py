@@ -0,0 +1,342 @@
+"""
+BM25 lexical index kept next to the vector collections.
+
+Dense retrieval tends to rank chunks that name an exact entity ("毒瓶", a
+hero name) below vaguer paraphrases. Each collection therefore also gets a
+BM25 index over character bigrams of its Chinese text (and whole words of
+Latin text), queried alongside the dense search; the two rankings are merged
+with reciprocal-rank fusion.
+
+One SQLite file per collection under RAG_LEXICAL_INDEX_PATH holds the chunk
+texts, their token counts and the term postings.
+"""
+
+import asyncio
+import heapq
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_PATH = os.environ.get("RAG_LEXICAL_INDEX_PATH", "./data/lexical")
+# Rank offset of reciprocal-rank fusion; larger values flatten the head of each ranking
+RRF_K = int(os.environ.get("RAG_RRF_K", 60))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_WORD = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into BM25 terms: overlapping character bigrams of CJK runs
+    (single characters stay unigrams) and lowercase words of everything else.
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        Terms in text order, repeated as often as they occur
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    terms: List[str] = []
+    last = 0
+    for match in _CJK_RUN.finditer(text):
+        terms.extend(_WORD.findall(text[last : match.start()]))
+        run = match.group()
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i : i + 2] for i in range(len(run) - 1))
+        last = match.end()
+    terms.extend(_WORD.findall(text[last:]))
+    return terms
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]], k: int = RRF_K
+) -> List[Tuple[str, float]]:
+    """
+    Merge rankings with reciprocal-rank fusion: an item scores
+    sum(1 / (k + rank)) over the rankings it appears in (rank from 1).
+
+    Args:
+        rankings: Ranked item keys, best first
+        k: Rank offset
+
+    Returns:
+        (key, fused score) pairs, best first
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """BM25 index of one collection, stored in a single SQLite file."""
+
+    def __init__(self, path: str):
+        """
+        Open (or create) an index.
+
+        Args:
+            path: SQLite file of the index
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs (doc_id TEXT PRIMARY KEY, text TEXT NOT NULL, length INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, doc_id TEXT NOT NULL, tf INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_postings_term ON postings (term)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_postings_doc_id ON postings (doc_id)")
+        self._conn.commit()
+        # (document count, average length), recomputed after writes
+        self._stats: Optional[Tuple[int, float]] = None
+
+    def __len__(self) -> int:
+        return self._collection_stats()[0]
+
+    def _collection_stats(self) -> Tuple[int, float]:
+        with self._lock:
+            if self._stats is None:
+                count, total = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs"
+                ).fetchone()
+                self._stats = (count, total / count if count else 0.0)
+            return self._stats
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT doc_id FROM docs")]
+
+    def _delete_locked(self, ids: Sequence[str]) -> None:
+        rows = [(doc_id,) for doc_id in ids]
+        self._conn.executemany("DELETE FROM postings WHERE doc_id = ?", rows)
+        self._conn.executemany("DELETE FROM docs WHERE doc_id = ?", rows)
+
+    def add(self, ids: Sequence[str], documents: Sequence[str]) -> None:
+        """
+        Index documents, replacing those whose ids are already indexed.
+
+        Args:
+            ids: Document ids
+            documents: Document texts
+        """
+        with self._lock:
+            self._delete_locked(ids)
+            doc_rows = []
+            posting_rows = []
+            for doc_id, text in zip(ids, documents):
+                counts = Counter(tokenize(text))
+                doc_rows.append((doc_id, text, sum(counts.values())))
+                posting_rows.extend((term, doc_id, tf) for term, tf in counts.items())
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO docs (doc_id, text, length) VALUES (?, ?, ?)", doc_rows
+            )
+            self._conn.executemany(
+                "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)", posting_rows
+            )
+            self._conn.commit()
+            self._stats = None
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            self._delete_locked(ids)
+            self._conn.commit()
+            self._stats = None
+
+    def sync(self, ids: Sequence[str], documents: Sequence[str]) -> Tuple[int, int]:
+        """
+        Make the index hold exactly the given documents, touching only the
+        ids that were added or removed.
+
+        Returns:
+            (added, removed) document counts
+        """
+        with self._lock:
+            existing = set(self.ids())
+            wanted = dict(zip(ids, documents))
+            removed = [doc_id for doc_id in existing if doc_id not in wanted]
+            added = [doc_id for doc_id in wanted if doc_id not in existing]
+            if removed:
+                self.delete(removed)
+            if added:
+                self.add(added, [wanted[doc_id] for doc_id in added])
+            return len(added), len(removed)
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, str, float]]:
+        """
+        Rank documents by BM25 against the query.
+
+        Args:
+            query: Query text
+            k: Number of results
+
+        Returns:
+            (doc_id, text, score) tuples, best first
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            count, average_length = self._collection_stats()
+            if not terms or not count or k <= 0:
+                return []
+            scores: Dict[str, float] = {}
+            for term in terms:
+                rows = self._conn.execute(
+                    "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.doc_id = p.doc_id WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+                for doc_id, tf, length in rows:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (average_length or 1))
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            if not top:
+                return []
+            texts = dict(
+                self._conn.execute(
+                    f"SELECT doc_id, text FROM docs WHERE doc_id IN ({','.join('?' * len(top))})",
+                    [doc_id for doc_id, _ in top],
+                ).fetchall()
+            )
+            return [(doc_id, texts[doc_id], score) for doc_id, score in top]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LexicalIndex:
+    """
+    BM25 indexes of all collections under one directory, with the async
+    interface style of the vector databases.
+    """
+
+    def __init__(self, persist_directory: Optional[str] = None):
+        """
+        Initialize the lexical index.
+
+        Args:
+            persist_directory: Directory of the per-collection index files,
+                defaults to RAG_LEXICAL_INDEX_PATH
+        """
+        self.persist_directory = persist_directory or LEXICAL_INDEX_PATH
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self._indexes: Dict[str, BM25Index] = {}
+        self._lock = threading.Lock()
+
+    async def initialize(self):
+        """Ensure the persist directory exists."""
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            self.executor, lambda: os.makedirs(self.persist_directory, exist_ok=True)
+        )
+
+    def _index_path(self, collection_name: str) -> str:
+        return os.path.join(self.persist_directory, f"{collection_name}.sqlite")
+
+    def _get_index(self, collection_name: str, create: bool) -> Optional[BM25Index]:
+        with self._lock:
+            index = self._indexes.get(collection_name)
+            if index is None:
+                if not create and not os.path.exists(self._index_path(collection_name)):
+                    return None
+                os.makedirs(self.persist_directory, exist_ok=True)
+                index = self._indexes[collection_name] = BM25Index(self._index_path(collection_name))
+            return index
+
+    def has_collection(self, collection_name: str) -> bool:
+        return collection_name in self._indexes or os.path.exists(self._index_path(collection_name))
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def add_documents(self, collection_name: str, documents: List[str], ids: List[str]) -> None:
+        """
+        Index documents of a collection, replacing those whose ids are already indexed.
+
+        Args:
+            collection_name: Name of the collection
+            documents: Document texts
+            ids: Document ids, the same as in the vector database
+        """
+        if documents:
+            await self._run(lambda: self._get_index(collection_name, True).add(ids, documents))
+
+    async def delete_documents(self, collection_name: str, ids: List[str]) -> None:
+        index = self._get_index(collection_name, False)
+        if index is not None and ids:
+            await self._run(index.delete, ids)
+
+    async def sync_collection(
+        self, collection_name: str, documents: List[str], ids: List[str]
+    ) -> Tuple[int, int]:
+        """
+        Make a collection's index hold exactly the given documents. Only
+        added and removed ids are (re)indexed, so this also fills in the
+        index of a collection ingested before it existed.
+
+        Returns:
+            (added, removed) document counts
+        """
+        return await self._run(
+            lambda: self._get_index(collection_name, True).sync(ids, documents)
+        )
+
+    async def delete_collection(self, collection_name: str) -> bool:
+        def _delete_sync():
+            with self._lock:
+                index = self._indexes.pop(collection_name, None)
+                if index is not None:
+                    index.close()
+                path = self._index_path(collection_name)
+                if not os.path.exists(path):
+                    return False
+                os.remove(path)
+                return True
+
+        return await self._run(_delete_sync)
+
+    async def search_documents(
+        self, collection_name: str, query_text: str, k: int = 5
+    ) -> List[Tuple[str, float]]:
+        """
+        Search a collection by BM25.
+
+        Args:
+            collection_name: Name of the collection
+            query_text: Query text
+            k: Number of results
+
+        Returns:
+            List of tuples (document_text, bm25_score), empty if the
+            collection has no lexical index
+        """
+        index = self._get_index(collection_name, False)
+        if index is None:
+            return []
+        hits = await self._run(index.search, query_text, k)
+        return [(text, score) for _doc_id, text, score in hits]
+
+    def __del__(self):
+        if hasattr(self, "executor") and self.executor:
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,206 @@
+"""
+Process-wide query embedding cache shared by all VectorDatabase instances.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import pickle
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+QUERY_CACHE_SIZE = int(os.environ.get("RAG_QUERY_CACHE_SIZE", 4096))
+QUERY_CACHE_TTL = float(os.environ.get("RAG_QUERY_CACHE_TTL", 24 * 3600))  # 0 disables expiry
+QUERY_CACHE_PATH = os.environ.get("RAG_QUERY_CACHE_PATH")  # unset disables persistence
+
+
+def normalize_query(text: str) -> str:
+    """Normalize full/half width forms and whitespace so trivially different queries share a key."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def embedding_model_name(embedding_function) -> str:
+    """Best-effort model identifier of a Chroma-style embedding function."""
+    service = getattr(embedding_function, "embedding_service", None)
+    model = getattr(service, "model", None) or getattr(embedding_function, "model", None)
+    return str(model or type(embedding_function).__name__)
+
+
+class QueryEmbeddingCache:
+    """
+    Thread-safe LRU cache of query embeddings with TTL, keyed by (model, normalized text).
+    """
+
+    def __init__(
+        self,
+        capacity: int = QUERY_CACHE_SIZE,
+        ttl: float = QUERY_CACHE_TTL,
+        persist_path: Optional[str] = None,
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            capacity: Maximum number of cached embeddings
+            ttl: Seconds an entry stays valid, 0 for no expiry
+            persist_path: Optional file to load from and save() to
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[List[float], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if persist_path:
+            self.load()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl > 0 and now - created > self.ttl
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """
+        Look up an embedding.
+
+        Args:
+            model: Embedding model name
+            text: Query text
+
+        Returns:
+            The cached embedding or None
+        """
+        key = (model, normalize_query(text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1], time.time()):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, model: str, text: str, embedding: List[float]) -> None:
+        """
+        Store an embedding, evicting the least recently used entries if full.
+
+        Args:
+            model: Embedding model name
+            text: Query text
+            embedding: Embedding vector
+        """
+        key = (model, normalize_query(text))
+        with self._lock:
+            self._entries[key] = (list(embedding), time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def save(self) -> None:
+        """Persist unexpired entries to persist_path."""
+        if not self.persist_path:
+            return
+        now = time.time()
+        with self._lock:
+            entries = [(k, v) for k, v in self._entries.items() if not self._expired(v[1], now)]
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+            tmp_path = self.persist_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(entries, f)
+            os.replace(tmp_path, self.persist_path)
+            logger.info(f"Saved {len(entries)} query embeddings to {self.persist_path}")
+        except Exception as e:
+            logger.error(f"Error saving query embedding cache: {e}")
+
+    def load(self) -> None:
+        """Load entries previously written by save()."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "rb") as f:
+                entries = pickle.load(f)
+        except Exception as e:
+            logger.error(f"Error loading query embedding cache: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for key, value in entries[-self.capacity:]:
+                if not self._expired(value[1], now):
+                    self._entries[key] = value
+        logger.info(f"Loaded {len(self._entries)} query embeddings from {self.persist_path}")
+
+
+query_embedding_cache = QueryEmbeddingCache(persist_path=QUERY_CACHE_PATH)
+if QUERY_CACHE_PATH:
+    atexit.register(query_embedding_cache.save)
+
+
+async def embed_queries_cached(embedding_function, texts: List[str], executor=None) -> List[List[float]]:
+    """
+    Embed queries through the shared cache; all misses go out in a single
+    embedding request.
+
+    Args:
+        embedding_function: Chroma-style callable taking a list of texts
+        texts: Query texts
+        executor: Executor used to run the embedding call when the function
+            has no async ``aembed``
+
+    Returns:
+        One embedding per input text, in order
+    """
+    model_name = embedding_model_name(embedding_function)
+    embeddings = [query_embedding_cache.get(model_name, text) for text in texts]
+    missing = list(dict.fromkeys(text for text, emb in zip(texts, embeddings) if emb is None))
+    if not missing:
+        return embeddings
+
+    logger.debug(f"Query cache miss for {len(missing)} of {len(texts)} queries. Computing embeddings.")
+    if not embedding_function:
+        raise ValueError("Embedding function is not initialized.")
+
+    if hasattr(embedding_function, "aembed"):
+        computed = await embedding_function.aembed(missing)
+    else:
+        loop = asyncio.get_event_loop()
+        computed = await loop.run_in_executor(executor, embedding_function, missing)
+    if (
+        not isinstance(computed, list)
+        or len(computed) != len(missing)
+        or not all(isinstance(emb, list) for emb in computed)
+    ):
+        raise ValueError(f"Embedding function returned invalid result for: {missing}")
+
+    fresh = dict(zip(missing, computed))
+    for text, emb in fresh.items():
+        query_embedding_cache.put(model_name, text, emb)
+    return [emb if emb is not None else fresh[text] for text, emb in zip(texts, embeddings)]
@@ -0,0 +1,204 @@
+"""
+Rerankers reordering retrieved documents before answer generation.
+
+Retrieval returns a candidate pool (fused dense/BM25 results or exact entity
+hits); a reranker reorders it against the question and the best top_k are
+passed to the LLM. Available rerankers (RAG_RERANKER):
+
+- "lexical": local CPU scoring of query/document term interaction, no model calls
+- "llm": one listwise LLM call ranking all candidates at once
+- "none": keep the retrieval order
+
+Reranking is skipped when the dense similarities already separate the best
+candidate from the rest by at least RAG_RERANK_SKIP_MARGIN (see is_decisive).
+"""
+
+import logging
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from rag.utils.lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+RERANKER = os.environ.get("RAG_RERANKER", "lexical")
+# Similarity lead of the best candidate over the runner-up above which reranking is skipped
+RERANK_SKIP_MARGIN = float(os.environ.get("RAG_RERANK_SKIP_MARGIN", 0.1))
+# Weight of the retrieval rank in the lexical reranker's score, the rest is term coverage
+LEXICAL_RANK_WEIGHT = 0.3
+# Characters of each passage shown to the listwise LLM reranker
+LISTWISE_PASSAGE_CHARS = 500
+
+LISTWISE_RERANK_PROMPT = """请根据与问题的相关程度，对下面的文档从高到低排序。
+
+问题：
+{query}
+
+文档：
+{passages}
+
+只输出文档编号，按相关程度从高到低用 > 连接，例如：3 > 1 > 2
+排序："""
+
+
+def is_decisive(documents: List[Dict[str, Any]], margin: float = RERANK_SKIP_MARGIN) -> bool:
+    """
+    Whether the retrieval order can be kept without reranking: there is at
+    most one candidate, or the first candidate has the highest dense
+    similarity and leads every other candidate by at least margin.
+
+    Args:
+        documents: Candidates in retrieval order, with "similarity" (None for
+            keyword-only hits, which are never decisive)
+        margin: Required similarity lead
+
+    Returns:
+        True if reranking can be skipped
+    """
+    if len(documents) < 2:
+        return True
+    similarities = [doc.get("similarity") for doc in documents]
+    if any(similarity is None for similarity in similarities):
+        return False
+    return similarities[0] - max(similarities[1:]) >= margin
+
+
+class Reranker:
+    """Base reranker, keeping the retrieval order."""
+
+    name = "none"
+
+    async def rerank(self, query: str, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Reorder documents by relevance to the query.
+
+        Args:
+            query: Question the documents were retrieved for
+            documents: Candidates in retrieval order, each with "content"
+
+        Returns:
+            The same document dicts, most relevant first, each with a "score"
+            set by the reranker
+        """
+        return documents
+
+
+class LexicalReranker(Reranker):
+    """
+    Local reranker scoring each candidate by the share of the question's
+    terms it contains, weighted by their rarity among the candidates, blended
+    with its retrieval rank. Cheap enough to run on every request.
+    """
+
+    name = "lexical"
+
+    def __init__(self, rank_weight: float = LEXICAL_RANK_WEIGHT):
+        """
+        Args:
+            rank_weight: Weight of the retrieval rank, between 0 and 1
+        """
+        self.rank_weight = rank_weight
+
+    def score(self, query: str, documents: List[Dict[str, Any]]) -> List[float]:
+        """Scores of documents in their given order."""
+        query_terms = set(tokenize(query))
+        document_terms = [set(tokenize(doc["content"])) & query_terms for doc in documents]
+        n = len(documents)
+        # Terms no candidate contains cannot separate them and are left out
+        document_frequency = Counter(t for terms in document_terms for t in terms)
+        idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+        total = sum(idf.values())
+        scores = []
+        for rank, terms in enumerate(document_terms):
+            coverage = sum(idf[t] for t in terms) / total if total else 0.0
+            scores.append((1 - self.rank_weight) * coverage + self.rank_weight * (1 - rank / n))
+        return scores
+
+    async def rerank(self, query: str, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        for doc, score in zip(documents, self.score(query, documents)):
+            doc["score"] = score
+        # sorted() is stable, ties keep the retrieval order
+        return sorted(documents, key=lambda doc: doc["score"], reverse=True)
+
+
+class ListwiseLLMReranker(Reranker):
+    """
+    Reranker asking the LLM once for an ordering of all candidates. Falls
+    back to the retrieval order if the call fails; candidates the answer
+    leaves out follow the ranked ones in retrieval order.
+    """
+
+    name = "llm"
+
+    def __init__(self, llm_service, passage_chars: int = LISTWISE_PASSAGE_CHARS):
+        """
+        Args:
+            llm_service: LLMService used for the ranking call
+            passage_chars: Characters of each passage included in the prompt
+        """
+        self.llm_service = llm_service
+        self.passage_chars = passage_chars
+
+    @staticmethod
+    def parse_ranking(response: str, count: int) -> List[int]:
+        """
+        Zero-based candidate positions from a response like "3 > 1 > 2".
+        Unknown and repeated numbers are ignored, missing candidates appended.
+        """
+        order: Dict[int, None] = {}
+        for number in re.findall(r"\d+", response):
+            position = int(number) - 1
+            if 0 <= position < count:
+                order.setdefault(position, None)
+        order.update(dict.fromkeys(range(count)))
+        return list(order)
+
+    async def rerank(self, query: str, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        passages = "\n\n".join(
+            f"[{i}] {doc['content'][: self.passage_chars]}" for i, doc in enumerate(documents, start=1)
+        )
+        try:
+            response = await self.llm_service.generate_response(
+                LISTWISE_RERANK_PROMPT.format(query=query, passages=passages)
+            )
+        except Exception as e:
+            logger.error(f"Listwise rerank failed, keeping retrieval order: {e}")
+            response = ""
+        ranking = self.parse_ranking(response, len(documents))
+        for rank, position in enumerate(ranking):
+            documents[position]["score"] = float(len(documents) - rank)
+        return [documents[position] for position in ranking]
+
+
+RERANKERS = {
+    "none": Reranker,
+    "lexical": LexicalReranker,
+    "llm": ListwiseLLMReranker,
+}
+
+
+def create_reranker(name: Optional[str] = None, llm_service=None) -> Reranker:
+    """
+    Instantiate a reranker.
+
+    Args:
+        name: Reranker name, defaults to RAG_RERANKER
+        llm_service: LLMService, required by the "llm" reranker
+
+    Returns:
+        Reranker instance
+    """
+    name = (name or RERANKER).lower()
+    if name not in RERANKERS:
+        raise ValueError(f"Unknown reranker '{name}'. Available: {', '.join(RERANKERS)}")
+    if name == "llm":
+        if llm_service is None:
+            raise ValueError("The llm reranker needs an llm_service")
+        return ListwiseLLMReranker(llm_service)
+    return RERANKERS[name]()
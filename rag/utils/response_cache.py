@@ -0,0 +1,258 @@
+"""
+Process-wide semantic cache of final assistant answers.
+
+Answers are keyed by the embedding of the rewritten (context-resolved)
+question within a scope (an assistant's knowledge bases and model). A lookup
+hits when a cached question of the same scope is similar enough, the entry
+has not expired and none of the knowledge bases it was answered from has been
+re-indexed since its documents were retrieved (see versions and
+invalidate_collection).
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_SIZE = int(os.environ.get("RAG_RESPONSE_CACHE_SIZE", 2048))
+RESPONSE_CACHE_TTL = float(os.environ.get("RAG_RESPONSE_CACHE_TTL", 6 * 3600))  # 0 disables expiry
+# Minimum cosine similarity between the rewritten questions of a hit
+RESPONSE_CACHE_THRESHOLD = float(os.environ.get("RAG_RESPONSE_CACHE_THRESHOLD", 0.95))
+
+
+class _Entry:
+    __slots__ = ("question", "embedding", "answer", "documents", "versions", "created")
+
+    def __init__(self, question, embedding, answer, documents, versions, created):
+        self.question = question
+        self.embedding = embedding
+        self.answer = answer
+        self.documents = documents
+        self.versions = versions
+        self.created = created
+
+
+class _Scope:
+    """Entries of one scope with their embeddings as rows of one matrix."""
+
+    __slots__ = ("entries", "ids", "rows", "matrix")
+
+    def __init__(self, dimension: int):
+        self.entries: Dict[int, _Entry] = {}
+        self.ids: List[int] = []  # entry id of each matrix row
+        self.rows: Dict[int, int] = {}  # entry id -> matrix row
+        self.matrix = np.empty((8, dimension), dtype="float32")
+
+    @property
+    def dimension(self) -> int:
+        return self.matrix.shape[1]
+
+    def add(self, entry_id: int, entry: _Entry) -> None:
+        row = len(self.ids)
+        if row == len(self.matrix):
+            grown = np.empty((2 * row, self.dimension), dtype="float32")
+            grown[:row] = self.matrix
+            self.matrix = grown
+        self.matrix[row] = entry.embedding
+        self.ids.append(entry_id)
+        self.rows[entry_id] = row
+        self.entries[entry_id] = entry
+
+    def remove(self, entry_id: int) -> None:
+        """Remove an entry, moving the last row into its place."""
+        row = self.rows.pop(entry_id)
+        del self.entries[entry_id]
+        last = len(self.ids) - 1
+        if row != last:
+            moved = self.ids[last]
+            self.matrix[row] = self.matrix[last]
+            self.ids[row] = moved
+            self.rows[moved] = row
+        self.ids.pop()
+
+    def similarities(self, query: np.ndarray) -> np.ndarray:
+        return self.matrix[: len(self.ids)] @ query
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of answers with similarity lookup, TTL and
+    per-collection version invalidation.
+    """
+
+    def __init__(
+        self,
+        capacity: int = RESPONSE_CACHE_SIZE,
+        ttl: float = RESPONSE_CACHE_TTL,
+        threshold: float = RESPONSE_CACHE_THRESHOLD,
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            capacity: Maximum number of cached answers over all scopes
+            ttl: Seconds an answer stays valid, 0 for no expiry
+            threshold: Minimum cosine similarity of a hit
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.threshold = threshold
+        # _order keeps (scope, entry id) of all entries in LRU order
+        self._scopes: Dict[str, _Scope] = {}
+        self._order: "OrderedDict[Tuple[str, int], None]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl > 0 and now - entry.created > self.ttl
+
+    def _stale(self, entry: _Entry) -> bool:
+        return any(self._versions.get(name, 0) != version for name, version in entry.versions.items())
+
+    def _remove(self, scope: str, entry_id: int) -> None:
+        entries = self._scopes.get(scope)
+        if entries is not None and entry_id in entries.rows:
+            entries.remove(entry_id)
+            if not entries.ids:
+                del self._scopes[scope]
+        self._order.pop((scope, entry_id), None)
+
+    def versions(self, collections: Sequence[str]) -> Dict[str, int]:
+        """
+        Current versions of collections. Take them before retrieving the
+        documents an answer is based on and pass them to put(), so a
+        re-index during retrieval or generation leaves that answer stale.
+        """
+        with self._lock:
+            return {name: self._versions.get(name, 0) for name in collections}
+
+    @staticmethod
+    def _normalized(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype="float32")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(
+        self, scope: str, embedding: Sequence[float]
+    ) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Look up the answer of the most similar cached question.
+
+        Args:
+            scope: Cache scope, e.g. the assistant's model and knowledge bases
+            embedding: Embedding of the rewritten question
+
+        Returns:
+            (answer, documents) of the hit, or None
+        """
+        query = self._normalized(embedding)
+        now = time.time()
+        with self._lock:
+            entries = self._scopes.get(scope)
+            hit = None
+            if entries is not None and entries.dimension == len(query):
+                similarities = entries.similarities(query)
+                candidates = np.flatnonzero(similarities >= self.threshold)
+                # Only entries similar enough to hit are checked for expiry and
+                # staleness; the others leave through LRU eviction
+                invalid = []
+                for row in candidates[np.argsort(-similarities[candidates])]:
+                    entry_id = entries.ids[row]
+                    entry = entries.entries[entry_id]
+                    if self._expired(entry, now) or self._stale(entry):
+                        invalid.append(entry_id)
+                        continue
+                    hit = entry
+                    self._order.move_to_end((scope, entry_id))
+                    logger.info(
+                        f"Response cache hit ({float(similarities[row]):.3f}) for cached question: {entry.question}"
+                    )
+                    break
+                for entry_id in invalid:
+                    self._remove(scope, entry_id)
+            if hit is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return hit.answer, [dict(doc) for doc in hit.documents]
+
+    def put(
+        self,
+        scope: str,
+        versions: Dict[str, int],
+        question: str,
+        embedding: Sequence[float],
+        answer: str,
+        documents: List[Dict[str, Any]],
+    ) -> None:
+        """
+        Store an answer, evicting the least recently used entries if full.
+
+        Args:
+            scope: Cache scope
+            versions: versions() of the knowledge bases the answer was
+                retrieved from, taken before retrieval
+            question: Rewritten question
+            embedding: Embedding of the rewritten question
+            answer: Final answer
+            documents: Retrieved documents returned with the answer
+        """
+        vector = self._normalized(embedding)
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if entries is not None and entries.dimension != len(vector):
+                # The embedding model changed, older entries cannot match
+                for entry_id in list(entries.ids):
+                    self._remove(scope, entry_id)
+                entries = None
+            if entries is None:
+                entries = self._scopes[scope] = _Scope(len(vector))
+            entry_id = self._next_id
+            self._next_id += 1
+            entries.add(
+                entry_id,
+                _Entry(
+                    question, vector, answer, [dict(doc) for doc in documents], dict(versions), time.time()
+                ),
+            )
+            self._order[(scope, entry_id)] = None
+            while len(self._order) > self.capacity:
+                old_scope, old_id = next(iter(self._order))
+                self._remove(old_scope, old_id)
+
+    def invalidate_collection(self, collection_name: str) -> None:
+        """Mark answers retrieved from a collection as stale, e.g. after it was re-indexed."""
+        with self._lock:
+            self._versions[collection_name] = self._versions.get(collection_name, 0) + 1
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scopes.clear()
+            self._order.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._order),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+response_cache = ResponseCache()
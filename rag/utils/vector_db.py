@@ -8,15 +8,24 @@ sys.path.append("E:\\Projects\\RagevalBackend")
 
 import asyncio
 import logging
+import os
+import threading
 from typing import List, Dict, Any, Optional, Tuple
-from collections import deque  # 新增导入
 from concurrent.futures import ThreadPoolExecutor
 import chromadb
+import numpy as np
 from chromadb.config import Settings
 from rag.utils.embedding import create_chroma_embedding_function
+from rag.utils.query_cache import embed_queries_cached
 
 logger = logging.getLogger(__name__)
 
+# Collection handles shared by all VectorDatabase instances of the same store,
+# keyed by (persist_directory, collection_name) -> {embedding function id: handle},
+# so a delete through one instance invalidates the handles of the others.
+_collection_handles: Dict[Tuple[str, str], Dict[int, Any]] = {}
+_collection_handles_lock = threading.Lock()
+
 
 class VectorDatabase:
     """
@@ -43,7 +52,25 @@ class VectorDatabase:
             )
         )
         self.executor = ThreadPoolExecutor(max_workers=4)
-        self.query_cache = deque(maxlen=3)  # 初始化查询嵌入缓存
+
+    def _handle_key(self, collection_name: str) -> Tuple[str, str]:
+        return os.path.abspath(self.persist_directory), collection_name
+
+    def _get_cached_collection(self, collection_name: str):
+        with _collection_handles_lock:
+            handles = _collection_handles.get(self._handle_key(collection_name))
+            return handles.get(id(self.embedding_function)) if handles else None
+
+    def _cache_collection(self, collection_name: str, collection) -> None:
+        with _collection_handles_lock:
+            _collection_handles.setdefault(self._handle_key(collection_name), {})[
+                id(self.embedding_function)
+            ] = collection
+
+    def invalidate_collection(self, collection_name: str) -> None:
+        """Drop cached handles of a collection so the next access re-reads it."""
+        with _collection_handles_lock:
+            _collection_handles.pop(self._handle_key(collection_name), None)
 
     async def initialize(self):
         """Initialize the ChromaDB client asynchronously."""
@@ -76,13 +103,16 @@ class VectorDatabase:
 
         loop = asyncio.get_event_loop()
 
+        self.invalidate_collection(collection_name)
+
         def _create_collection():
             try:
-                self.client.create_collection(
+                collection = self.client.create_collection(
                     name=collection_name,
                     metadata=metadata or {},
                     embedding_function=self.embedding_function,
                 )
+                self._cache_collection(collection_name, collection)
                 return True
             except Exception as e:
                 if "already exists" in str(e).lower():
@@ -109,6 +139,8 @@ class VectorDatabase:
 
         loop = asyncio.get_event_loop()
 
+        self.invalidate_collection(collection_name)
+
         def _delete_collection():
             try:
                 self.client.delete_collection(name=collection_name)
@@ -125,7 +157,8 @@ class VectorDatabase:
 
     async def get_collection(self, collection_name: str):
         """
-        Get a collection by name.
+        Get a collection by name. Handles are cached until the collection is
+        created or deleted again.
 
         Args:
             collection_name: Name of the collection
@@ -133,6 +166,10 @@ class VectorDatabase:
         Returns:
             Collection object or None if not found
         """
+        collection = self._get_cached_collection(collection_name)
+        if collection is not None:
+            return collection
+
         if not self.client:
             await self.initialize()
 
@@ -140,9 +177,11 @@ class VectorDatabase:
 
         def _get_collection():
             try:
-                return self.client.get_collection(
+                collection = self.client.get_collection(
                     name=collection_name, embedding_function=self.embedding_function
                 )
+                self._cache_collection(collection_name, collection)
+                return collection
             except Exception as e:
                 if "does not exist" in str(e).lower() or "not found" in str(e).lower():
                     logger.warning(f"Collection '{collection_name}' does not exist")
@@ -159,6 +198,7 @@ class VectorDatabase:
         documents: List[str],
         metadatas: Optional[List[Dict[str, Any]]] = None,
         ids: Optional[List[str]] = None,
+        embeddings: Optional[List[List[float]]] = None,
     ) -> bool:
         """
         Add documents to a collection with concurrent batch processing.
@@ -168,6 +208,7 @@ class VectorDatabase:
             documents: List of document texts
             metadatas: Optional list of metadata for each document
             ids: Optional list of IDs for each document
+            embeddings: Optional precomputed embeddings; skips the embedding call
 
         Returns:
             bool: True if added successfully
@@ -189,12 +230,15 @@ class VectorDatabase:
         semaphore = asyncio.Semaphore(16)
         num_documents = len(documents)
 
-        def _add_documents_batch(docs_batch, metadatas_batch, ids_batch):
+        def _add_documents_batch(docs_batch, metadatas_batch, ids_batch, embeddings_batch):
             collection.add(
-                documents=docs_batch, metadatas=metadatas_batch, ids=ids_batch
+                documents=docs_batch,
+                metadatas=metadatas_batch,
+                ids=ids_batch,
+                embeddings=embeddings_batch,
             )
 
-        async def _process_batch(batch_idx, docs_batch, metadatas_batch, ids_batch):
+        async def _process_batch(batch_idx, docs_batch, metadatas_batch, ids_batch, embeddings_batch):
             async with semaphore:
                 await loop.run_in_executor(
                     self.executor,
@@ -202,6 +246,7 @@ class VectorDatabase:
                     docs_batch,
                     metadatas_batch,
                     ids_batch,
+                    embeddings_batch,
                 )
                 logger.info(
                     f"Added batch {batch_idx + 1}/{(num_documents + batch_size - 1)//batch_size} to collection '{collection_name}'"
@@ -226,9 +271,15 @@ class VectorDatabase:
                 if metadatas is not None:
                     metadatas_batch = metadatas[i : i + batch_size]
 
+                embeddings_batch = None
+                if embeddings is not None:
+                    embeddings_batch = embeddings[i : i + batch_size]
+
                 batch_idx = i // batch_size
                 tasks.append(
-                    _process_batch(batch_idx, docs_batch, metadatas_batch, ids_batch)
+                    _process_batch(
+                        batch_idx, docs_batch, metadatas_batch, ids_batch, embeddings_batch
+                    )
                 )
 
             await asyncio.gather(*tasks)
@@ -236,115 +287,136 @@ class VectorDatabase:
 
         return await _add_documents_async()
 
+    async def embed_query(self, query_text: str) -> List[float]:
+        """
+        Compute the embedding of a query, served from the process-wide query
+        cache when possible.
+
+        Args:
+            query_text: Query text
+
+        Returns:
+            Embedding vector
+        """
+        return (await self.embed_queries([query_text]))[0]
+
+    async def embed_queries(self, query_texts: List[str]) -> List[List[float]]:
+        """
+        Compute embeddings for several queries with one embedding request
+        for all cache misses.
+
+        Args:
+            query_texts: Query texts
+
+        Returns:
+            One embedding per query, in order
+        """
+        return await embed_queries_cached(
+            self.embedding_function, query_texts, self.executor
+        )
+
     async def search_documents(
         self,
         collection_name: str,
         query_text: str,
         k: int = 5,
         where: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None,
     ) -> List[Tuple[str, float]]:
         """
         Search for similar documents in a collection.
-        Uses a cache for recent query embeddings.
+        Query embeddings are served from the process-wide query cache.
 
         Args:
             collection_name: Name of the collection
             query_text: Query text to search for
             k: Number of results to return
             where: Optional metadata filter
+            query_embedding: Precomputed embedding of query_text (optional),
+                lets callers searching several collections embed only once
 
         Returns:
             List of tuples (document, similarity_score)
         """
+        results = await self.search_documents_batch(
+            collection_name,
+            [query_text],
+            k=k,
+            where=where,
+            query_embeddings=None if query_embedding is None else [query_embedding],
+        )
+        return results[0]
+
+    async def search_documents_batch(
+        self,
+        collection_name: str,
+        query_texts: List[str],
+        k: int = 5,
+        where: Optional[Dict[str, Any]] = None,
+        query_embeddings: Optional[List[List[float]]] = None,
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Search a collection for several queries at once: one embedding
+        request for the uncached queries and one collection.query call.
+
+        Args:
+            collection_name: Name of the collection
+            query_texts: Query texts to search for
+            k: Number of results to return per query
+            where: Optional metadata filter
+            query_embeddings: Precomputed embeddings of query_texts (optional)
+
+        Returns:
+            One list of (document, similarity_score) tuples per query
+        """
+        if not query_texts:
+            return []
+
         collection = await self.get_collection(collection_name)
         if not collection:
             logger.warning(f"Collection '{collection_name}' does not exist")
-            return []
+            return [[] for _ in query_texts]
 
         loop = asyncio.get_event_loop()
-        embedding_to_use = None
-        found_in_cache = False
-
-        # 检查缓存
-        cached_entry = None
-        for q_text_cache, q_emb_cache in self.query_cache:
-            if q_text_cache == query_text:
-                cached_entry = (q_text_cache, q_emb_cache)
-                found_in_cache = True
-                break
-
-        if found_in_cache and cached_entry:
-            embedding_to_use = cached_entry[1]
-            # 将命中的条目移到队列末尾 (最近使用)
-            self.query_cache.remove(cached_entry)
-            self.query_cache.append(cached_entry)
-            logger.debug(f"Cache hit for query: '{query_text}'")
-        else:  # 缓存未命中
-            logger.debug(f"Cache miss for query: '{query_text}'. Computing embedding.")
-
-            if not self.embedding_function:
-                logger.error("Embedding function is not available.")
-                raise ValueError("Embedding function is not initialized.")
-
-            def _generate_embedding_sync():
-                # self.embedding_function([query_text]) 返回 List[List[float]]
-                embedding_list_outer = self.embedding_function([query_text])
-                if (
-                    not embedding_list_outer
-                    or not isinstance(embedding_list_outer, list)
-                    or not embedding_list_outer
-                ):
-                    logger.error(
-                        f"Embedding function returned invalid result for: {query_text}"
-                    )
-                    raise ValueError(
-                        f"Failed to compute embedding for query: {query_text}"
-                    )
-
-                if not isinstance(embedding_list_outer[0], list):
-                    logger.error(
-                        f"Embedding function returned invalid embedding structure for: {query_text}"
-                    )
-                    raise ValueError(
-                        f"Embedding structure incorrect for query: {query_text}"
-                    )
-                return embedding_list_outer[0]
+        if query_embeddings is None:
+            query_embeddings = await self.embed_queries(query_texts)
 
-            embedding_to_use = await loop.run_in_executor(
-                self.executor, _generate_embedding_sync
-            )
-            self.query_cache.append((query_text, embedding_to_use))  # 添加到缓存
-            logger.debug(f"Cached new embedding for query: '{query_text}'")
-
-        def _perform_search_with_embedding(embedding_vector: List[float]):
+        def _perform_search_with_embeddings(collection, embeddings: List[List[float]]):
             results = collection.query(
-                query_embeddings=[embedding_vector],  # 使用嵌入向量进行查询
+                query_embeddings=embeddings,  # 使用嵌入向量进行查询
                 n_results=k,
                 where=where,
             )
 
             # 提取文档和距离
-            # ChromaDB 返回: results["documents"] = [["doc1", "doc2", ...]] for a single query
-            documents_list = results.get("documents")
-            distances_list = results.get("distances")
-
-            actual_documents = []
-            actual_distances = []
-
-            if documents_list and len(documents_list) > 0:
-                actual_documents = documents_list[0]
-
-            if distances_list and len(distances_list) > 0:
-                actual_distances = distances_list[0]
-
-            # 将距离转换为相似度分数 (1 - distance for cosine similarity)
-            similarities = [1 - dist for dist in actual_distances]
-
-            return list(zip(actual_documents, similarities))
-
-        return await loop.run_in_executor(
-            self.executor, _perform_search_with_embedding, embedding_to_use
-        )
+            # ChromaDB 返回: results["documents"] = [["doc1", "doc2", ...], ...]，每个查询一组
+            documents_list = results.get("documents") or []
+            distances_list = results.get("distances") or []
+
+            batch_results = []
+            for i in range(len(embeddings)):
+                actual_documents = documents_list[i] if i < len(documents_list) else []
+                actual_distances = distances_list[i] if i < len(distances_list) else []
+                # 将距离转换为相似度分数 (1 - distance for cosine similarity)
+                similarities = [1 - dist for dist in actual_distances]
+                batch_results.append(list(zip(actual_documents, similarities)))
+            return batch_results
+
+        try:
+            return await loop.run_in_executor(
+                self.executor, _perform_search_with_embeddings, collection, query_embeddings
+            )
+        except Exception as e:
+            if "does not exist" not in str(e).lower() and "not found" not in str(e).lower():
+                raise
+            # The cached handle went stale (collection dropped or recreated elsewhere)
+            self.invalidate_collection(collection_name)
+            collection = await self.get_collection(collection_name)
+            if not collection:
+                return [[] for _ in query_texts]
+            return await loop.run_in_executor(
+                self.executor, _perform_search_with_embeddings, collection, query_embeddings
+            )
 
     async def list_collections(self) -> List[str]:
         """
@@ -385,6 +457,210 @@ class VectorDatabase:
 
         return await loop.run_in_executor(self.executor, _get_count)
 
+    async def get_document_ids(self, collection_name: str) -> List[str]:
+        """
+        Get the ids of all documents in a collection.
+
+        Args:
+            collection_name: Name of the collection
+
+        Returns:
+            List of document ids (empty if the collection does not exist)
+        """
+        collection = await self.get_collection(collection_name)
+        if not collection:
+            return []
+
+        loop = asyncio.get_event_loop()
+
+        def _get_ids():
+            return collection.get(include=[])["ids"]
+
+        return await loop.run_in_executor(self.executor, _get_ids)
+
+    async def score_documents(
+        self, collection_name: str, ids: List[str], query_embedding: List[float]
+    ) -> List[Tuple[str, float]]:
+        """
+        Score given documents against a query exactly, without an index
+        search. Similarities are defined as in search_documents.
+
+        Args:
+            collection_name: Name of the collection
+            ids: Ids of the documents to score (unknown ids are skipped)
+            query_embedding: Raw query embedding
+
+        Returns:
+            List of (document, similarity_score) tuples, best first
+        """
+        collection = await self.get_collection(collection_name)
+        if not collection or not ids:
+            return []
+
+        loop = asyncio.get_event_loop()
+
+        def _score():
+            found = collection.get(ids=list(ids), include=["documents", "embeddings"])
+            if not found["ids"]:
+                return []
+            vectors = np.asarray(found["embeddings"], dtype="float32")
+            query = np.asarray(query_embedding, dtype="float32")
+            space = (collection.metadata or {}).get("hnsw:space", "l2")
+            if space == "cosine":
+                norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+                distances = 1 - (vectors @ query) / np.where(norms == 0, 1, norms)
+            elif space == "ip":
+                distances = 1 - vectors @ query
+            else:  # Chroma's l2 space is the squared euclidean distance
+                distances = ((vectors - query) ** 2).sum(axis=1)
+            scored = [(doc, 1 - float(dist)) for doc, dist in zip(found["documents"], distances)]
+            return sorted(scored, key=lambda item: item[1], reverse=True)
+
+        return await loop.run_in_executor(self.executor, _score)
+
+    async def delete_documents(self, collection_name: str, ids: List[str]) -> bool:
+        """
+        Delete documents from a collection by id.
+
+        Args:
+            collection_name: Name of the collection
+            ids: Ids of the documents to delete
+
+        Returns:
+            bool: True if deleted, False if the collection does not exist
+        """
+        collection = await self.get_collection(collection_name)
+        if not collection:
+            return False
+
+        loop = asyncio.get_event_loop()
+        batch_size = 1000
+
+        def _delete():
+            for i in range(0, len(ids), batch_size):
+                collection.delete(ids=ids[i : i + batch_size])
+
+        await loop.run_in_executor(self.executor, _delete)
+        return True
+
+    async def update_metadatas(
+        self, collection_name: str, ids: List[str], metadatas: List[Dict[str, Any]]
+    ) -> bool:
+        """
+        Replace the metadata of existing documents without re-embedding them.
+
+        Args:
+            collection_name: Name of the collection
+            ids: Ids of the documents to update
+            metadatas: New metadata for each document
+
+        Returns:
+            bool: True if updated, False if the collection does not exist
+        """
+        collection = await self.get_collection(collection_name)
+        if not collection:
+            return False
+
+        loop = asyncio.get_event_loop()
+        batch_size = 1000
+
+        def _update():
+            for i in range(0, len(ids), batch_size):
+                collection.update(
+                    ids=ids[i : i + batch_size],
+                    metadatas=metadatas[i : i + batch_size],
+                )
+
+        await loop.run_in_executor(self.executor, _update)
+        return True
+
+    async def get_collection_metadata(self, collection_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the metadata of a collection.
+
+        Args:
+            collection_name: Name of the collection
+
+        Returns:
+            Metadata dict or None if the collection does not exist
+        """
+        collection = await self.get_collection(collection_name)
+        if not collection:
+            return None
+        return dict(collection.metadata or {})
+
+    async def update_collection_metadata(
+        self, collection_name: str, metadata: Dict[str, Any]
+    ) -> bool:
+        """
+        Replace the metadata of a collection.
+
+        Args:
+            collection_name: Name of the collection
+            metadata: New metadata
+
+        Returns:
+            bool: True if updated, False if the collection does not exist
+        """
+        collection = await self.get_collection(collection_name)
+        if not collection:
+            return False
+
+        loop = asyncio.get_event_loop()
+
+        def _modify():
+            collection.modify(metadata=metadata)
+
+        await loop.run_in_executor(self.executor, _modify)
+        return True
+
+    async def export_collection(self, collection_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Export everything needed to rebuild a collection elsewhere without
+        re-embedding.
+
+        Args:
+            collection_name: Name of the collection
+
+        Returns:
+            Dict with metadata, ids, documents, metadatas and embeddings,
+            or None if the collection does not exist
+        """
+        collection = await self.get_collection(collection_name)
+        if not collection:
+            return None
+
+        loop = asyncio.get_event_loop()
+        batch_size = 1000
+
+        def _export():
+            exported = {
+                "metadata": dict(collection.metadata or {}),
+                "ids": [],
+                "documents": [],
+                "metadatas": [],
+                "embeddings": [],
+            }
+            offset = 0
+            while True:
+                page = collection.get(
+                    include=["documents", "metadatas", "embeddings"],
+                    limit=batch_size,
+                    offset=offset,
+                )
+                if not page["ids"]:
+                    break
+                exported["ids"].extend(page["ids"])
+                exported["documents"].extend(page["documents"])
+                exported["metadatas"].extend(dict(m or {}) for m in page["metadatas"])
+                exported["embeddings"].extend(
+                    [float(x) for x in emb] for emb in page["embeddings"]
+                )
+                offset += len(page["ids"])
+            return exported
+
+        return await loop.run_in_executor(self.executor, _export)
+
     def __del__(self):
         """Cleanup executor on deletion."""
         if hasattr(self, "executor"):
@@ -11,23 +11,182 @@ sys.path.append("E:\\Projects\\RagevalBackend")
 
 import asyncio
 import logging
+import math
 import os
 import json
 import shutil
+import threading
+import weakref
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional, Tuple
-from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 import uuid
 
 import numpy as np
 import faiss
 
+from rag.utils.doc_store import DocumentStore
 from rag.utils.embedding import (
     create_chroma_embedding_function,
 )  # Assuming this can be reused
+from rag.utils.query_cache import embed_queries_cached
 
 logger = logging.getLogger(__name__)
 
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# Filtered searches matching at most this many rows scan them exactly instead of using the index
+FILTER_BRUTE_FORCE_MAX = int(os.environ.get("RAG_FAISS_FILTER_BRUTE_FORCE_MAX", 4096))
+# Deleted fraction of a collection above which it is compacted in the background
+COMPACT_THRESHOLD = float(os.environ.get("RAG_FAISS_COMPACT_THRESHOLD", 0.2))
+# Open saved indexes memory-mapped and read-only, so cold pages stay on disk
+USE_MMAP = os.environ.get("RAG_FAISS_MMAP", "1") != "0"
+# Approximate size of loaded collections above which the least recently used are evicted, 0 = unlimited
+MEMORY_BUDGET_BYTES = int(float(os.environ.get("RAG_FAISS_MEMORY_BUDGET_MB", 1024)) * 1024 * 1024)
+
+# Default per-collection index spec; create_collection(index_spec=...) overrides keys
+DEFAULT_INDEX_SPEC: Dict[str, Any] = {
+    "type": os.environ.get("RAG_FAISS_INDEX_TYPE", "flat"),
+    "nlist": 0,  # IVF lists, 0 = 4 * sqrt(n) at training time
+    "min_train_size": int(os.environ.get("RAG_FAISS_MIN_TRAIN_SIZE", 10000)),
+    "pq_m": 16,  # PQ sub-quantizers, lowered to a divisor of the dimension
+    "pq_nbits": 8,
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "nprobe": 16,
+    "ef_search": 64,
+}
+
+
+def resolve_index_spec(index_spec: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Merge an index spec over the defaults and validate its type."""
+    spec = {**DEFAULT_INDEX_SPEC, **(index_spec or {})}
+    if spec["type"] not in INDEX_TYPES:
+        raise ValueError(
+            f"Unknown FAISS index type '{spec['type']}'. Available: {', '.join(INDEX_TYPES)}"
+        )
+    return spec
+
+
+def index_type_of(faiss_index) -> str:
+    """Index type name of a built FAISS index."""
+    if isinstance(faiss_index, faiss.IndexHNSWFlat):
+        return "hnsw"
+    if isinstance(faiss_index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(faiss_index, faiss.IndexIVFFlat):
+        return "ivf_flat"
+    return "flat"
+
+
+def build_index(spec: Dict[str, Any], vectors: np.ndarray):
+    """
+    Build and fill an index for normalized vectors according to a spec.
+    IVF types fall back to an exact IndexFlatIP until at least
+    ``min_train_size`` vectors exist to train on.
+
+    Args:
+        spec: Resolved index spec.
+        vectors: Normalized float32 matrix of shape (n, dimension).
+
+    Returns:
+        The filled FAISS index.
+    """
+    n, dimension = vectors.shape
+    index_type = spec["type"]
+    if index_type == "hnsw":
+        faiss_index = faiss.IndexHNSWFlat(
+            dimension, spec["hnsw_m"], faiss.METRIC_INNER_PRODUCT
+        )
+        faiss_index.hnsw.efConstruction = spec["ef_construction"]
+    elif index_type in ("ivf_flat", "ivf_pq") and n >= max(spec["min_train_size"], 1):
+        nlist = min(spec["nlist"] or int(4 * math.sqrt(n)), n)
+        quantizer = faiss.IndexFlatIP(dimension)
+        if index_type == "ivf_flat":
+            faiss_index = faiss.IndexIVFFlat(
+                quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT
+            )
+        else:
+            pq_m = max(m for m in range(1, min(spec["pq_m"], dimension) + 1) if dimension % m == 0)
+            faiss_index = faiss.IndexIVFPQ(
+                quantizer, dimension, nlist, pq_m, spec["pq_nbits"], faiss.METRIC_INNER_PRODUCT
+            )
+        faiss_index.train(vectors)
+        logger.info(f"Trained {index_type} index with nlist={nlist} on {n} vectors.")
+    else:
+        faiss_index = faiss.IndexFlatIP(dimension)
+    if n:
+        faiss_index.add(vectors)
+    return faiss_index
+
+
+def read_index(index_file: str, mmap: bool = True) -> Tuple[Any, bool]:
+    """
+    Read a saved index, memory-mapped and read-only when requested and
+    supported by the index type and FAISS build.
+
+    Args:
+        index_file: Path of the index file.
+        mmap: Try to memory-map the index.
+
+    Returns:
+        (index, mmapped). A memory-mapped index must not be modified; read it
+        again without mmap before adding or removing vectors.
+    """
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    if mmap and flags is not None:
+        try:
+            return faiss.read_index(index_file, flags | faiss.IO_FLAG_READ_ONLY), True
+        except RuntimeError as e:
+            logger.debug(f"Cannot memory-map {index_file}, reading it into memory: {e}")
+    return faiss.read_index(index_file), False
+
+
+class _LoadedCollection(dict):
+    """State of a loaded collection; a dict subclass so evicted entries can be weakly referenced."""
+
+
+def search_parameters(
+    faiss_index,
+    spec: Dict[str, Any],
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    selector=None,
+):
+    """Per-query search parameters (ANN tuning and an optional IDSelector), None if there are none."""
+    index_type = index_type_of(faiss_index)
+    if index_type == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=ef_search or spec["ef_search"], sel=selector)
+    if index_type in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(nprobe=nprobe or spec["nprobe"], sel=selector)
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+
+def exact_top_k(
+    query_matrix: np.ndarray, vectors: np.ndarray, positions: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact inner-product top-k of each query over a subset of rows.
+
+    Args:
+        query_matrix: Normalized queries, shape (num_queries, dimension).
+        vectors: Vectors of the subset rows, shape (len(positions), dimension).
+        positions: Row positions of ``vectors``.
+        k: Results per query.
+
+    Returns:
+        (similarities, positions) arrays shaped like faiss search output.
+    """
+    k = min(k, len(positions))
+    scores = query_matrix @ vectors.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    return np.take_along_axis(top_scores, order, axis=1), positions[top]
+
 
 class VectorDatabase:
     """
@@ -51,13 +210,17 @@ class VectorDatabase:
             base_url="https://api.bianxie.ai/v1",
         )
         self.executor = ThreadPoolExecutor(max_workers=4)  # Matches original
-        self.query_cache = deque(maxlen=3)  # Matches original query cache size
-        self.loaded_collections_cache: Dict[str, Dict[str, Any]] = (
-            {}
-        )  # In-memory cache for loaded collections
+        # Loaded collections in least recently used order, bounded by memory_budget_bytes
+        self.loaded_collections_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.memory_budget_bytes = MEMORY_BUDGET_BYTES
+        self._cache_lock = threading.RLock()
+        # Evicted collections still referenced by running operations, reused on reload
+        self._evicted: "weakref.WeakValueDictionary[str, Dict[str, Any]]" = weakref.WeakValueDictionary()
+        self.evictions = 0
         self.collection_dimensions: Dict[str, int] = (
             {}
         )  # Stores embedding dimension for each collection
+        self._compactions: Dict[str, Any] = {}  # Running background compactions
 
     async def initialize(self):
         """Initialize the database by ensuring the persist directory exists."""
@@ -75,46 +238,195 @@ class VectorDatabase:
         """Helper to get file paths for a collection."""
         collection_dir = os.path.join(self.persist_directory, collection_name)
         index_file = os.path.join(collection_dir, "index.faiss")
-        data_file = os.path.join(collection_dir, "data.json")
+        # Small header only; documents live in the collection's DocumentStore
+        data_file = os.path.join(collection_dir, "collection.json")
         return collection_dir, index_file, data_file
 
+    def _vectors_file(self, collection_name: str) -> str:
+        """
+        Raw vector file kept for ANN collections, whose index cannot be
+        reconstructed exactly: normalized little-endian float32 rows in
+        position order, append-only like the DocumentStore's offsets.bin.
+        """
+        return os.path.join(self.persist_directory, collection_name, "vectors.f32")
+
+    def _vector_rows_sync(self, collection_name: str) -> np.ndarray:
+        """Read-only memory map of the raw vector file, shape (n, dimension)."""
+        vectors_file = self._vectors_file(collection_name)
+        legacy_file = os.path.join(os.path.dirname(vectors_file), "vectors.npy")
+        if os.path.exists(legacy_file):
+            # Collections saved before the append-only file stored one .npy
+            legacy = np.load(legacy_file).astype("<f4")
+            with open(vectors_file + ".tmp", "wb") as f:
+                f.write(legacy.tobytes())
+            os.replace(vectors_file + ".tmp", vectors_file)
+            os.remove(legacy_file)
+        dimension = self.collection_dimensions.get(collection_name) or 0
+        if not dimension or not os.path.exists(vectors_file):
+            return np.zeros((0, dimension), dtype="float32")
+        rows = os.path.getsize(vectors_file) // (4 * dimension)
+        if not rows:
+            return np.zeros((0, dimension), dtype="float32")
+        return np.memmap(vectors_file, dtype="<f4", mode="r", shape=(rows, dimension))
+
+    def _load_vectors_sync(self, collection_name: str, collection_data: Dict[str, Any]) -> np.ndarray:
+        """All stored (normalized) vectors of a collection, in position order."""
+        faiss_index = collection_data.get("index")
+        if collection_data["index_spec"]["type"] == "flat":
+            if faiss_index is None or faiss_index.ntotal == 0:
+                return np.zeros((0, self.collection_dimensions.get(collection_name) or 0), dtype="float32")
+            return faiss_index.reconstruct_n(0, faiss_index.ntotal)
+        return self._vector_rows_sync(collection_name)
+
+    def _subset_vectors_sync(
+        self, collection_name: str, collection_data: Dict[str, Any], positions: np.ndarray
+    ) -> np.ndarray:
+        """Stored (normalized) vectors of the given positions only."""
+        if collection_data["index_spec"]["type"] == "flat":
+            return collection_data["index"].reconstruct_batch(positions)
+        return np.ascontiguousarray(self._vector_rows_sync(collection_name)[positions])
+
+    def _append_vectors_sync(
+        self, collection_name: str, collection_data: Dict[str, Any], vectors: np.ndarray
+    ) -> None:
+        """Append rows to the raw vector file of an ANN collection."""
+        if collection_data["index_spec"]["type"] == "flat":
+            return
+        vectors_file = self._vectors_file(collection_name)
+        stored_rows = len(self._vector_rows_sync(collection_name))
+        positions = len(collection_data["store"])
+        with open(vectors_file, "ab") as f:
+            if stored_rows > positions:
+                # Rows of an append interrupted before the store was written
+                f.truncate(positions * 4 * vectors.shape[1])
+            f.write(np.ascontiguousarray(vectors, dtype="<f4").tobytes())
+
+    def _save_vectors_sync(self, collection_name: str, collection_data: Dict[str, Any], vectors: np.ndarray):
+        """Replace the raw vector file (after compaction or a rebuild)."""
+        if collection_data["index_spec"]["type"] != "flat":
+            vectors_file = self._vectors_file(collection_name)
+            with open(vectors_file + ".tmp", "wb") as f:
+                f.write(np.ascontiguousarray(vectors, dtype="<f4").tobytes())
+            os.replace(vectors_file + ".tmp", vectors_file)
+
     def _save_collection_data_sync(
         self, collection_name: str, collection_data: Dict[str, Any]
     ):
-        """Synchronously saves collection data (index and metadata)."""
+        """
+        Synchronously saves the index and the collection header. Documents
+        are appended to the DocumentStore as they are added, not here.
+        """
         _collection_dir, index_file, data_file = self._get_collection_paths(
             collection_name
         )
         os.makedirs(_collection_dir, exist_ok=True)
 
-        if collection_data.get("index"):
-            faiss.write_index(collection_data["index"], index_file)
+        if collection_data.get("index") and not collection_data.get("mmapped"):
+            # Replace rather than overwrite: memory-mapped readers keep the old file
+            tmp_index_file = index_file + ".tmp"
+            faiss.write_index(collection_data["index"], tmp_index_file)
+            os.replace(tmp_index_file, index_file)
 
         data_to_save = {
-            "documents": collection_data.get("documents", []),
-            "metadatas": collection_data.get("metadatas", []),
-            "idx_to_id": collection_data.get("idx_to_id", []),
-            "id_to_idx": collection_data.get("id_to_idx", {}),
             "collection_metadata": collection_data.get("collection_metadata", {}),
+            "index_spec": collection_data.get("index_spec"),
             "dimension": self.collection_dimensions.get(collection_name),
         }
-        with open(data_file, "w", encoding="utf-8") as f:
+        tmp_file = data_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
             json.dump(data_to_save, f)
+        os.replace(tmp_file, data_file)
         logger.debug(f"Saved data for collection '{collection_name}' to disk.")
+        collection_data["footprint"] = self._footprint_sync(collection_name, collection_data)
+        self._evict_over_budget(keep=collection_name)
+
+    def _footprint_sync(self, collection_name: str, collection_data: Dict[str, Any]) -> int:
+        """Approximate resident bytes of a loaded collection."""
+        _collection_dir, index_file, _data_file = self._get_collection_paths(collection_name)
+        index_bytes = os.path.getsize(index_file) if os.path.exists(index_file) else 0
+        return index_bytes + collection_data["store"].memory_usage()
+
+    def _cache_collection(self, collection_name: str, collection_data: Dict[str, Any]) -> None:
+        with self._cache_lock:
+            self.loaded_collections_cache[collection_name] = collection_data
+            self.loaded_collections_cache.move_to_end(collection_name)
+        self._evict_over_budget(keep=collection_name)
+
+    def _cached_collection(self, collection_name: str) -> Optional[Dict[str, Any]]:
+        """Loaded collection data marked as most recently used, or None."""
+        with self._cache_lock:
+            collection_data = self.loaded_collections_cache.get(collection_name)
+            if collection_data is None:
+                # Evicted while an operation still held it: reuse instead of opening twice
+                collection_data = self._evicted.pop(collection_name, None)
+                if collection_data is None:
+                    return None
+                self.loaded_collections_cache[collection_name] = collection_data
+            self.loaded_collections_cache.move_to_end(collection_name)
+            return collection_data
+
+    def _evict_over_budget(self, keep: Optional[str] = None) -> None:
+        """
+        Drop least recently used collections until the loaded ones fit the
+        memory budget. Evicted collections are reloaded lazily on next access.
+        """
+        if self.memory_budget_bytes <= 0:
+            return
+        with self._cache_lock:
+            total = sum(data.get("footprint", 0) for data in self.loaded_collections_cache.values())
+            for name in list(self.loaded_collections_cache):
+                if total <= self.memory_budget_bytes:
+                    break
+                if name == keep:
+                    continue
+                collection_data = self.loaded_collections_cache.pop(name)
+                total -= collection_data.get("footprint", 0)
+                self._evicted[name] = collection_data
+                self.evictions += 1
+                logger.info(f"Evicted collection '{name}' from memory.")
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """Loaded collections and their approximate footprint, for monitoring."""
+        with self._cache_lock:
+            loaded = list(self.loaded_collections_cache.values())
+            return {
+                "collections": len(loaded),
+                "mmapped": sum(1 for data in loaded if data.get("mmapped")),
+                "bytes": sum(data.get("footprint", 0) for data in loaded),
+                "budget_bytes": self.memory_budget_bytes,
+                "evictions": self.evictions,
+            }
+
+    def _ensure_writable_sync(self, collection_name: str, collection_data: Dict[str, Any]) -> None:
+        """Replace a memory-mapped index by an in-memory copy before modifying it."""
+        if not collection_data.get("mmapped"):
+            return
+        _collection_dir, index_file, _data_file = self._get_collection_paths(collection_name)
+        collection_data["index"] = faiss.read_index(index_file)
+        collection_data["mmapped"] = False
 
     def _load_collection_data_sync(
         self, collection_name: str
     ) -> Optional[Dict[str, Any]]:
         """Synchronously loads collection data. Returns None if not found."""
-        if collection_name in self.loaded_collections_cache:
-            return self.loaded_collections_cache[collection_name]
+        with self._cache_lock:
+            # Checked and loaded under the cache lock so a collection is opened once
+            return self._load_collection_data_locked(collection_name)
 
-        _collection_dir, index_file, data_file = self._get_collection_paths(
+    def _load_collection_data_locked(
+        self, collection_name: str
+    ) -> Optional[Dict[str, Any]]:
+        collection_data = self._cached_collection(collection_name)
+        if collection_data is not None:
+            return collection_data
+
+        collection_dir, index_file, data_file = self._get_collection_paths(
             collection_name
         )
+        legacy_file = os.path.join(collection_dir, "data.json")
 
-        if not os.path.exists(
-            data_file
+        if not os.path.exists(data_file) and not os.path.exists(
+            legacy_file
         ):  # Check data_file first as index might be absent for empty collection
             logger.debug(
                 f"Data file for collection '{collection_name}' not found at {data_file}."
@@ -122,12 +434,17 @@ class VectorDatabase:
             return None
 
         try:
+            if not os.path.exists(data_file):
+                self._convert_legacy_data_sync(collection_name, legacy_file)
             with open(data_file, "r", encoding="utf-8") as f:
                 loaded_data = json.load(f)
 
+            # Opened first: it finishes an interrupted compaction, which also moves the index
+            store = DocumentStore(collection_dir)
             faiss_index = None
+            mmapped = False
             if os.path.exists(index_file):
-                faiss_index = faiss.read_index(index_file)
+                faiss_index, mmapped = read_index(index_file, USE_MMAP)
                 if faiss_index and loaded_data.get(
                     "dimension"
                 ):  # Verify dimension if possible
@@ -139,27 +456,59 @@ class VectorDatabase:
                 ):  # Store dimension if not in data.json but index exists
                     self.collection_dimensions[collection_name] = faiss_index.d
 
-            collection_data = {
-                "index": faiss_index,
-                "documents": loaded_data.get("documents", []),
-                "metadatas": loaded_data.get("metadatas", []),
-                "idx_to_id": loaded_data.get("idx_to_id", []),
-                "id_to_idx": loaded_data.get("id_to_idx", {}),
-                "collection_metadata": loaded_data.get("collection_metadata", {}),
-            }
-            self.loaded_collections_cache[collection_name] = collection_data
+            collection_data = _LoadedCollection(
+                index=faiss_index,
+                # Read-only view of index_file, see _ensure_writable_sync
+                mmapped=mmapped,
+                store=store,
+                # Serializes writes, searches and compaction of the collection
+                lock=threading.RLock(),
+                collection_metadata=loaded_data.get("collection_metadata", {}),
+                # Collections written before index specs existed are flat
+                index_spec=resolve_index_spec(loaded_data.get("index_spec") or {"type": "flat"}),
+            )
+            collection_data["footprint"] = self._footprint_sync(collection_name, collection_data)
+            self._cache_collection(collection_name, collection_data)
             logger.debug(f"Loaded collection '{collection_name}' into cache.")
             return collection_data
         except Exception as e:
             logger.error(f"Error loading collection '{collection_name}': {e}")
             return None
 
+    def _convert_legacy_data_sync(self, collection_name: str, legacy_file: str):
+        """Move a collection saved as one data.json into the DocumentStore layout."""
+        collection_dir, _index_file, data_file = self._get_collection_paths(
+            collection_name
+        )
+        with open(legacy_file, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+        store = DocumentStore(collection_dir)
+        try:
+            if len(store) == 0 and legacy.get("documents"):
+                store.append(
+                    [doc_id or str(uuid.uuid4()) for doc_id in legacy.get("idx_to_id", [])],
+                    legacy["documents"],
+                    legacy.get("metadatas", []),
+                )
+        finally:
+            store.close()
+        header = {
+            "collection_metadata": legacy.get("collection_metadata", {}),
+            "index_spec": legacy.get("index_spec"),
+            "dimension": legacy.get("dimension"),
+        }
+        with open(data_file, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        os.replace(legacy_file, legacy_file + ".bak")
+        logger.info(f"Converted collection '{collection_name}' to the append-only document store.")
+
     async def _get_or_load_collection_data(
         self, collection_name: str
     ) -> Optional[Dict[str, Any]]:
         """Loads collection data from cache or disk asynchronously."""
-        if collection_name in self.loaded_collections_cache:
-            return self.loaded_collections_cache[collection_name]
+        collection_data = self._cached_collection(collection_name)
+        if collection_data is not None:
+            return collection_data
 
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(
@@ -167,7 +516,10 @@ class VectorDatabase:
         )
 
     async def create_collection(
-        self, collection_name: str, metadata: Optional[Dict[str, Any]] = None
+        self,
+        collection_name: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        index_spec: Optional[Dict[str, Any]] = None,
     ) -> bool:
         """
         Create a new collection.
@@ -175,6 +527,8 @@ class VectorDatabase:
         Args:
             collection_name: Name of the collection.
             metadata: Optional metadata for the collection.
+            index_spec: Optional index spec overriding DEFAULT_INDEX_SPEC
+                (type: flat, ivf_flat, ivf_pq or hnsw, plus tuning keys).
 
         Returns:
             bool: True if created successfully, False if already exists.
@@ -182,6 +536,7 @@ class VectorDatabase:
         collection_dir, _index_file, data_file = self._get_collection_paths(
             collection_name
         )
+        spec = resolve_index_spec(index_spec)
         loop = asyncio.get_event_loop()
 
         def _create_sync():
@@ -192,20 +547,19 @@ class VectorDatabase:
                     f"Collection '{collection_name}' (directory) already exists."
                 )
                 # Ensure it's loaded if it exists but isn't in cache
-                if collection_name not in self.loaded_collections_cache:
-                    self._load_collection_data_sync(collection_name)
+                self._load_collection_data_sync(collection_name)
                 return False
 
             os.makedirs(collection_dir, exist_ok=True)
-            collection_data = {
-                "index": None,  # FAISS index will be created on first add_documents
-                "documents": [],
-                "metadatas": [],
-                "idx_to_id": [],
-                "id_to_idx": {},
-                "collection_metadata": metadata or {},
-            }
-            self.loaded_collections_cache[collection_name] = collection_data
+            collection_data = _LoadedCollection(
+                index=None,  # FAISS index will be created on first add_documents
+                mmapped=False,
+                store=DocumentStore(collection_dir),
+                lock=threading.RLock(),
+                collection_metadata=metadata or {},
+                index_spec=spec,
+            )
+            self._cache_collection(collection_name, collection_data)
             # Save empty data structure
             self._save_collection_data_sync(collection_name, collection_data)
             logger.info(f"Collection '{collection_name}' created successfully.")
@@ -229,8 +583,12 @@ class VectorDatabase:
         loop = asyncio.get_event_loop()
 
         def _delete_sync():
-            if collection_name in self.loaded_collections_cache:
-                del self.loaded_collections_cache[collection_name]
+            with self._cache_lock:
+                collection_data = self.loaded_collections_cache.pop(
+                    collection_name, None
+                ) or self._evicted.pop(collection_name, None)
+            if collection_data is not None:
+                collection_data["store"].close()
             if collection_name in self.collection_dimensions:
                 del self.collection_dimensions[collection_name]
 
@@ -252,29 +610,7 @@ class VectorDatabase:
         """
         return await self._get_or_load_collection_data(collection_name)
 
-    async def add_documents(
-        self,
-        collection_name: str,
-        documents: List[str],
-        metadatas: Optional[List[Dict[str, Any]]] = None,
-        ids: Optional[List[str]] = None,
-    ) -> bool:
-        """
-        Add documents to a collection.
-
-        Args:
-            collection_name: Name of the collection.
-            documents: List of document texts.
-            metadatas: Optional list of metadata for each document.
-            ids: Optional list of IDs for each document.
-
-        Returns:
-            bool: True if added successfully.
-        """
-        if not documents:
-            logger.info(f"No documents to add to collection '{collection_name}'.")
-            return True
-
+    async def _get_or_create_collection_data(self, collection_name: str) -> Dict[str, Any]:
         collection_data = await self._get_or_load_collection_data(collection_name)
         if not collection_data:
             # Try to create the collection if it doesn't exist
@@ -290,44 +626,58 @@ class VectorDatabase:
             raise ValueError(
                 f"Could not create or access collection '{collection_name}'"
             )
+        return collection_data
+
+    def _embed_documents_sync(self, docs_to_embed: List[str]) -> np.ndarray:
+        if not self.embedding_function:
+            raise ValueError("Embedding function is not initialized.")
+        # Returns List[List[float]]
+        embeddings_list = self.embedding_function(docs_to_embed)
+        if not embeddings_list or not isinstance(embeddings_list[0], list):
+            raise ValueError("Embedding function returned invalid result.")
+
+        embeddings_np = np.array(embeddings_list).astype("float32")
+        faiss.normalize_L2(
+            embeddings_np
+        )  # Normalize for IndexFlatIP (cosine similarity)
+        return embeddings_np
+
+    async def _normalized_embeddings(
+        self, documents: List[str], embeddings: Optional[List[List[float]]]
+    ) -> np.ndarray:
+        if embeddings is None:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                self.executor, self._embed_documents_sync, documents
+            )
+        embeddings_np = np.array(embeddings).astype("float32")
+        faiss.normalize_L2(embeddings_np)
+        return embeddings_np
 
-        loop = asyncio.get_event_loop()
-
-        # Process in chunks for embedding to manage memory, though FAISS add is batched
-        # The original code had a batch_size for Chroma add. Here, we embed all then add all.
-        # If embedding_function itself is slow or memory intensive for large lists,
-        # it might need internal batching or we batch calls to it.
-        # For now, assume embedding_function can handle `documents`.
-
-        def _generate_embeddings_sync(docs_to_embed: List[str]) -> np.ndarray:
-            if not self.embedding_function:
-                raise ValueError("Embedding function is not initialized.")
-            # Returns List[List[float]]
-            embeddings_list = self.embedding_function(docs_to_embed)
-            if not embeddings_list or not isinstance(embeddings_list[0], list):
-                raise ValueError("Embedding function returned invalid result.")
-
-            embeddings_np = np.array(embeddings_list).astype("float32")
-            faiss.normalize_L2(
-                embeddings_np
-            )  # Normalize for IndexFlatIP (cosine similarity)
-            return embeddings_np
-
-        embeddings_np = await loop.run_in_executor(
-            self.executor, _generate_embeddings_sync, documents
-        )
-
-        def _add_to_faiss_sync():
-            faiss_index = collection_data.get("index")
-            current_dimension = self.collection_dimensions.get(collection_name)
+    def _append_sync(
+        self,
+        collection_name: str,
+        collection_data: Dict[str, Any],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+        embeddings_np: np.ndarray,
+    ) -> None:
+        """Append vectors to the index and records to the store (caller holds the collection lock)."""
+        self._ensure_writable_sync(collection_name, collection_data)
+        faiss_index = collection_data.get("index")
+        current_dimension = self.collection_dimensions.get(collection_name)
+        spec = collection_data["index_spec"]
+
+        dimension = embeddings_np.shape[1]
+        if current_dimension is not None and current_dimension != dimension:
+            raise ValueError(
+                f"Dimension mismatch for new documents in '{collection_name}'. Expected {current_dimension}, got {dimension}"
+            )
+        self.collection_dimensions[collection_name] = dimension
 
+        if spec["type"] == "flat":
             if faiss_index is None:
-                dimension = embeddings_np.shape[1]
-                if current_dimension is not None and current_dimension != dimension:
-                    raise ValueError(
-                        f"Dimension mismatch for collection '{collection_name}'. Expected {current_dimension}, got {dimension}"
-                    )
-                self.collection_dimensions[collection_name] = dimension
                 faiss_index = faiss.IndexFlatIP(
                     dimension
                 )  # Using Inner Product for cosine similarity
@@ -335,52 +685,236 @@ class VectorDatabase:
                 logger.info(
                     f"Initialized FAISS index for '{collection_name}' with dimension {dimension}."
                 )
-            elif embeddings_np.shape[1] != current_dimension:
-                raise ValueError(
-                    f"Dimension mismatch for new documents in '{collection_name}'. Expected {current_dimension}, got {embeddings_np.shape[1]}"
+            faiss_index.add(embeddings_np)
+        else:
+            # ANN indexes keep the raw vectors for retraining and rebuilds;
+            # only the new rows are written
+            self._append_vectors_sync(collection_name, collection_data, embeddings_np)
+            total = len(collection_data["store"]) + len(embeddings_np)
+            if faiss_index is None or (
+                index_type_of(faiss_index) != spec["type"]
+                and total >= spec["min_train_size"]
+            ):
+                # First add, or enough vectors to train the IVF index
+                vectors = np.asarray(self._vector_rows_sync(collection_name)[:total])
+                faiss_index = build_index(spec, vectors)
+                collection_data["index"] = faiss_index
+                logger.info(
+                    f"Built {index_type_of(faiss_index)} index for '{collection_name}' with {len(vectors)} vectors."
                 )
+            else:
+                faiss_index.add(embeddings_np)
 
-            num_new_docs = len(documents)
-            start_faiss_idx = faiss_index.ntotal
+        # Append documents, metadatas and ids; positions follow the index rows
+        collection_data["store"].append(ids, documents, metadatas)
+        self._save_collection_data_sync(collection_name, collection_data)
+        logger.info(
+            f"Added {len(documents)} documents to collection '{collection_name}'. Total: {faiss_index.ntotal}"
+        )
 
-            faiss_index.add(embeddings_np)
+    async def add_documents(
+        self,
+        collection_name: str,
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+        embeddings: Optional[List[List[float]]] = None,
+    ) -> bool:
+        """
+        Add documents to a collection. Like ChromaDB, ids that already exist
+        are skipped; use upsert_documents to replace them.
 
-            # Update documents, metadatas, and ID mappings
-            doc_list = collection_data.setdefault("documents", [])
-            meta_list = collection_data.setdefault("metadatas", [])
-            idx_to_id_list = collection_data.setdefault("idx_to_id", [])
-            id_to_idx_map = collection_data.setdefault("id_to_idx", {})
+        Args:
+            collection_name: Name of the collection.
+            documents: List of document texts.
+            metadatas: Optional list of metadata for each document.
+            ids: Optional list of IDs for each document.
+            embeddings: Optional precomputed embeddings; skips the embedding call.
+
+        Returns:
+            bool: True if added successfully.
+        """
+        if not documents:
+            logger.info(f"No documents to add to collection '{collection_name}'.")
+            return True
 
-            for i in range(num_new_docs):
-                doc_id = ids[i] if ids and i < len(ids) else str(uuid.uuid4())
-                faiss_idx = start_faiss_idx + i
+        collection_data = await self._get_or_create_collection_data(collection_name)
+        doc_ids = [
+            ids[i] if ids and i < len(ids) else str(uuid.uuid4())
+            for i in range(len(documents))
+        ]
+        store = collection_data["store"]
+        # Ids already stored are not embedded; the check is repeated under the
+        # lock, since a concurrent add may store the same ids meanwhile
+        existing = store.positions_of(doc_ids)
+        seen = set(existing)
+        candidates = []
+        for i, doc_id in enumerate(doc_ids):
+            if doc_id not in seen:
+                seen.add(doc_id)
+                candidates.append(i)
+
+        embeddings_np = None
+        if candidates:
+            embeddings_np = await self._normalized_embeddings(
+                [documents[i] for i in candidates],
+                None if embeddings is None else [embeddings[i] for i in candidates],
+            )
+        loop = asyncio.get_event_loop()
 
-                if doc_id in id_to_idx_map:
+        def _add_to_faiss_sync():
+            with collection_data["lock"]:
+                stored = store.positions_of([doc_ids[i] for i in candidates])
+                rows = [r for r, i in enumerate(candidates) if doc_ids[i] not in stored]
+                selected = [candidates[r] for r in rows]
+                if len(selected) < len(documents):
                     logger.warning(
-                        f"Duplicate ID '{doc_id}' encountered in collection '{collection_name}'. Overwriting is not directly supported by simple append. Consider updating or ensuring unique IDs."
+                        f"Skipped {len(documents) - len(selected)} documents with existing IDs in collection '{collection_name}'. Use upsert_documents to replace them."
                     )
-                    # For simplicity, we'll just add. Proper update logic is complex.
-
-                doc_list.append(documents[i])
-                meta_list.append(
-                    metadatas[i] if metadatas and i < len(metadatas) else {}
+                if not selected:
+                    return True
+                self._append_sync(
+                    collection_name,
+                    collection_data,
+                    [documents[i] for i in selected],
+                    [metadatas[i] if metadatas and i < len(metadatas) else {} for i in selected],
+                    [doc_ids[i] for i in selected],
+                    embeddings_np[rows],
                 )
+            return True
 
-                # Ensure idx_to_id_list is long enough
-                while len(idx_to_id_list) <= faiss_idx:
-                    idx_to_id_list.append(
-                        None
-                    )  # Placeholder if sparse additions happened (should not with current logic)
-                idx_to_id_list[faiss_idx] = doc_id
-                id_to_idx_map[doc_id] = faiss_idx
+        return await loop.run_in_executor(self.executor, _add_to_faiss_sync)
 
-            self._save_collection_data_sync(collection_name, collection_data)
+    async def upsert_documents(
+        self,
+        collection_name: str,
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+        embeddings: Optional[List[List[float]]] = None,
+    ) -> bool:
+        """
+        Insert documents or replace the ones whose ids exist. Replaced
+        documents are tombstoned and appended again; when only the metadata
+        changed, it is updated in place without re-embedding.
+
+        Args:
+            collection_name: Name of the collection.
+            documents: List of document texts.
+            metadatas: Optional list of metadata for each document.
+            ids: List of IDs for each document.
+            embeddings: Optional precomputed embeddings; skips the embedding call.
+
+        Returns:
+            bool: True if upserted successfully.
+        """
+        if not documents:
+            return True
+        if not ids or len(ids) != len(documents):
+            raise ValueError("upsert_documents needs one id per document.")
+
+        collection_data = await self._get_or_create_collection_data(collection_name)
+        store = collection_data["store"]
+        # The last occurrence of a repeated id wins
+        latest = {doc_id: i for i, doc_id in enumerate(ids)}
+
+        def _split_sync() -> Tuple[Dict[str, int], List[int], List[int]]:
+            """Positions of the stored ids, and documents whose text is unchanged or not."""
+            existing = store.positions_of(list(latest))
+            existing_texts = dict(
+                zip(existing, store.get_documents([existing[doc_id] for doc_id in existing]))
+            )
+            metadata_only = []
+            replaced = []
+            for doc_id, i in latest.items():
+                if existing_texts.get(doc_id) == documents[i] and embeddings is None:
+                    metadata_only.append(i)
+                else:
+                    replaced.append(i)
+            return existing, metadata_only, replaced
+
+        # Unchanged texts are not embedded. Positions may be renumbered by a
+        # compaction while embedding, so the split is redone under the lock.
+        def _locked_split_sync():
+            with collection_data["lock"]:
+                return _split_sync()
+
+        loop = asyncio.get_event_loop()
+        _existing, _metadata_only, to_embed = await loop.run_in_executor(
+            self.executor, _locked_split_sync
+        )
+        embedded = {i: row for row, i in enumerate(to_embed)}
+        embeddings_np = None
+        if to_embed:
+            embeddings_np = await self._normalized_embeddings(
+                [documents[i] for i in to_embed],
+                None if embeddings is None else [embeddings[i] for i in to_embed],
+            )
+
+        def _upsert_sync():
+            with collection_data["lock"]:
+                existing, metadata_only, replaced = _split_sync()
+                if metadata_only:
+                    store.update_metadatas(
+                        [existing[ids[i]] for i in metadata_only],
+                        [metadatas[i] if metadatas else {} for i in metadata_only],
+                    )
+                if replaced:
+                    vectors = [embeddings_np[embedded[i]] for i in replaced if i in embedded]
+                    # Texts changed by a concurrent upsert since they were compared
+                    missing = [i for i in replaced if i not in embedded]
+                    if missing:
+                        late = self._embed_documents_sync([documents[i] for i in missing])
+                        late_rows = dict(zip(missing, late))
+                        vectors = [
+                            embeddings_np[embedded[i]] if i in embedded else late_rows[i]
+                            for i in replaced
+                        ]
+                    store.delete([existing[ids[i]] for i in replaced if ids[i] in existing])
+                    self._append_sync(
+                        collection_name,
+                        collection_data,
+                        [documents[i] for i in replaced],
+                        [metadatas[i] if metadatas else {} for i in replaced],
+                        [ids[i] for i in replaced],
+                        np.vstack(vectors),
+                    )
             logger.info(
-                f"Added {num_new_docs} documents to collection '{collection_name}'. Total: {faiss_index.ntotal}"
+                f"Upserted {len(latest)} documents in '{collection_name}' ({len(replaced)} embedded, {len(metadata_only)} metadata only)."
             )
             return True
 
-        return await loop.run_in_executor(self.executor, _add_to_faiss_sync)
+        result = await loop.run_in_executor(self.executor, _upsert_sync)
+        self._maybe_schedule_compaction(collection_name, collection_data)
+        return result
+
+    async def embed_query(self, query_text: str) -> List[float]:
+        """
+        Compute the (unnormalized) embedding of a query, served from the
+        process-wide query cache when possible.
+
+        Args:
+            query_text: Query text.
+
+        Returns:
+            Embedding vector.
+        """
+        return (await self.embed_queries([query_text]))[0]
+
+    async def embed_queries(self, query_texts: List[str]) -> List[List[float]]:
+        """
+        Compute (unnormalized) embeddings for several queries with one
+        embedding request for all cache misses.
+
+        Args:
+            query_texts: Query texts.
+
+        Returns:
+            One embedding per query, in order.
+        """
+        return await embed_queries_cached(
+            self.embedding_function, query_texts, self.executor
+        )
 
     async def search_documents(
         self,
@@ -388,144 +922,177 @@ class VectorDatabase:
         query_text: str,
         k: int = 5,
         where: Optional[Dict[str, Any]] = None,
+        query_embedding: Optional[List[float]] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
     ) -> List[Tuple[str, float]]:
         """
         Search for similar documents in a collection.
-        Uses a cache for recent query embeddings.
+        Query embeddings are served from the process-wide query cache.
 
         Args:
             collection_name: Name of the collection.
             query_text: Query text to search for.
             k: Number of results to return after filtering.
-            where: Optional metadata filter (simple equality checks).
+            where: Optional metadata equality filter, applied before the vector search.
+            query_embedding: Precomputed raw embedding of query_text (optional).
+            nprobe: IVF lists to probe, overrides the collection spec (optional).
+            ef_search: HNSW search breadth, overrides the collection spec (optional).
 
         Returns:
             List of tuples (document_text, similarity_score).
         """
+        results = await self.search_documents_batch(
+            collection_name,
+            [query_text],
+            k=k,
+            where=where,
+            query_embeddings=None if query_embedding is None else [query_embedding],
+            nprobe=nprobe,
+            ef_search=ef_search,
+        )
+        return results[0]
+
+    async def search_documents_batch(
+        self,
+        collection_name: str,
+        query_texts: List[str],
+        k: int = 5,
+        where: Optional[Dict[str, Any]] = None,
+        query_embeddings: Optional[List[List[float]]] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Search a collection for several queries at once: one embedding
+        request for the uncached queries and one FAISS search on the query matrix.
+
+        Args:
+            collection_name: Name of the collection.
+            query_texts: Query texts to search for.
+            k: Number of results to return per query after filtering.
+            where: Optional metadata equality filter, applied before the vector search.
+            query_embeddings: Precomputed raw embeddings of query_texts (optional).
+            nprobe: IVF lists to probe, overrides the collection spec (optional).
+            ef_search: HNSW search breadth, overrides the collection spec (optional).
+
+        Returns:
+            One list of (document_text, similarity_score) tuples per query.
+        """
+        if not query_texts:
+            return []
+
         collection_data = await self._get_or_load_collection_data(collection_name)
         if not collection_data or not collection_data.get("index"):
             logger.warning(
                 f"Collection '{collection_name}' does not exist or is empty."
             )
-            return []
+            return [[] for _ in query_texts]
 
         faiss_index = collection_data["index"]
         if faiss_index.ntotal == 0:
             logger.info(
                 f"Collection '{collection_name}' is empty. No documents to search."
             )
-            return []
+            return [[] for _ in query_texts]
 
         loop = asyncio.get_event_loop()
-        query_embedding_np: Optional[np.ndarray] = None  # Store as np.ndarray
-        found_in_cache = False
-
-        # Check cache (stores normalized embeddings as np.ndarray)
-        cached_entry = None
-        for q_text_cache, q_emb_cache_np in self.query_cache:
-            if q_text_cache == query_text:
-                cached_entry = (q_text_cache, q_emb_cache_np)
-                found_in_cache = True
-                break
-
-        if found_in_cache and cached_entry:
-            query_embedding_np = cached_entry[1]
-            self.query_cache.remove(cached_entry)  # Move to end (most recent)
-            self.query_cache.append(cached_entry)
-            logger.debug(f"Cache hit for query: '{query_text}'")
-        else:
-            logger.debug(f"Cache miss for query: '{query_text}'. Computing embedding.")
-            if not self.embedding_function:
-                raise ValueError("Embedding function is not initialized.")
-
-            def _generate_query_embedding_sync():
-                # Returns List[List[float]]
-                embedding_list_outer = self.embedding_function([query_text])
-                if not embedding_list_outer or not isinstance(
-                    embedding_list_outer[0], list
-                ):
-                    raise ValueError(
-                        f"Failed to compute embedding for query: {query_text}"
-                    )
-
-                emb_np = np.array(embedding_list_outer).astype("float32")
-                faiss.normalize_L2(emb_np)  # Normalize for IndexFlatIP
-                return emb_np  # Shape (1, dimension)
-
-            query_embedding_np = await loop.run_in_executor(
-                self.executor, _generate_query_embedding_sync
-            )
-            self.query_cache.append((query_text, query_embedding_np))
-            logger.debug(f"Cached new embedding for query: '{query_text}'")
+        if query_embeddings is None:
+            query_embeddings = await self.embed_queries(query_texts)
 
-        if query_embedding_np is None:  # Should not happen
-            raise ValueError("Failed to obtain query embedding.")
+        # The shared cache stores raw vectors; normalize for IndexFlatIP
+        query_matrix = np.array(query_embeddings).astype("float32")
+        faiss.normalize_L2(query_matrix)  # Shape (num_queries, dimension)
 
         def _perform_search_sync():
-            # Determine how many results to fetch from FAISS before filtering
-            # If 'where' is present, fetch more to have enough candidates after filtering.
-            k_to_fetch = k
-            if where:
-                # Heuristic: fetch more if filtering. Adjust multiplier as needed.
-                # Cap at total documents to avoid FAISS errors if k_to_fetch > ntotal
-                k_to_fetch = min(max(k * 5, k + 10), faiss_index.ntotal)
-
-            if (
-                k_to_fetch == 0 and faiss_index.ntotal > 0
-            ):  # if k=0, but index has items
-                k_to_fetch = 1  # faiss.search requires k > 0
-            elif k_to_fetch == 0 and faiss_index.ntotal == 0:
-                return []
-
-            # FAISS search: distances are inner products (similarities) for IndexFlatIP
-            raw_similarities, raw_faiss_indices = faiss_index.search(
-                query_embedding_np, k_to_fetch
-            )
-
-            # Squeeze results as search is for a single query vector
-            raw_similarities = raw_similarities[0]
-            raw_faiss_indices = raw_faiss_indices[0]
-
-            results: List[Tuple[str, float]] = []
-            doc_list = collection_data.get("documents", [])
-            meta_list = collection_data.get("metadatas", [])
-            idx_to_id_list = collection_data.get("idx_to_id", [])
-
-            for i, faiss_idx in enumerate(raw_faiss_indices):
-                if (
-                    faiss_idx == -1
-                ):  # FAISS can return -1 if fewer than k_to_fetch results exist
-                    continue
-
-                # Ensure faiss_idx is within bounds for safety
-                if not (
-                    0 <= faiss_idx < len(doc_list) and 0 <= faiss_idx < len(meta_list)
-                ):
-                    logger.warning(
-                        f"FAISS index {faiss_idx} out of bounds for loaded document/metadata lists in '{collection_name}'. Skipping."
+            with collection_data["lock"]:
+                return _search_locked()
+
+        def _search_locked():
+            # Re-read under the lock: compaction may have swapped the index
+            faiss_index = collection_data["index"]
+            store = collection_data["store"]
+            num_docs = len(store)
+            spec = collection_data["index_spec"]
+
+            if not where and not store.deleted_fraction:
+                # FAISS search: distances are inner products (similarities) for all index types
+                raw_similarities, raw_faiss_indices = faiss_index.search(
+                    query_matrix,
+                    max(k, 1),  # faiss.search requires k > 0
+                    params=search_parameters(faiss_index, spec, nprobe, ef_search),
+                )
+            else:
+                # Pre-filter through the metadata inverted index (tombstoned rows
+                # are never in it), so every query gets min(k, matches) correct results
+                allowed = store.filter_positions(where or {})
+                allowed = allowed[allowed < faiss_index.ntotal]
+                if not len(allowed) or k <= 0:
+                    return [[] for _ in query_texts]
+                if len(allowed) <= FILTER_BRUTE_FORCE_MAX:
+                    raw_similarities, raw_faiss_indices = exact_top_k(
+                        query_matrix,
+                        self._subset_vectors_sync(collection_name, collection_data, allowed),
+                        allowed,
+                        k,
                     )
-                    continue
-
-                doc_metadata = meta_list[faiss_idx]
+                else:
+                    bitmap = np.zeros(faiss_index.ntotal, dtype=bool)
+                    bitmap[allowed] = True
+                    bitmap = np.packbits(bitmap, bitorder="little")
+                    selector = faiss.IDSelectorBitmap(bitmap)
+                    k_to_fetch = min(k, len(allowed))
+                    raw_similarities, raw_faiss_indices = faiss_index.search(
+                        query_matrix,
+                        k_to_fetch,
+                        params=search_parameters(
+                            faiss_index, spec, nprobe, ef_search, selector
+                        ),
+                    )
+                    # ANN probing can miss matching rows; finish those queries exactly
+                    short_rows = np.flatnonzero((raw_faiss_indices >= 0).sum(axis=1) < k_to_fetch)
+                    if len(short_rows):
+                        exact_similarities, exact_indices = exact_top_k(
+                            query_matrix[short_rows],
+                            self._subset_vectors_sync(collection_name, collection_data, allowed),
+                            allowed,
+                            k_to_fetch,
+                        )
+                        raw_similarities[short_rows] = exact_similarities
+                        raw_faiss_indices[short_rows] = exact_indices
+
+            batch_hits: List[List[Tuple[int, float]]] = []
+            for row_similarities, row_indices in zip(raw_similarities, raw_faiss_indices):
+                hits: List[Tuple[int, float]] = []
+                for i, faiss_idx in enumerate(row_indices):
+                    if (
+                        faiss_idx == -1
+                    ):  # FAISS can return -1 if fewer than k_to_fetch results exist
+                        continue
 
-                if where:
-                    match = True
-                    for filter_key, filter_value in where.items():
-                        if doc_metadata.get(filter_key) != filter_value:
-                            match = False
-                            break
-                    if not match:
+                    # Ensure faiss_idx is within bounds for safety
+                    if not 0 <= faiss_idx < num_docs:
+                        logger.warning(
+                            f"FAISS index {faiss_idx} out of bounds for the document store of '{collection_name}'. Skipping."
+                        )
                         continue
 
-                document_text = doc_list[faiss_idx]
-                similarity_score = float(
-                    raw_similarities[i]
-                )  # Already a similarity for IndexFlatIP
-                results.append((document_text, similarity_score))
+                    similarity_score = float(
+                        row_similarities[i]
+                    )  # Already a similarity for IndexFlatIP
+                    hits.append((int(faiss_idx), similarity_score))
 
-                if len(results) >= k:
-                    break
-            return results
+                    if len(hits) >= k:
+                        break
+                batch_hits.append(hits)
+
+            # Read each hit's text once from the memory-mapped document file
+            hit_positions = sorted({p for hits in batch_hits for p, _ in hits})
+            texts = dict(zip(hit_positions, store.get_documents(hit_positions)))
+            batch_results: List[List[Tuple[str, float]]] = [
+                [(texts[p], score) for p, score in hits] for hits in batch_hits
+            ]
+            return batch_results
 
         return await loop.run_in_executor(self.executor, _perform_search_sync)
 
@@ -560,12 +1127,374 @@ class VectorDatabase:
             Number of documents in the collection.
         """
         collection_data = await self._get_or_load_collection_data(collection_name)
-        if collection_data and collection_data.get("index"):
-            return collection_data["index"].ntotal
-        elif collection_data:  # Exists but no index (empty)
-            return 0
+        if collection_data:  # Tombstoned documents are not counted
+            return collection_data["store"].live_count
         return 0  # Collection does not exist
 
+    async def get_document_ids(self, collection_name: str) -> List[str]:
+        """
+        Get the ids of all documents in a collection.
+
+        Args:
+            collection_name: Name of the collection.
+
+        Returns:
+            List of document ids (empty if the collection does not exist).
+        """
+        collection_data = await self._get_or_load_collection_data(collection_name)
+        if not collection_data:
+            return []
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, collection_data["store"].ids)
+
+    async def score_documents(
+        self, collection_name: str, ids: List[str], query_embedding: List[float]
+    ) -> List[Tuple[str, float]]:
+        """
+        Score given documents against a query exactly from their stored
+        vectors, without an index search.
+
+        Args:
+            collection_name: Name of the collection.
+            ids: Ids of the documents to score (unknown and deleted ids are skipped).
+            query_embedding: Raw query embedding.
+
+        Returns:
+            List of tuples (document_text, similarity_score), best first.
+        """
+        collection_data = await self._get_or_load_collection_data(collection_name)
+        if not collection_data or not collection_data.get("index") or not ids:
+            return []
+
+        query_matrix = np.array([query_embedding]).astype("float32")
+        faiss.normalize_L2(query_matrix)
+        loop = asyncio.get_event_loop()
+
+        def _score_sync():
+            with collection_data["lock"]:
+                store = collection_data["store"]
+                positions = np.array(
+                    sorted(set(store.positions_of(ids).values())), dtype="int64"
+                )
+                if not len(positions):
+                    return []
+                similarities, hit_positions = exact_top_k(
+                    query_matrix,
+                    self._subset_vectors_sync(collection_name, collection_data, positions),
+                    positions,
+                    len(positions),
+                )
+                texts = store.get_documents(hit_positions[0].tolist())
+                return [(text, float(score)) for text, score in zip(texts, similarities[0])]
+
+        return await loop.run_in_executor(self.executor, _score_sync)
+
+    async def delete_documents(self, collection_name: str, ids: List[str]) -> bool:
+        """
+        Delete documents from a collection by id. Deletes only record
+        tombstones, which searches skip; once the deleted fraction passes
+        COMPACT_THRESHOLD the collection is compacted in the background.
+
+        Args:
+            collection_name: Name of the collection.
+            ids: Ids of the documents to delete.
+
+        Returns:
+            bool: True if deleted, False if the collection does not exist.
+        """
+        collection_data = await self._get_or_load_collection_data(collection_name)
+        if not collection_data:
+            return False
+
+        loop = asyncio.get_event_loop()
+
+        def _delete_sync():
+            with collection_data["lock"]:
+                store = collection_data["store"]
+                positions = sorted(set(store.positions_of(ids).values()))
+                if positions:
+                    store.delete(positions)
+                    logger.info(
+                        f"Deleted {len(positions)} documents from collection '{collection_name}'."
+                    )
+            return True
+
+        result = await loop.run_in_executor(self.executor, _delete_sync)
+        self._maybe_schedule_compaction(collection_name, collection_data)
+        return result
+
+    def _maybe_schedule_compaction(self, collection_name: str, collection_data: Dict[str, Any]):
+        if collection_data["store"].deleted_fraction <= COMPACT_THRESHOLD:
+            return
+        running = self._compactions.get(collection_name)
+        if running is not None and not running.done():
+            return
+
+        def _on_done(future):
+            if self._compactions.get(collection_name) is future:
+                del self._compactions[collection_name]
+            if future.exception() is not None:
+                logger.error(
+                    f"Background compaction of '{collection_name}' failed: {future.exception()}"
+                )
+
+        future = self.executor.submit(self._compact_sync, collection_name, collection_data)
+        self._compactions[collection_name] = future
+        future.add_done_callback(_on_done)
+
+    def _compact_sync(self, collection_name: str, collection_data: Dict[str, Any]) -> int:
+        """
+        Drop tombstoned rows from the index and the store, renumbering positions.
+        The compacted index and vector file are written aside and moved into
+        place together with the store's files (see DocumentStore.rewrite), so
+        an interrupted compaction never leaves them with different rows.
+        """
+        with collection_data["lock"]:
+            store = collection_data["store"]
+            if not store.deleted_fraction:
+                return 0
+            keep = store.live_positions()
+            removed = len(store) - len(keep)
+            _collection_dir, index_file, _data_file = self._get_collection_paths(collection_name)
+            replacements = {}
+            faiss_index = collection_data.get("index")
+            if faiss_index is not None:
+                self._ensure_writable_sync(collection_name, collection_data)
+                compacted = faiss.clone_index(collection_data["index"])
+                if collection_data["index_spec"]["type"] == "flat":
+                    dead = np.setdiff1d(np.arange(len(store), dtype="int64"), keep)
+                    compacted.remove_ids(dead)  # IndexFlat shifts the remaining rows down
+                else:
+                    # ANN indexes do not renumber on removal; refill while keeping the training
+                    vectors = self._subset_vectors_sync(collection_name, collection_data, keep)
+                    vectors_file = self._vectors_file(collection_name)
+                    with open(vectors_file + ".compact", "wb") as f:
+                        f.write(np.ascontiguousarray(vectors, dtype="<f4").tobytes())
+                    replacements[vectors_file + ".compact"] = vectors_file
+                    compacted.reset()
+                    if len(vectors):
+                        compacted.add(vectors)
+                faiss.write_index(compacted, index_file + ".compact")
+                replacements[index_file + ".compact"] = index_file
+            store.rewrite(keep.tolist(), replacements)
+            if faiss_index is not None:
+                collection_data["index"], collection_data["mmapped"] = read_index(index_file, USE_MMAP)
+            self._save_collection_data_sync(collection_name, collection_data)
+            logger.info(f"Compacted '{collection_name}': removed {removed} deleted documents.")
+            return removed
+
+    async def compact_collection(self, collection_name: str) -> int:
+        """
+        Compact a collection now, waiting for a running background compaction first.
+
+        Args:
+            collection_name: Name of the collection.
+
+        Returns:
+            Number of deleted documents removed.
+        """
+        collection_data = await self._get_or_load_collection_data(collection_name)
+        if not collection_data:
+            return 0
+        running = self._compactions.get(collection_name)
+        if running is not None:
+            await asyncio.wrap_future(running)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, self._compact_sync, collection_name, collection_data
+        )
+
+    async def update_metadatas(
+        self, collection_name: str, ids: List[str], metadatas: List[Dict[str, Any]]
+    ) -> bool:
+        """
+        Update the metadata of existing documents without re-embedding them.
+        Keys are merged into the stored metadata, as ChromaDB does.
+
+        Args:
+            collection_name: Name of the collection.
+            ids: Ids of the documents to update.
+            metadatas: New metadata for each document.
+
+        Returns:
+            bool: True if updated, False if the collection does not exist.
+        """
+        collection_data = await self._get_or_load_collection_data(collection_name)
+        if not collection_data:
+            return False
+
+        loop = asyncio.get_event_loop()
+
+        def _update_sync():
+            with collection_data["lock"]:
+                return _update_locked()
+
+        def _update_locked():
+            store = collection_data["store"]
+            id_to_position = store.positions_of(ids)
+            updates = [
+                (id_to_position[doc_id], metadata)
+                for doc_id, metadata in zip(ids, metadatas)
+                if doc_id in id_to_position
+            ]
+            positions = [position for position, _ in updates]
+            merged = [
+                {**current, **(metadata or {})}
+                for current, (_, metadata) in zip(store.get_metadatas(positions), updates)
+            ]
+            store.update_metadatas(positions, merged)
+            return True
+
+        return await loop.run_in_executor(self.executor, _update_sync)
+
+    async def get_collection_metadata(
+        self, collection_name: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Get the metadata of a collection.
+
+        Args:
+            collection_name: Name of the collection.
+
+        Returns:
+            Metadata dict or None if the collection does not exist.
+        """
+        collection_data = await self._get_or_load_collection_data(collection_name)
+        if not collection_data:
+            return None
+        return dict(collection_data.get("collection_metadata") or {})
+
+    async def update_collection_metadata(
+        self, collection_name: str, metadata: Dict[str, Any]
+    ) -> bool:
+        """
+        Replace the metadata of a collection.
+
+        Args:
+            collection_name: Name of the collection.
+            metadata: New metadata.
+
+        Returns:
+            bool: True if updated, False if the collection does not exist.
+        """
+        collection_data = await self._get_or_load_collection_data(collection_name)
+        if not collection_data:
+            return False
+
+        loop = asyncio.get_event_loop()
+
+        def _modify_sync():
+            collection_data["collection_metadata"] = dict(metadata)
+            self._save_collection_data_sync(collection_name, collection_data)
+            return True
+
+        return await loop.run_in_executor(self.executor, _modify_sync)
+
+    async def export_collection(self, collection_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Export everything needed to rebuild a collection elsewhere without
+        re-embedding. Vectors are the stored (L2-normalized) ones.
+
+        Args:
+            collection_name: Name of the collection.
+
+        Returns:
+            Dict with metadata, ids, documents, metadatas and embeddings,
+            or None if the collection does not exist.
+        """
+        collection_data = await self._get_or_load_collection_data(collection_name)
+        if not collection_data:
+            return None
+
+        loop = asyncio.get_event_loop()
+
+        def _export_sync():
+            with collection_data["lock"]:
+                return _export_locked()
+
+        def _export_locked():
+            store = collection_data["store"]
+            positions = store.live_positions()
+            embeddings = (
+                self._subset_vectors_sync(collection_name, collection_data, positions).tolist()
+                if len(positions)
+                else []
+            )
+            positions = positions.tolist()
+            return {
+                "metadata": dict(collection_data.get("collection_metadata") or {}),
+                "ids": store.ids(),
+                "documents": store.get_documents(positions),
+                "metadatas": store.get_metadatas(positions),
+                "embeddings": embeddings,
+            }
+
+        return await loop.run_in_executor(self.executor, _export_sync)
+
+    async def get_index_spec(self, collection_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the index spec of a collection together with the type actually built.
+
+        Args:
+            collection_name: Name of the collection.
+
+        Returns:
+            Spec dict with an extra ``built`` key, or None if the collection does not exist.
+        """
+        collection_data = await self._get_or_load_collection_data(collection_name)
+        if not collection_data:
+            return None
+        faiss_index = collection_data.get("index")
+        return {
+            **collection_data["index_spec"],
+            "built": index_type_of(faiss_index) if faiss_index is not None else None,
+        }
+
+    async def rebuild_index(
+        self, collection_name: str, index_spec: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Rebuild a collection's index from its stored vectors, optionally
+        switching to a new index spec. IVF indexes are retrained, so this is
+        also how nlist follows a grown collection.
+
+        Args:
+            collection_name: Name of the collection.
+            index_spec: Keys overriding the current spec (optional).
+
+        Returns:
+            bool: True if rebuilt, False if the collection does not exist.
+        """
+        collection_data = await self._get_or_load_collection_data(collection_name)
+        if not collection_data:
+            return False
+
+        spec = resolve_index_spec({**collection_data["index_spec"], **(index_spec or {})})
+        loop = asyncio.get_event_loop()
+
+        def _rebuild_sync():
+            with collection_data["lock"]:
+                return _rebuild_locked()
+
+        def _rebuild_locked():
+            self._compact_sync(collection_name, collection_data)
+            # A copy, as the file read from is replaced or removed below
+            vectors = np.array(self._load_vectors_sync(collection_name, collection_data))
+            collection_data["index_spec"] = spec
+            self._save_vectors_sync(collection_name, collection_data, vectors)
+            if spec["type"] == "flat" and os.path.exists(self._vectors_file(collection_name)):
+                os.remove(self._vectors_file(collection_name))
+            if len(vectors):
+                collection_data["index"] = build_index(spec, np.ascontiguousarray(vectors))
+                collection_data["mmapped"] = False
+            self._save_collection_data_sync(collection_name, collection_data)
+            logger.info(
+                f"Rebuilt index of '{collection_name}' as {spec['type']} with {len(vectors)} vectors."
+            )
+            return True
+
+        return await loop.run_in_executor(self.executor, _rebuild_sync)
+
     def __del__(self):
         """Cleanup executor on deletion."""
         if hasattr(self, "executor") and self.executor:
@@ -0,0 +1,246 @@
+"""
+Vector store backend registry.
+
+The backend is selected by deployment config (RAG_VECTOR_BACKEND) and every
+backend module exposes a ``VectorDatabase`` class with the same async
+interface. Backend modules are imported lazily so that FAISS is only needed
+when it is actually selected.
+
+Run as a module to copy collections between backends without re-embedding,
+to rebuild FAISS indexes with another index spec, or to build the BM25
+lexical indexes of collections ingested before they existed:
+
+    python -m rag.utils.vector_store migrate --source chroma --target faiss
+    python -m rag.utils.vector_store rebuild --type hnsw --collections kb1 kb2
+    python -m rag.utils.vector_store lexical --backend faiss
+"""
+
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# backend name -> (module path, default persist directory)
+VECTOR_BACKENDS = {
+    "chroma": ("rag.utils.vector_db", "./data/chroma"),
+    "faiss": ("rag.utils.vector_db_rebuild", "./data/faiss_db"),
+}
+
+VECTOR_BACKEND = os.environ.get("RAG_VECTOR_BACKEND", "chroma").lower()
+VECTOR_DB_PATH = os.environ.get("RAG_VECTOR_DB_PATH")  # unset uses the backend default
+
+
+def _resolve_backend(backend: Optional[str]) -> str:
+    name = (backend or VECTOR_BACKEND).lower()
+    if name not in VECTOR_BACKENDS:
+        raise ValueError(
+            f"Unknown vector backend '{name}'. Available: {', '.join(VECTOR_BACKENDS)}"
+        )
+    return name
+
+
+def get_backend_class(backend: Optional[str] = None):
+    """
+    Get the VectorDatabase class of a backend.
+
+    Args:
+        backend: Backend name, defaults to the configured one
+
+    Returns:
+        The backend's VectorDatabase class
+    """
+    module_path, _ = VECTOR_BACKENDS[_resolve_backend(backend)]
+    return importlib.import_module(module_path).VectorDatabase
+
+
+def default_persist_directory(backend: Optional[str] = None) -> str:
+    """
+    Persist directory used when none is given: RAG_VECTOR_DB_PATH for the
+    configured backend, otherwise the backend's own default.
+    """
+    name = _resolve_backend(backend)
+    if VECTOR_DB_PATH and name == VECTOR_BACKEND:
+        return VECTOR_DB_PATH
+    return VECTOR_BACKENDS[name][1]
+
+
+def create_vector_database(
+    persist_directory: Optional[str] = None,
+    backend: Optional[str] = None,
+    embedding_function=None,
+):
+    """
+    Instantiate the vector database of a backend (not yet initialized).
+
+    Args:
+        persist_directory: Directory to persist the database (optional)
+        backend: Backend name, defaults to RAG_VECTOR_BACKEND
+        embedding_function: Custom embedding function (optional)
+
+    Returns:
+        VectorDatabase instance
+    """
+    cls = get_backend_class(backend)
+    return cls(
+        persist_directory=persist_directory or default_persist_directory(backend),
+        embedding_function=embedding_function,
+    )
+
+
+async def migrate_collections(
+    source,
+    target,
+    collections: Optional[List[str]] = None,
+    overwrite: bool = False,
+) -> Dict[str, int]:
+    """
+    Copy collections with their stored vectors from one vector database to
+    another. Nothing is re-embedded.
+
+    Args:
+        source: Initialized source VectorDatabase
+        target: Initialized target VectorDatabase
+        collections: Collection names to copy, defaults to all
+        overwrite: Replace collections that already exist in the target
+
+    Returns:
+        Number of copied documents per migrated collection
+    """
+    names = collections or await source.list_collections()
+    existing = set(await target.list_collections())
+    migrated = {}
+    for name in names:
+        if name in existing:
+            if not overwrite:
+                logger.warning(f"Collection '{name}' already exists in target, skipped")
+                continue
+            await target.delete_collection(name)
+
+        exported = await source.export_collection(name)
+        if exported is None:
+            logger.warning(f"Collection '{name}' does not exist in source, skipped")
+            continue
+
+        await target.create_collection(name, metadata=exported["metadata"] or None)
+        if exported["ids"]:
+            await target.add_documents(
+                name,
+                exported["documents"],
+                # ChromaDB rejects empty metadata dicts
+                metadatas=[m or None for m in exported["metadatas"]],
+                ids=exported["ids"],
+                embeddings=exported["embeddings"],
+            )
+        migrated[name] = len(exported["ids"])
+        logger.info(f"Migrated {len(exported['ids'])} documents of collection '{name}'")
+    return migrated
+
+
+async def sync_lexical_indexes(
+    vector_db, lexical_index, collections: Optional[List[str]] = None
+) -> Dict[str, int]:
+    """
+    Bring the BM25 indexes of collections in line with the vector database.
+
+    Args:
+        vector_db: Initialized VectorDatabase
+        lexical_index: Initialized LexicalIndex
+        collections: Collection names, defaults to all
+
+    Returns:
+        Number of indexed documents per collection
+    """
+    synced = {}
+    for name in collections or await vector_db.list_collections():
+        exported = await vector_db.export_collection(name)
+        if exported is None:
+            logger.warning(f"Collection '{name}' does not exist, skipped")
+            continue
+        added, removed = await lexical_index.sync_collection(
+            name, exported["documents"], exported["ids"]
+        )
+        synced[name] = len(exported["ids"])
+        logger.info(f"Lexical index of '{name}': {added} added, {removed} removed")
+    return synced
+
+
+async def _migrate(args) -> None:
+    source = create_vector_database(args.source_path, backend=args.source)
+    target = create_vector_database(args.target_path, backend=args.target)
+    await source.initialize()
+    await target.initialize()
+    migrated = await migrate_collections(
+        source, target, collections=args.collections, overwrite=args.overwrite
+    )
+    print(f"Migrated {len(migrated)} collections, {sum(migrated.values())} documents")
+
+
+async def _rebuild(args) -> None:
+    db = create_vector_database(args.path, backend="faiss")
+    await db.initialize()
+    index_spec = {
+        key: value
+        for key, value in (
+            ("type", args.type),
+            ("nlist", args.nlist),
+            ("min_train_size", args.min_train_size),
+            ("pq_m", args.pq_m),
+            ("nprobe", args.nprobe),
+            ("ef_search", args.ef_search),
+        )
+        if value is not None
+    }
+    for name in args.collections or await db.list_collections():
+        await db.rebuild_index(name, index_spec)
+        print(f"{name}: {await db.get_index_spec(name)}")
+
+
+async def _lexical(args) -> None:
+    from rag.utils.lexical_index import LexicalIndex
+
+    db = create_vector_database(args.path, backend=args.backend)
+    lexical_index = LexicalIndex(args.lexical_path)
+    await db.initialize()
+    await lexical_index.initialize()
+    synced = await sync_lexical_indexes(db, lexical_index, collections=args.collections)
+    print(f"Synced lexical indexes of {len(synced)} collections, {sum(synced.values())} documents")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Vector store maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser("migrate", help="Copy collections between backends without re-embedding")
+    migrate.add_argument("--source", required=True, choices=list(VECTOR_BACKENDS))
+    migrate.add_argument("--target", required=True, choices=list(VECTOR_BACKENDS))
+    migrate.add_argument("--source-path", help="Source persist directory")
+    migrate.add_argument("--target-path", help="Target persist directory")
+    migrate.add_argument("--collections", nargs="*", help="Collections to copy (default: all)")
+    migrate.add_argument("--overwrite", action="store_true", help="Replace existing target collections")
+    migrate.set_defaults(func=_migrate)
+
+    rebuild = commands.add_parser("rebuild", help="Rebuild FAISS indexes, optionally with a new index spec")
+    rebuild.add_argument("--path", help="FAISS persist directory")
+    rebuild.add_argument("--collections", nargs="*", help="Collections to rebuild (default: all)")
+    rebuild.add_argument("--type", choices=["flat", "ivf_flat", "ivf_pq", "hnsw"])
+    rebuild.add_argument("--nlist", type=int)
+    rebuild.add_argument("--min-train-size", type=int)
+    rebuild.add_argument("--pq-m", type=int)
+    rebuild.add_argument("--nprobe", type=int)
+    rebuild.add_argument("--ef-search", type=int)
+    rebuild.set_defaults(func=_rebuild)
+
+    lexical = commands.add_parser("lexical", help="Build BM25 lexical indexes from stored documents")
+    lexical.add_argument("--backend", choices=list(VECTOR_BACKENDS))
+    lexical.add_argument("--path", help="Vector database persist directory")
+    lexical.add_argument("--lexical-path", help="Lexical index directory")
+    lexical.add_argument("--collections", nargs="*", help="Collections to index (default: all)")
+    lexical.set_defaults(func=_lexical)
+
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
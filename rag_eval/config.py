@@ -0,0 +1,116 @@
+import json
+import os
+import typing as t
+from dataclasses import dataclass, asdict, fields, replace
+
+from ragas.run_config import RunConfig
+
+from logger import logger
+
+# 部署级评估配置文件，格式：
+# {"default": {"max_workers": 8}, "metrics": {"Faithfulness": {"timeout": 300}}}
+EVAL_CONFIG_PATH = os.environ.get("RAG_EVAL_CONFIG", "data/eval_config.json")
+
+# 环境变量覆盖全局默认值
+ENV_OVERRIDES = {
+    "max_workers": "RAG_EVAL_MAX_WORKERS",
+    "timeout": "RAG_EVAL_TIMEOUT",
+    "max_retries": "RAG_EVAL_MAX_RETRIES",
+    "max_wait": "RAG_EVAL_MAX_WAIT",
+    "batch_size": "RAG_EVAL_BATCH_SIZE",
+}
+
+
+@dataclass
+class EvalRunSettings:
+    max_workers: int = 16  # 并发请求数
+    timeout: int = 180  # 单次调用超时（秒）
+    max_retries: int = 10
+    max_wait: int = 60  # 重试之间的最长等待（秒）
+    batch_size: t.Optional[int] = None  # None表示不分批
+
+    def to_run_config(self) -> RunConfig:
+        return RunConfig(
+            timeout=self.timeout,
+            max_retries=self.max_retries,
+            max_wait=self.max_wait,
+            max_workers=self.max_workers,
+        )
+
+
+# 各指标的默认参数：
+# 不调用大模型的指标可以放开并发；单条样本需要多轮大模型调用的指标降低并发、放宽超时
+METRIC_DEFAULTS: dict[str, dict] = {
+    "NonLLMContextPrecisionWithReference": {"max_workers": 32, "timeout": 60},
+    "NonLLMContextRecall": {"max_workers": 32, "timeout": 60},
+    "NonLLMStringSimilarity": {"max_workers": 32, "timeout": 60},
+    "BleuScore": {"max_workers": 32, "timeout": 60},
+    "RougeScore": {"max_workers": 32, "timeout": 60},
+    "ExactMatch": {"max_workers": 32, "timeout": 60},
+    "StringPresence": {"max_workers": 32, "timeout": 60},
+    "SemanticSimilarity": {"max_workers": 16, "timeout": 60, "batch_size": 64},
+    "ResponseRelevancy": {"max_workers": 8, "batch_size": 32},
+    "LLMContextPrecisionWithoutReference": {"max_workers": 8},
+    "LLMContextPrecisionWithReference": {"max_workers": 8},
+    "LLMContextRecall": {"max_workers": 8},
+    "ContextEntityRecall": {"max_workers": 8},
+    "AnswerAccuracy": {"max_workers": 8},
+    "ContextRelevance": {"max_workers": 8},
+    "ResponseGroundedness": {"max_workers": 8},
+    "Faithfulness": {"max_workers": 6, "timeout": 240},
+    "FaithfulnesswithHHEM": {"max_workers": 4, "timeout": 300},
+    "NoiseSensitivity": {"max_workers": 4, "timeout": 300},
+    "FactualCorrectness": {"max_workers": 4, "timeout": 300},
+    "SummarizationScore": {"max_workers": 4, "timeout": 300},
+}
+
+_config_cache = {"mtime": None, "data": {}}
+
+
+def _valid_overrides(values: dict) -> dict:
+    names = {f.name for f in fields(EvalRunSettings)}
+    return {k: v for k, v in values.items() if k in names}
+
+
+def load_eval_config() -> dict:
+    """读取部署配置文件，文件修改后自动重新加载"""
+    try:
+        mtime = os.path.getmtime(EVAL_CONFIG_PATH)
+    except OSError:
+        return {}
+    if _config_cache["mtime"] != mtime:
+        try:
+            with open(EVAL_CONFIG_PATH, "r", encoding="utf-8") as f:
+                _config_cache["data"] = json.load(f)
+        except Exception as e:
+            logger.error("Failed to load eval config {}: {}".format(EVAL_CONFIG_PATH, e))
+            _config_cache["data"] = {}
+        _config_cache["mtime"] = mtime
+    return _config_cache["data"]
+
+
+def _env_overrides() -> dict:
+    values = {}
+    for name, env in ENV_OVERRIDES.items():
+        value = os.environ.get(env)
+        if value:
+            values[name] = int(value)
+    return values
+
+
+def get_run_settings(metric_name: str) -> EvalRunSettings:
+    """
+    计算指标的实际运行参数，优先级从低到高：
+    内置默认值 < 指标默认值 < 部署默认值(环境变量、配置文件default) < 配置文件中该指标的设置
+    """
+    config = load_eval_config()
+    settings = EvalRunSettings()
+    settings = replace(settings, **METRIC_DEFAULTS.get(metric_name, {}))
+    settings = replace(settings, **_env_overrides())
+    settings = replace(settings, **_valid_overrides(config.get("default", {})))
+    settings = replace(settings, **_valid_overrides(config.get("metrics", {}).get(metric_name, {})))
+    return settings
+
+
+def get_effective_settings(metric_names: t.List[str]) -> dict:
+    return {name: asdict(get_run_settings(name)) for name in metric_names}
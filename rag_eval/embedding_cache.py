@@ -0,0 +1,129 @@
+import hashlib
+import os
+import threading
+import time
+import typing as t
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from ragas.embeddings import LangchainEmbeddingsWrapper
+from ragas.run_config import RunConfig
+
+from logger import logger
+from models.Task import RAGEmbeddingCache
+from models.database import SessionLocal
+
+# 缓存条目上限，超过后按最近使用时间淘汰
+EMBEDDING_CACHE_SIZE = int(os.environ.get("RAG_EVAL_EMBEDDING_CACHE_SIZE", 100000))
+
+
+def _text_hash(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """持久化的 文本哈希 -> 向量 缓存，按LRU淘汰，所有评估共用"""
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_SIZE, session_factory=SessionLocal):
+        self.max_entries = max_entries
+        self.session_factory = session_factory
+        self.lock = threading.Lock()
+
+    def get_many(self, model: str, texts: t.List[str]) -> t.List[t.Optional[t.List[float]]]:
+        """按顺序返回每条文本的缓存向量，未命中为None"""
+        hashes = [_text_hash(model, text) for text in texts]
+        unique_hashes = list(set(hashes))
+        db = self.session_factory()
+        try:
+            rows = []
+            # 分批查询，避免超过SQLite的参数数量限制
+            for i in range(0, len(unique_hashes), 500):
+                rows.extend(db.query(RAGEmbeddingCache).filter(
+                    RAGEmbeddingCache.text_hash.in_(unique_hashes[i:i + 500])).all())
+            found = {row.text_hash: row for row in rows}
+            now = int(time.time() * 1000)
+            for row in rows:
+                row.last_used = now
+            if rows:
+                db.commit()
+            return [
+                np.frombuffer(found[h].vector, dtype=np.float32).tolist() if h in found else None
+                for h in hashes
+            ]
+        finally:
+            db.close()
+
+    def set_many(self, model: str, texts: t.List[str], vectors: t.List[t.List[float]]):
+        """写入向量，并在超过上限时淘汰最久未使用的条目"""
+        with self.lock:
+            db = self.session_factory()
+            try:
+                now = int(time.time() * 1000)
+                for text, vector in zip(texts, vectors):
+                    db.merge(RAGEmbeddingCache(
+                        text_hash=_text_hash(model, text),
+                        model=model,
+                        vector=np.asarray(vector, dtype=np.float32).tobytes(),
+                        last_used=now,
+                    ))
+                db.commit()
+                self._evict(db)
+            except Exception as e:
+                logger.error("Embedding cache write failed: {}".format(e))
+                db.rollback()
+            finally:
+                db.close()
+
+    def _evict(self, db):
+        overflow = db.query(RAGEmbeddingCache).count() - self.max_entries
+        if overflow <= 0:
+            return
+        stale = [h for (h,) in db.query(RAGEmbeddingCache.text_hash)
+                 .order_by(RAGEmbeddingCache.last_used.asc())
+                 .limit(overflow)
+                 .all()]
+        for i in range(0, len(stale), 500):
+            db.query(RAGEmbeddingCache).filter(
+                RAGEmbeddingCache.text_hash.in_(stale[i:i + 500])).delete(synchronize_session=False)
+        db.commit()
+
+
+embedding_cache = EmbeddingCache()
+
+
+class CachedEmbeddingsWrapper(LangchainEmbeddingsWrapper):
+    """ragas嵌入包装器，先查缓存，只对未命中的文本调用嵌入接口"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache = embedding_cache,
+                 run_config: t.Optional[RunConfig] = None):
+        super().__init__(embeddings, run_config=run_config)
+        self.embedding_cache = cache
+        self.model_name = str(getattr(embeddings, "model", type(embeddings).__name__))
+
+    def _lookup(self, texts: t.List[str]):
+        vectors = self.embedding_cache.get_many(self.model_name, texts)
+        # 去重，同一文本只嵌入一次
+        missing = list(dict.fromkeys(text for text, v in zip(texts, vectors) if v is None))
+        return vectors, missing
+
+    def _merge(self, texts, vectors, missing, computed):
+        if missing:
+            self.embedding_cache.set_many(self.model_name, missing, computed)
+        fresh = dict(zip(missing, computed))
+        return [v if v is not None else fresh[text] for text, v in zip(texts, vectors)]
+
+    def embed_query(self, text: str) -> t.List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts: t.List[str]) -> t.List[t.List[float]]:
+        vectors, missing = self._lookup(texts)
+        computed = self.embeddings.embed_documents(missing) if missing else []
+        return self._merge(texts, vectors, missing, computed)
+
+    async def aembed_query(self, text: str) -> t.List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    async def aembed_documents(self, texts: t.List[str]) -> t.List[t.List[float]]:
+        vectors, missing = self._lookup(texts)
+        computed = await self.embeddings.aembed_documents(missing) if missing else []
+        return self._merge(texts, vectors, missing, computed)
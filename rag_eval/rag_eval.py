@@ -13,6 +13,7 @@ from ragas.llms import LangchainLLMWrapper
 import ast
 from models.Task import RAGEvaluation, OutputFile
 from rag_eval.utils import *
+from rag_eval.score_store import save_eval_row_scores
 
 def process_rag(eval: RAGEvaluation, db,user_id):
     print("here is processing")
@@ -100,6 +101,7 @@ def process_rag(eval: RAGEvaluation, db,user_id):
         df.to_csv(file_path, index=False)
         file_size = os.path.getsize(file_path)
         output_file.size = file_size
+        save_eval_row_scores(db, eval, last_column.tolist())
         db.commit()
         db.close()
         eval.output_id = output_id
@@ -137,22 +139,22 @@ def set_environment():
 
 
 def rag_metric_list() -> list[dict]:
-    return [{'name': '基于大模型的无参考上下文准确性', 'description': '使用大模型评估Rag上下文的准确性，没有参考答案'},
-            {'name': '基于大模型的有参考上下文准确性', 'description': '使用大模型评估Rag上下文的准确性，拥有参考答案'},
-            {'name': '有参考上下文准确性', 'description': '评估Rag上下文的准确性，拥有参考答案'},
-            {'name': '基于大模型的上下文召回率', 'description': '使用大模型评估Rag上下文的召回率'},
-            {'name': '上下文召回率', 'description': '评估Rag上下文的召回率'},
-            {'name': '上下文实体召回率', 'description': '评估Rag上下文实体的召回率'},
-            {'name': '噪声敏感度', 'description': '评估Rag系统的噪声敏感度'},
-            {'name': '回答相关性', 'description': '评估Rag的回答与上下文的相关性'},
-            {'name': '置信度', 'description': '评估Rag的回答与上下文的置信度'},
-            {'name': '带幻觉检测的置信度', 'description': '评估置信度，同时考虑幻觉'},
-            {'name': '回答准确率', 'description': '评估Rag回答的准确率'},
-            {'name': '上下文相关性', 'description': '评估上下文与输入之间的相关性'},
-            {'name': '响应扎根性', 'description': '评估回答与上下文之间的扎根性'},
-            {'name': '事实准确性', 'description': '根据参考评估回答的准确性'},
-            {'name': '语义相似性', 'description': '评估回答与参考之间的语义相似性'},
-            {'name': '字符串相似度', 'description': '评估回答与参考之间的字符串相似度'},
-            {'name': 'Bleu分数', 'description': '评估回答与参考之间的Bleu分数'},
-            {'name': 'Rouge分数', 'description': '评估回答与参考之间的Rouge分数'},
-            {'name': '摘要得分', 'description': '评估回答从上下文中获取关键信息的能力'}]
+    return [{'name': '基于大模型的无参考上下文准确性', 'metric': 'LLMContextPrecisionWithoutReference', 'description': '使用大模型评估Rag上下文的准确性，没有参考答案'},
+            {'name': '基于大模型的有参考上下文准确性', 'metric': 'LLMContextPrecisionWithReference', 'description': '使用大模型评估Rag上下文的准确性，拥有参考答案'},
+            {'name': '有参考上下文准确性', 'metric': 'NonLLMContextPrecisionWithReference', 'description': '评估Rag上下文的准确性，拥有参考答案'},
+            {'name': '基于大模型的上下文召回率', 'metric': 'LLMContextRecall', 'description': '使用大模型评估Rag上下文的召回率'},
+            {'name': '上下文召回率', 'metric': 'NonLLMContextRecall', 'description': '评估Rag上下文的召回率'},
+            {'name': '上下文实体召回率', 'metric': 'ContextEntityRecall', 'description': '评估Rag上下文实体的召回率'},
+            {'name': '噪声敏感度', 'metric': 'NoiseSensitivity', 'description': '评估Rag系统的噪声敏感度'},
+            {'name': '回答相关性', 'metric': 'ResponseRelevancy', 'description': '评估Rag的回答与上下文的相关性'},
+            {'name': '置信度', 'metric': 'Faithfulness', 'description': '评估Rag的回答与上下文的置信度'},
+            {'name': '带幻觉检测的置信度', 'metric': 'FaithfulnesswithHHEM', 'description': '评估置信度，同时考虑幻觉'},
+            {'name': '回答准确率', 'metric': 'AnswerAccuracy', 'description': '评估Rag回答的准确率'},
+            {'name': '上下文相关性', 'metric': 'ContextRelevance', 'description': '评估上下文与输入之间的相关性'},
+            {'name': '响应扎根性', 'metric': 'ResponseGroundedness', 'description': '评估回答与上下文之间的扎根性'},
+            {'name': '事实准确性', 'metric': 'FactualCorrectness', 'description': '根据参考评估回答的准确性'},
+            {'name': '语义相似性', 'metric': 'SemanticSimilarity', 'description': '评估回答与参考之间的语义相似性'},
+            {'name': '字符串相似度', 'metric': 'NonLLMStringSimilarity', 'description': '评估回答与参考之间的字符串相似度'},
+            {'name': 'Bleu分数', 'metric': 'BleuScore', 'description': '评估回答与参考之间的Bleu分数'},
+            {'name': 'Rouge分数', 'metric': 'RougeScore', 'description': '评估回答与参考之间的Rouge分数'},
+            {'name': '摘要得分', 'metric': 'SummarizationScore', 'description': '评估回答从上下文中获取关键信息的能力'}]
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import math
+import time
+import typing as t
+
+from logger import logger
+from models.Task import RAGRowScore, EvalRowScore
+from models.database import SessionLocal
+
+
+def model_identifier(component) -> t.Optional[str]:
+    """ragas包装的评估LLM或嵌入模型的模型名，取不到时用类名"""
+    if component is None:
+        return None
+    inner = getattr(component, "langchain_llm", None) or getattr(component, "embeddings", None) or component
+    name = getattr(inner, "model_name", None) or getattr(inner, "model", None)
+    return str(name) if isinstance(name, str) else type(inner).__name__
+
+
+def row_fingerprint(metric: str, sample: dict, models: t.Optional[dict] = None) -> str:
+    """
+    (指标, 评估所用模型, user_input, response, reference, contexts...) 的指纹，字段顺序无关
+    更换评估LLM或嵌入模型后指纹随之变化，不会复用旧模型的得分
+    """
+    payload = json.dumps({"metric": metric, "models": models or {}, "sample": sample},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RowScoreStore:
+    """按行指纹保存指标得分，重新上传的数据集只需评估新增或修改的行"""
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    def get_many(self, fingerprints: t.List[str]) -> t.Dict[str, float]:
+        unique = list(set(fingerprints))
+        db = self.session_factory()
+        try:
+            scores = {}
+            # 分批查询，避免超过SQLite的参数数量限制
+            for i in range(0, len(unique), 500):
+                rows = db.query(RAGRowScore.fingerprint, RAGRowScore.score).filter(
+                    RAGRowScore.fingerprint.in_(unique[i:i + 500])).all()
+                scores.update({fp: score for fp, score in rows})
+            return scores
+        finally:
+            db.close()
+
+    def set_many(self, metric: str, scores: t.Dict[str, float]):
+        db = self.session_factory()
+        try:
+            now = int(time.time())
+            for fp, score in scores.items():
+                db.merge(RAGRowScore(fingerprint=fp, metric=metric, score=score, created=now))
+            db.commit()
+        except Exception as e:
+            logger.error("Row score write failed: {}".format(e))
+            db.rollback()
+        finally:
+            db.close()
+
+
+row_score_store = RowScoreStore()
+
+
+def save_eval_row_scores(db, eval, scores: t.List[float]):
+    """保存一次评估中每一行的得分，重新评估时覆盖旧结果"""
+    db.query(EvalRowScore).filter(EvalRowScore.eval_id == eval.id).delete(synchronize_session=False)
+    db.add_all([
+        EvalRowScore(eval_id=eval.id, task_id=eval.task_id, method=eval.method, row_index=i,
+                     score=None if score is None or math.isnan(score) else float(score))
+        for i, score in enumerate(scores)
+    ])
@@ -1,14 +1,25 @@
 from ragas import SingleTurnSample, EvaluationDataset
 from ragas import evaluate
-from langchain_openai import ChatOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from ragas.llms import LangchainLLMWrapper
 from ragas.metrics import *
+from ragas.metrics.base import MetricWithEmbeddings, MetricWithLLM
+import math
+from rag_eval.config import get_run_settings
+from rag_eval.embedding_cache import CachedEmbeddingsWrapper
+from rag_eval.score_store import model_identifier, row_fingerprint, row_score_store
 def set_environment():
     llm = ChatOpenAI(model="gpt-3.5-turbo-0125")
     evaluator_llm = LangchainLLMWrapper(llm)
     return evaluator_llm
 
 
+def set_embeddings(run_config=None):
+    # 与ragas默认嵌入模型一致，但经过持久化缓存
+    embeddings = OpenAIEmbeddings(model="text-embedding-ada-002")
+    return CachedEmbeddingsWrapper(embeddings, run_config=run_config)
+
+
 def generate_dataset(fields_data, field_names):
     """
     通用的函数来生成 dataset，根据传入的字段动态生成 `SingleTurnSample`
@@ -28,11 +39,43 @@ def generate_dataset(fields_data, field_names):
     return EvaluationDataset(dataset)
 
 
-def evaluate_and_store(dataset, metric, llm, df, name):
-    result = evaluate(dataset=dataset, metrics=[metric], llm=llm)
-    result_df = result.to_pandas()
-    last_column = result_df.iloc[:, -1]  # 获取最后一列
-    df[name] = last_column
+def evaluate_and_store(dataset, metric, llm, df, name, store=row_score_store):
+    """
+    只评估指纹未命中的行，其余行的得分从历史结果中合并
+    """
+    metric_name = type(metric).__name__
+    settings = get_run_settings(metric_name)
+    run_config = settings.to_run_config()
+    embeddings = set_embeddings(run_config)
+    # 指标用到的评估模型计入指纹，换模型后重新评估
+    models = {}
+    if isinstance(metric, MetricWithLLM):
+        models["llm"] = model_identifier(llm)
+    if isinstance(metric, MetricWithEmbeddings):
+        models["embeddings"] = model_identifier(embeddings)
+    samples = dataset.samples
+    fingerprints = [row_fingerprint(metric_name, sample.to_dict(), models) for sample in samples]
+    scores = store.get_many(fingerprints)
+
+    pending = {}
+    for fp, sample in zip(fingerprints, samples):
+        if fp not in scores and fp not in pending:
+            pending[fp] = sample
+    print(f"{metric_name}: {len(samples) - len(pending)} rows reused, {len(pending)} rows to evaluate")
+
+    if pending:
+        result = evaluate(dataset=EvaluationDataset(list(pending.values())), metrics=[metric], llm=llm,
+                          embeddings=embeddings,
+                          run_config=run_config, batch_size=settings.batch_size)
+        result_df = result.to_pandas()
+        last_column = result_df.iloc[:, -1]  # 获取最后一列
+        computed = dict(zip(pending.keys(), last_column.tolist()))
+        # NaN通常是调用失败，不保存，下次重新评估
+        store.set_many(metric_name, {fp: float(score) for fp, score in computed.items()
+                                     if score is not None and not math.isnan(score)})
+        scores.update(computed)
+
+    df[name] = [scores[fp] for fp in fingerprints]
 
 
 def process_LLMContextPrecisionWithoutReference(user_inputs, responses, retrieved_contexts, df):
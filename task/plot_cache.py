@@ -0,0 +1,58 @@
+import os
+
+from sqlalchemy import func
+
+from models.Task import TaskPlot
+
+PLOT_DIR = "eval_plots"
+
+
+def eval_set_version(db, model, task_id: int, method: str) -> str:
+    """
+    评估集合的版本号：数量 + 最大id + 最近完成时间
+    新增、删除或重新完成评估都会改变版本
+    """
+    count, max_id, max_finished = (db.query(func.count(model.id), func.max(model.id), func.max(model.finished))
+                                   .filter(model.task_id == task_id)
+                                   .filter(model.method == method)
+                                   .one())
+    return f"{count}:{max_id or 0}:{max_finished or 0}"
+
+
+def get_cached_plot(db, task_id: int, method: str, version: str):
+    """版本未变化且图片仍存在时返回已有链接"""
+    plot = (db.query(TaskPlot)
+            .filter(TaskPlot.task_id == task_id)
+            .filter(TaskPlot.method == method)
+            .filter(TaskPlot.version == version)
+            .first())
+    if plot is None or not os.path.exists(os.path.join(PLOT_DIR, plot.link)):
+        return None
+    return plot.link
+
+
+def save_plot(db, task_id: int, method: str, version: str, filename: str):
+    """
+    记录新图表，并清理更早版本的图表及其文件
+    被替换的上一版本图表暂时保留：并发请求可能刚从get_cached_plot拿到它的链接，下次生成新版本时再删除
+    """
+    plot = TaskPlot(task_id=task_id, method=method, link=filename, version=version)
+    db.add(plot)
+    db.commit()
+    previous = (db.query(TaskPlot)
+                .filter(TaskPlot.task_id == task_id)
+                .filter(TaskPlot.method == method)
+                .filter(TaskPlot.id != plot.id)
+                .order_by(TaskPlot.id.desc())
+                .all())
+    if not previous:
+        return
+    kept = {filename, previous[0].link}
+    for old_plot in previous[1:]:
+        if old_plot.link and old_plot.link not in kept:
+            try:
+                os.remove(os.path.join(PLOT_DIR, old_plot.link))
+            except OSError:
+                pass
+        db.delete(old_plot)
+    db.commit()
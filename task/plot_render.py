@@ -0,0 +1,75 @@
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import matplotlib
+
+matplotlib.use("Agg")  # 无界面后端，不依赖显示环境
+from matplotlib.figure import Figure
+
+from task.plot_cache import PLOT_DIR
+
+# 输出格式与分辨率，例如 PLOT_FORMAT=svg 或 PLOT_FORMAT=webp PLOT_DPI=120
+PLOT_FORMAT = os.environ.get("PLOT_FORMAT", "png").lower()
+PLOT_DPI = int(os.environ.get("PLOT_DPI", 300))
+PLOT_WORKERS = int(os.environ.get("PLOT_WORKERS", 2))
+
+# 格式或分辨率变化后旧图表失效
+RENDER_KEY = f"{PLOT_FORMAT}@{PLOT_DPI}"
+
+# 设置中文字体（根据系统选择），只在导入时修改一次全局配置
+if sys.platform == "win32":
+    matplotlib.rcParams['font.sans-serif'] = ['SimHei']  # Windows
+elif sys.platform == "darwin":
+    matplotlib.rcParams['font.sans-serif'] = ['Arial Unicode MS']  # Mac
+else:
+    matplotlib.rcParams['font.sans-serif'] = ['Noto Sans CJK JP']  # Linux
+# 解决负号显示问题
+matplotlib.rcParams['axes.unicode_minus'] = False
+
+plot_executor = ThreadPoolExecutor(max_workers=PLOT_WORKERS, thread_name_prefix="plot")
+
+
+def render_score_plot(x_values, y_values, title: str, ylabel: str, ylim, name: str) -> str:
+    """
+    使用面向对象的Figure接口绘制分数折线图，不经过pyplot的全局状态，可在多个线程中并行
+    返回保存在PLOT_DIR中的文件名
+    """
+    fig = Figure(figsize=(10, 5))
+    try:
+        ax = fig.subplots()
+        ax.plot(
+            x_values, y_values,
+            marker='o',
+            linestyle='-',
+            color='steelblue',
+            label='score'
+        )
+        ax.set_title(title, fontsize=14)
+        ax.set_xlabel("评估轮数", fontsize=12)
+        ax.set_ylabel(ylabel, fontsize=12)
+        ax.set_xticks(x_values)  # 显示所有x刻度
+        ax.set_ylim(*ylim)
+        ax.grid(alpha=0.4)
+        ax.legend()
+        fig.tight_layout()
+
+        os.makedirs(PLOT_DIR, exist_ok=True)
+        # 生成带时间戳的文件名
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"{name}_{timestamp}.{PLOT_FORMAT}"
+        save_path = os.path.join(PLOT_DIR, filename)
+        fig.savefig(save_path, format=PLOT_FORMAT, dpi=PLOT_DPI, bbox_inches='tight')
+        print(f"图表已保存至: {save_path}")
+        return filename
+    finally:
+        # 显式释放图表占用的内存
+        fig.clear()
+
+
+async def run_plot(func, *args):
+    """在绘图线程池中执行，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(plot_executor, func, *args)
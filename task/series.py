@@ -0,0 +1,101 @@
+import hashlib
+
+from sqlalchemy import func
+
+from models.Task import RAGEvaluation, PromptEvaluation, EvalRowScore
+from prompt.evaluate import parse_prompt_score
+from task.plot_cache import eval_set_version
+
+
+def eval_model(category: str):
+    return PromptEvaluation if category == "prompt" else RAGEvaluation
+
+
+def list_methods(db, model, task_id: int) -> list[str]:
+    return [m for (m,) in db.query(model.method).filter(model.task_id == task_id).distinct().order_by(model.method)]
+
+
+def series_etag(db, model, task_id: int, methods: list[str]) -> str:
+    """由各指标评估集合的版本拼接而成，任何评估变化都会改变ETag"""
+    versions = "|".join(f"{m}={eval_set_version(db, model, task_id, m)}" for m in methods)
+    return '"{}"'.format(hashlib.sha256(f"{model.__tablename__}:{task_id}:{versions}".encode("utf-8")).hexdigest()[:32])
+
+
+def _median(db, model, task_id: int, method: str, count: int):
+    if count == 0:
+        return None
+    # SQLite没有percentile函数，排序后取中间一个或两个值
+    values = [v for (v,) in db.query(model.score)
+              .filter(model.task_id == task_id, model.method == method, model.score.isnot(None))
+              .order_by(model.score.asc())
+              .offset((count - 1) // 2)
+              .limit(2 - count % 2)]
+    return sum(values) / len(values)
+
+
+def get_method_series(db, model, task_id: int, method: str) -> dict:
+    scored = (model.task_id == task_id, model.method == method, model.score.isnot(None))
+    rows = (db.query(model.id,
+                     model.score,
+                     model.finished,
+                     func.row_number().over(order_by=model.id).label("round"),
+                     (model.score - func.lag(model.score).over(order_by=model.id)).label("delta"))
+            .filter(*scored)
+            .order_by(model.id.asc())
+            .all())
+    count, mean, min_score, max_score = (db.query(func.count(model.score), func.avg(model.score),
+                                                  func.min(model.score), func.max(model.score))
+                                         .filter(*scored)
+                                         .one())
+    return {
+        "method": method,
+        "points": [{"id": r.id, "round": r.round, "score": r.score, "delta": r.delta, "finished": r.finished}
+                   for r in rows],
+        "stats": {
+            "count": count,
+            "mean": mean,
+            "p50": _median(db, model, task_id, method, count),
+            "min": min_score,
+            "max": max_score,
+            "last_delta": rows[-1].delta if rows else None,
+        },
+    }
+
+
+def get_task_series(db, category: str, task_id: int, methods: list[str] | None = None) -> list[dict]:
+    model = eval_model(category)
+    if not methods:
+        methods = list_methods(db, model, task_id)
+    return [get_method_series(db, model, task_id, m) for m in methods]
+
+
+def get_row_scores(db, eval_id: int, max_score: float | None = None, limit: int = 100) -> list[dict]:
+    """单次RAG评估中各行的得分，按分数从低到高排列，便于定位表现差的样本"""
+    query = db.query(EvalRowScore.row_index, EvalRowScore.score).filter(EvalRowScore.eval_id == eval_id)
+    if max_score is not None:
+        query = query.filter(EvalRowScore.score <= max_score)
+    rows = query.order_by(EvalRowScore.score.is_(None).desc(), EvalRowScore.score.asc()).limit(limit).all()
+    return [{"row": r.row_index, "score": r.score} for r in rows]
+
+
+def eval_score(evaluation) -> float | None:
+    """评估的数值得分；旧数据没有score时从输出文本中解析"""
+    if evaluation.score is not None:
+        return evaluation.score
+    if isinstance(evaluation, PromptEvaluation):
+        return parse_prompt_score(evaluation.output_text)
+    try:
+        return float(evaluation.output_text)
+    except (TypeError, ValueError):
+        return None
+
+
+def backfill_scores(db):
+    """为旧数据补全数值得分"""
+    for model in (RAGEvaluation, PromptEvaluation):
+        evals = (db.query(model)
+                 .filter(model.score.is_(None), model.output_text.isnot(None), model.status == "success")
+                 .all())
+        for e in evals:
+            e.score = eval_score(e)
+    db.commit()
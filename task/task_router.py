@@ -1,13 +1,17 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Cookie
+from fastapi import APIRouter, UploadFile, File, HTTPException, Cookie, Request, Response
 from fastapi.responses import FileResponse
 
 from prompt.metrics import prompt_metric_list
 from prompt.plot import get_prompt_plot
 from rag_eval.plot import get_rag_plot
-from access_token import get_user_id
+from task.plot_render import run_plot
+from task.series import eval_model, list_methods, series_etag, get_task_series, get_row_scores
+from models.database import SessionLocal
+from access_token import get_user_id, get_current_user
 from task.request_model import *
 from task.utils import *
 from rag_eval.rag_eval import rag_metric_list
+from rag_eval.config import EVAL_CONFIG_PATH, get_effective_settings
 
 router = APIRouter(prefix='/task', tags=['Tasks'])
 
@@ -52,6 +56,29 @@ async def get_metrics(category: Literal["rag", "prompt"] = Query(...), access_to
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/metrics/settings")
+async def get_metric_settings(access_token: str = Cookie(None)):
+    """获取RAG评估指标的实际运行参数（并发、超时、重试、批大小）"""
+    try:
+        user = await get_current_user(access_token)
+        if user.role != "admin":
+            raise HTTPException(status_code=403, detail="需要管理员权限")
+        system_metrics = rag_metric_list()
+        effective = get_effective_settings([m['metric'] for m in system_metrics])
+        settings = []
+        for m in system_metrics:
+            settings.append({
+                "name": m['name'],
+                "metric": m['metric'],
+                "settings": effective[m['metric']]
+            })
+        return {"success": True, "config_path": EVAL_CONFIG_PATH, "metrics": settings}
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/")
 async def addEvals(r: AddTaskRequest, access_token: str = Cookie(None)):
     """增加任务"""
@@ -133,10 +160,9 @@ async def getPlot(task_id: int = Query(...), method: str = Query(...), access_to
             return {"success": False, "message": "No such task."}
         link = None
         if task.category == "prompt":
-            link = get_prompt_plot(task_id, method)
+            link = await run_plot(get_prompt_plot, task_id, method)
         elif task.category == "rag":
-            print("here")
-            link = get_rag_plot(task_id, method)
+            link = await run_plot(get_rag_plot, task_id, method)
         else:
             pass
         return {"success": True, "url": link}
@@ -144,6 +170,52 @@ async def getPlot(task_id: int = Query(...), method: str = Query(...), access_to
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/series")
+async def getSeries(request: Request, response: Response, task_id: int = Query(...),
+                    methods: List[str] = Query(None), access_token: str = Cookie(None)):
+    """获取数值得分序列及统计值，供前端绘图；支持ETag缓存"""
+    try:
+        user_id = await get_user_id(access_token)
+        task = await get_task_from_id(task_id, user_id)
+        if task is None:
+            return {"success": False, "message": "No such task."}
+        db = SessionLocal()
+        try:
+            model = eval_model(task.category)
+            methods = methods or list_methods(db, model, task_id)
+            etag = series_etag(db, model, task_id, methods)
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+            series = get_task_series(db, task.category, task_id, methods)
+        finally:
+            db.close()
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+        return {"success": True, "series": series}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/rowscores")
+async def getRowScores(eval_id: int = Query(...), max_score: Optional[float] = Query(None),
+                       limit: int = Query(100, le=1000), access_token: str = Cookie(None)):
+    """获取单次RAG评估的逐行得分"""
+    try:
+        user_id = await get_user_id(access_token)
+        db = SessionLocal()
+        try:
+            eval = db.get(RAGEvaluation, eval_id)
+            task = await get_task_from_id(eval.task_id, user_id) if eval else None
+            if task is None or task.category != "rag":
+                return {"success": False, "message": "No such eval."}
+            rows = get_row_scores(db, eval_id, max_score, limit)
+        finally:
+            db.close()
+        return {"success": True, "rows": rows}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/")
 async def get_tasks(category: Literal["rag", "prompt"],
                     access_token: str = Cookie(None)):
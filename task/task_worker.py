@@ -9,7 +9,7 @@ from models.Task import RAGEvaluation, PromptEvaluation, Task
 from sqlalchemy.orm import sessionmaker
 from models.database import engine
 from logger import logger
-from prompt.evaluate import process_prompt_task
+from prompt.evaluate import process_prompt_task, parse_prompt_score
 from rag_eval.rag_eval import process_rag
 
 
@@ -135,6 +135,10 @@ class TaskWorker(Thread):
                 # TODO
                 if "result" in result:
                     eval_in_db.output_text = str(result["result"])
+                    if eval_info['category'] == 'prompt':
+                        eval_in_db.score = parse_prompt_score(eval_in_db.output_text)
+                    else:
+                        eval_in_db.score = float(result["result"])
                 # exception
                 db.commit()
             except Exception as e:
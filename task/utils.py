@@ -221,6 +221,7 @@ async def remove_task(task_id: int, user_id: int):
     if plots:
         for e in plots:
             db.delete(e)
+    db.query(EvalRowScore).filter(EvalRowScore.task_id == task_id).delete(synchronize_session=False)
     db.delete(task)
     db.commit()
     db.close()
@@ -242,6 +243,8 @@ async def remove_eval(eval_ids: List[int], category: str):
             plot = db.query(TaskPlot).filter((TaskPlot.task_id == task_id) & (TaskPlot.method == eval.method)).first()
             if plot:
                 db.delete(plot)
+            if category != 'prompt':
+                db.query(EvalRowScore).filter(EvalRowScore.eval_id == eval_id).delete(synchronize_session=False)
             db.delete(eval)
         except Exception:
             pass
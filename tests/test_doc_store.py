@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from rag.utils.doc_store import DocumentStore
+from rag.utils.vector_db_rebuild import VectorDatabase
+
+
+def test_append_only_writes_new_records(tmp_path):
+    store = DocumentStore(str(tmp_path))
+    assert store.append(["a", "b"], ["第一段", "second"], [{"chunk_index": 0}, None]) == [0, 1]
+    size = os.path.getsize(store.docs_path)
+
+    assert store.append(["c"], ["third"]) == [2]
+    # 追加只写入新增的字节
+    assert os.path.getsize(store.docs_path) == size + 4 + len("third")
+    store.close()
+
+    reopened = DocumentStore(str(tmp_path))
+    assert len(reopened) == 3
+    assert reopened.get_documents([2, 0]) == ["third", "第一段"]
+    assert reopened.get_metadatas([0, 1]) == [{"chunk_index": 0}, {}]
+    assert reopened.positions_of(["c", "x"]) == {"c": 2}
+
+    reopened.rewrite([2, 0])
+    assert reopened.ids() == ["c", "a"]
+    assert reopened.get_documents([0, 1]) == ["third", "第一段"]
+    reopened.close()
+
+
+def test_metadata_columns_intern_repeated_values(tmp_path):
+    store = DocumentStore(str(tmp_path))
+    metadatas = [
+        {"source_file": "wiki/武器.md", "chunk_index": i, "file_type": "md", "knowledge_id": 3}
+        for i in range(1000)
+    ]
+    store.append([str(i) for i in range(1000)], [f"chunk {i}" for i in range(1000)], metadatas)
+    store.append(["x"], ["extra"], [{"tags": ["a", "b"], "knowledge_id": 3.0}])
+    assert store.get_metadatas([5, 1000]) == [metadatas[5], {"tags": ["a", "b"], "knowledge_id": 3.0}]
+
+    # 重复的元数据值每列只保存一份
+    columns = store._columns
+    assert len(columns._values["source_file"]) == 1
+    assert len(columns._values["knowledge_id"]) == 2
+    assert columns._codes["chunk_index"].typecode == "q"
+    # 返回的元数据互不共享可变对象
+    store.get_metadatas([1000])[0]["tags"].append("c")
+    assert store.get_metadatas([1000])[0]["tags"] == ["a", "b"]
+
+    store.update_metadatas([5], [{"file_type": "pdf"}])
+    assert store.get_metadatas([5]) == [{"file_type": "pdf"}]
+    assert store.get_documents([5]) == ["chunk 5"]
+    store.close()
+
+    # 重新打开后从SQLite重建列
+    reopened = DocumentStore(str(tmp_path))
+    assert reopened.get_metadatas([4, 5]) == [metadatas[4], {"file_type": "pdf"}]
+    assert reopened.memory_usage() < 1001 * 40
+    reopened.close()
+
+
+def test_interrupted_append_is_truncated(tmp_path):
+    store = DocumentStore(str(tmp_path))
+    store.append(["a"], ["x"])
+    store.close()
+    # 模拟写入偏移后、写入元数据前中断
+    with open(tmp_path / "offsets.bin", "ab") as f:
+        f.write((123).to_bytes(8, "little"))
+
+    reopened = DocumentStore(str(tmp_path))
+    assert len(reopened) == 1
+    assert reopened.append(["b"], ["y"]) == [1]
+    assert reopened.get_documents([0, 1]) == ["x", "y"]
+    reopened.close()
+
+
+def test_interrupted_rewrite_keeps_the_original_rows(tmp_path, monkeypatch):
+    from rag.utils import doc_store
+
+    store = DocumentStore(str(tmp_path))
+    store.append(["a", "b", "c", "d"], ["one", "two", "three", "four"], [{"v": i} for i in range(4)])
+    store.delete([1])
+    store.close()
+
+    original_append = DocumentStore.append
+
+    def failing_append(self, ids, documents, metadatas=None):
+        # 写入一半后中断
+        original_append(self, ids[:1], documents[:1], metadatas[:1] if metadatas else None)
+        raise OSError("disk full")
+
+    store = DocumentStore(str(tmp_path))
+    monkeypatch.setattr(DocumentStore, "append", failing_append)
+    with pytest.raises(OSError):
+        store.rewrite([0, 2, 3])
+    monkeypatch.setattr(DocumentStore, "append", original_append)
+    store.close()
+
+    reopened = DocumentStore(str(tmp_path))
+    assert reopened.ids() == ["a", "c", "d"]
+    assert reopened.get_documents([0, 2, 3]) == ["one", "three", "four"]
+    assert reopened.get_metadatas([3]) == [{"v": 3}]
+    assert not (tmp_path / "rewrite").exists()
+
+    # 在替换文件途中中断时，重新打开会完成替换
+    def interrupted_moves(moves):
+        source, target = next(iter(moves.items()))
+        os.replace(source, target)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(doc_store, "_apply_moves", interrupted_moves)
+    with pytest.raises(KeyboardInterrupt):
+        reopened.rewrite([3, 0])
+    monkeypatch.undo()
+    reopened = DocumentStore(str(tmp_path))
+    assert reopened.ids() == ["d", "a"]
+    assert reopened.filter_positions({"v": 3}).tolist() == [0]
+    reopened.close()
+
+
+def test_legacy_data_json_is_converted(tmp_path):
+    collection_dir = tmp_path / "docs"
+    collection_dir.mkdir()
+    legacy = {
+        "documents": ["x", "yyy"],
+        "metadatas": [{"source": "a"}, {}],
+        "idx_to_id": ["1", "2"],
+        "id_to_idx": {"1": 0, "2": 1},
+        "collection_metadata": {"source_hash": "abc"},
+        "dimension": 2,
+    }
+    (collection_dir / "data.json").write_text(json.dumps(legacy), encoding="utf-8")
+
+    async def run():
+        db = VectorDatabase(str(tmp_path), embedding_function=lambda texts: [[1.0, 0.0]] * len(texts))
+        assert await db.get_document_ids("docs") == ["1", "2"]
+        assert await db.get_collection_metadata("docs") == {"source_hash": "abc"}
+        store = (await db.get_collection("docs"))["store"]
+        assert store.get_documents([0, 1]) == ["x", "yyy"]
+        assert store.get_metadatas([0, 1]) == [{"source": "a"}, {}]
+
+    asyncio.run(run())
+    assert not (collection_dir / "data.json").exists()
+    assert (collection_dir / "collection.json").exists()
@@ -0,0 +1,103 @@
+import asyncio
+from types import SimpleNamespace
+
+from rag.utils.embedding import ChromaEmbeddingFunction, EmbeddingMicroBatcher, EmbeddingService
+
+
+class FakeEmbeddings:
+    """模拟 client.embeddings，记录每次请求及最大并发数"""
+
+    def __init__(self):
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create(self, model, input, encoding_format):
+        self.requests.append(list(input))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[float(len(t))]) for t in input])
+
+
+def make_service(batch_size, max_concurrency):
+    service = EmbeddingService(api_key="test")
+    service.client = SimpleNamespace(embeddings=FakeEmbeddings())
+    service.batch_size = batch_size
+    service.max_concurrency = max_concurrency
+    return service
+
+
+def test_batches_split_and_bounded():
+    service = make_service(batch_size=2, max_concurrency=2)
+    texts = ["a" * i for i in range(1, 8)]
+
+    embeddings = asyncio.run(service.embed_documents_batch(texts))
+
+    assert embeddings == [[float(i)] for i in range(1, 8)]
+    assert [len(r) for r in service.client.embeddings.requests] == [2, 2, 2, 1]
+    assert service.client.embeddings.max_in_flight == 2
+
+
+def test_chroma_function_sync_and_async():
+    function = ChromaEmbeddingFunction(api_key="test")
+    function.embedding_service = make_service(batch_size=10, max_concurrency=4)
+
+    assert function(["ab", "c"]) == [[2.0], [1.0]]
+
+    async def run():
+        # 在运行中的事件循环里调用同样可用，且不会嵌套事件循环
+        return await asyncio.gather(function.aembed(["abc"]), function.aembed(["d"]))
+
+    assert asyncio.run(run()) == [[[3.0]], [[1.0]]]
+
+
+def test_micro_batcher_coalesces_concurrent_requests():
+    calls = []
+
+    async def embed_fn(texts):
+        calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    async def run():
+        batcher = EmbeddingMicroBatcher(embed_fn, window_ms=20, max_batch=100)
+        return await asyncio.gather(batcher.embed(["a"]), batcher.embed(["bb", "a"]), batcher.embed(["ccc"]))
+
+    assert asyncio.run(run()) == [[[1.0]], [[2.0], [1.0]], [[3.0]]]
+    assert calls == [["a", "bb", "ccc"]]
+
+
+def test_micro_batcher_flushes_when_full_and_propagates_errors():
+    calls = []
+
+    async def embed_fn(texts):
+        calls.append(list(texts))
+        if "bad" in texts:
+            raise RuntimeError("provider error")
+        return [[1.0] for _ in texts]
+
+    async def run():
+        batcher = EmbeddingMicroBatcher(embed_fn, window_ms=10000, max_batch=2)
+        # 达到max_batch时立即发送，不等待时间窗口
+        ok = await asyncio.wait_for(asyncio.gather(batcher.embed(["a"]), batcher.embed(["b"])), 1)
+        failed = await asyncio.gather(batcher.embed(["bad"]), batcher.embed(["c"]), return_exceptions=True)
+        return ok, failed
+
+    ok, failed = asyncio.run(run())
+    assert ok == [[[1.0]], [[1.0]]]
+    assert all(isinstance(r, RuntimeError) for r in failed)
+
+
+def test_micro_batcher_fails_callers_on_short_result():
+    async def embed_fn(texts):
+        return [[1.0]] * (len(texts) - 1)
+
+    async def run():
+        batcher = EmbeddingMicroBatcher(embed_fn, window_ms=1, max_batch=100)
+        # 返回的向量数量不足时所有调用方都收到异常，而不是一直等待
+        return await asyncio.wait_for(
+            asyncio.gather(batcher.embed(["a"]), batcher.embed(["b"]), return_exceptions=True), 1
+        )
+
+    assert all(isinstance(r, ValueError) for r in asyncio.run(run()))
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from rag.utils.entity_index import EntityIndex, entity_aliases, extract_entities
+from rag.utils.vector_store import create_vector_database
+
+
+def test_aliases_drop_qualifiers_and_add_traditional_spellings():
+    assert entity_aliases("元流之子(射手)") == {"元流之子(射手)", "元流之子"}
+    assert {"鬼魂", "鬼魂(敌怪)"} <= entity_aliases("鬼魂（敌怪）")
+    assert entity_aliases("铜短剑") == {"铜短剑", "銅短劍"}
+    # 单字名称容易误匹配普通词语，不建索引
+    assert entity_aliases("苍") == set()
+
+
+def test_match_prefers_longest_name(tmp_path):
+    chunks = {
+        "c1": "# 毒瓶\n## 简介\n毒瓶是一种饰品",
+        "c2": "# 毒瓶\n## 配方\n瓶子+毒刺",
+        "c3": "# 剧毒瓶\n## 简介\n剧毒瓶",
+        "c4": "# 铜短剑\n铜短剑是短剑\n# 锡短剑\n锡短剑是短剑",
+    }
+    entities = extract_entities(chunks)
+    assert entities == {"毒瓶": ["c1", "c2"], "剧毒瓶": ["c3"], "铜短剑": ["c4"], "锡短剑": ["c4"]}
+
+    async def run():
+        index = EntityIndex(str(tmp_path))
+        await index.build_collection("kb_test", entities)
+        assert await index.lookup("kb_test", "剧毒瓶怎么合成？") == ["c3"]
+        assert await index.lookup("kb_test", "毒瓶和銅短劍哪个好") == ["c1", "c2", "c4"]
+        assert await index.lookup("kb_test", "天顶剑") == []
+        assert await index.lookup("other", "毒瓶") == []
+
+        # 重新打开后从文件加载
+        assert EntityIndex(str(tmp_path)).match("kb_test", "毒瓶") == ["c1", "c2"]
+        assert await index.delete_collection("kb_test")
+        assert await index.lookup("kb_test", "毒瓶") == []
+
+    asyncio.run(run())
+
+
+class CountingEmbeddingFunction:
+    def __call__(self, input):
+        return [[float(len(t)), 1.0] for t in input]
+
+    def name(self):
+        return "counting"
+
+
+@pytest.mark.parametrize("backend", ["chroma", "faiss"])
+def test_score_documents_matches_search_similarity(tmp_path, backend):
+    async def run():
+        db = create_vector_database(str(tmp_path / backend), backend, CountingEmbeddingFunction())
+        await db.initialize()
+        await db.create_collection("kb_test", metadata={"description": "test"})
+        await db.add_documents("kb_test", ["a", "bbb", "cc"], ids=["1", "2", "3"])
+
+        query = [2.0, 1.0]
+        scored = await db.score_documents("kb_test", ["3", "1", "missing"], query)
+        searched = dict(await db.search_documents("kb_test", "q", k=3, query_embedding=query))
+        assert [doc for doc, _ in scored] == sorted(["a", "cc"], key=lambda d: -searched[d])
+        for doc, similarity in scored:
+            assert similarity == pytest.approx(searched[doc], abs=1e-5)
+        assert await db.score_documents("kb_test", [], query) == []
+
+    asyncio.run(run())
@@ -0,0 +1,325 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from rag.utils.vector_db_rebuild import VectorDatabase
+
+
+class FailingEmbeddingFunction:
+    def __call__(self, input):
+        raise AssertionError("documents should not be re-embedded")
+
+
+def random_vectors(n, seed, dimension=16):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n, dimension)).astype("float32").tolist()
+
+
+async def add_random(db, name, start, n, seed):
+    ids = [str(i) for i in range(start, start + n)]
+    await db.add_documents(name, [f"doc {i}" for i in ids], ids=ids, embeddings=random_vectors(n, seed))
+
+
+def test_ivf_trains_once_enough_vectors_exist(tmp_path):
+    async def run():
+        db = VectorDatabase(str(tmp_path), embedding_function=FailingEmbeddingFunction())
+        await db.create_collection("docs", index_spec={"type": "ivf_flat", "min_train_size": 200, "nlist": 8})
+        await add_random(db, "docs", 0, 150, seed=1)
+        assert (await db.get_index_spec("docs"))["built"] == "flat"
+
+        await add_random(db, "docs", 150, 150, seed=2)
+        assert (await db.get_index_spec("docs"))["built"] == "ivf_flat"
+
+        # 探测全部倒排列表时结果与精确检索一致
+        query = random_vectors(1, seed=3)[0]
+        approx = await db.search_documents("docs", "q", k=5, query_embedding=query, nprobe=8)
+        await db.rebuild_index("docs", {"type": "flat"})
+        exact = await db.search_documents("docs", "q", k=5, query_embedding=query)
+        assert [doc for doc, _ in approx] == [doc for doc, _ in exact]
+
+    asyncio.run(run())
+
+
+def test_ann_vectors_are_appended_not_rewritten(tmp_path):
+    import os
+
+    async def run():
+        db = VectorDatabase(str(tmp_path), embedding_function=FailingEmbeddingFunction())
+        await db.create_collection("docs", index_spec={"type": "ivf_flat", "min_train_size": 200, "nlist": 8})
+        vectors_file = tmp_path / "docs" / "vectors.f32"
+        await add_random(db, "docs", 0, 150, seed=1)
+        inode = os.stat(vectors_file).st_ino
+        await add_random(db, "docs", 150, 150, seed=2)
+        # 新向量追加到原文件末尾，训练所需的全部向量从内存映射读取
+        assert os.stat(vectors_file).st_ino == inode
+        assert os.path.getsize(vectors_file) == 300 * 16 * 4
+        assert (await db.get_index_spec("docs"))["built"] == "ivf_flat"
+        expected = np.array(random_vectors(150, seed=1) + random_vectors(150, seed=2), dtype="float32")
+        expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+        stored = np.fromfile(vectors_file, dtype="<f4").reshape(300, 16)
+        assert np.allclose(stored, expected, atol=1e-6)
+
+        # 旧版本保存的vectors.npy在首次读取时转换
+        np.save(tmp_path / "docs" / "vectors.npy", stored)
+        os.remove(vectors_file)
+        reloaded = VectorDatabase(str(tmp_path), embedding_function=FailingEmbeddingFunction())
+        exported = await reloaded.export_collection("docs")
+        assert np.allclose(exported["embeddings"], expected, atol=1e-6)
+        assert vectors_file.exists() and not (tmp_path / "docs" / "vectors.npy").exists()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("index_type", ["hnsw", "ivf_pq"])
+def test_ann_index_survives_reload_and_delete(tmp_path, index_type):
+    async def run():
+        db = VectorDatabase(str(tmp_path), embedding_function=FailingEmbeddingFunction())
+        await db.create_collection("docs", index_spec={"type": index_type, "min_train_size": 256, "nlist": 4, "pq_m": 4})
+        await add_random(db, "docs", 0, 300, seed=4)
+        await db.delete_documents("docs", ["0", "1"])
+
+        reloaded = VectorDatabase(str(tmp_path), embedding_function=FailingEmbeddingFunction())
+        spec = await reloaded.get_index_spec("docs")
+        assert spec["type"] == spec["built"] == index_type
+        assert await reloaded.get_collection_count("docs") == 298
+
+        exported = await reloaded.export_collection("docs")
+        assert exported["ids"][:2] == ["2", "3"]
+        target = exported["embeddings"][5]
+        results = await reloaded.search_documents("docs", "q", k=1, query_embedding=target,
+                                                  nprobe=4, ef_search=128)
+        assert results[0][0] == exported["documents"][5]
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("index_type,brute_force_max", [("flat", 4096), ("flat", 0), ("hnsw", 0), ("ivf_flat", 0)])
+def test_filtered_search_returns_exactly_k_matches(tmp_path, monkeypatch, index_type, brute_force_max):
+    from rag.utils import vector_db_rebuild
+    monkeypatch.setattr(vector_db_rebuild, "FILTER_BRUTE_FORCE_MAX", brute_force_max)
+
+    async def run():
+        db = VectorDatabase(str(tmp_path), embedding_function=FailingEmbeddingFunction())
+        await db.create_collection("docs", index_spec={"type": index_type, "min_train_size": 100, "nlist": 16})
+        ids = [str(i) for i in range(400)]
+        # 只有3%的文档属于knowledge_id=1，过度检索k*5无法保证命中
+        metadatas = [{"knowledge_id": 1 if i % 33 == 0 else 2} for i in range(400)]
+        await db.add_documents("docs", [f"doc {i}" for i in ids], metadatas=metadatas, ids=ids,
+                               embeddings=random_vectors(400, seed=5))
+        allowed = {f"doc {i}" for i in range(0, 400, 33)}
+
+        query = random_vectors(1, seed=6)[0]
+        results = await db.search_documents("docs", "q", k=5, where={"knowledge_id": 1},
+                                            query_embedding=query, nprobe=1)
+        assert len(results) == 5
+        assert {doc for doc, _ in results} <= allowed
+        scores = [score for _, score in results]
+        assert scores == sorted(scores, reverse=True)
+
+        if index_type == "flat":
+            vectors = np.array(random_vectors(400, seed=5))
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            scores_by_row = vectors @ (np.array(query) / np.linalg.norm(query))
+            expected = sorted(range(0, 400, 33), key=lambda i: -scores_by_row[i])[:5]
+            assert [doc for doc, _ in results] == [f"doc {i}" for i in expected]
+
+        assert await db.search_documents("docs", "q", k=5, where={"knowledge_id": 3},
+                                         query_embedding=query) == []
+
+        # 更新元数据后倒排索引同步更新
+        await db.update_metadatas("docs", ["1"], [{"knowledge_id": 3}])
+        results = await db.search_documents("docs", "q", k=5, where={"knowledge_id": 3},
+                                            query_embedding=query)
+        assert [doc for doc, _ in results] == ["doc 1"]
+
+    asyncio.run(run())
+
+
+class CountingEmbeddingFunction:
+    def __init__(self):
+        self.embedded = []
+
+    def __call__(self, input):
+        self.embedded.extend(input)
+        return [[float(len(t)), 1.0, float(t.count("a"))] for t in input]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_upsert_delete_and_compaction(tmp_path, monkeypatch, index_type):
+    from rag.utils import vector_db_rebuild
+    monkeypatch.setattr(vector_db_rebuild, "COMPACT_THRESHOLD", 0.5)
+
+    async def run():
+        ef = CountingEmbeddingFunction()
+        db = VectorDatabase(str(tmp_path), embedding_function=ef)
+        await db.create_collection("docs", index_spec={"type": index_type})
+        await db.add_documents("docs", ["a", "bb", "ccc", "dddd"], ids=["1", "2", "3", "4"],
+                               metadatas=[{"v": 1}] * 4)
+        # 重复id不会再次写入
+        await db.add_documents("docs", ["a"], ids=["1"])
+        assert await db.get_collection_count("docs") == 4
+
+        ef.embedded.clear()
+        await db.upsert_documents("docs", ["a", "bbbbb", "e"], ids=["1", "2", "5"],
+                                  metadatas=[{"v": 2}, {"v": 2}, {"v": 2}])
+        # 文本未变只更新元数据，不重新嵌入
+        assert ef.embedded == ["bbbbb", "e"]
+        assert sorted(await db.get_document_ids("docs")) == ["1", "2", "3", "4", "5"]
+
+        results = await db.search_documents("docs", "q", k=10, query_embedding=[2.0, 1.0, 0.0])
+        docs = [doc for doc, _ in results]
+        assert "bb" not in docs and "bbbbb" in docs and len(docs) == 5
+        filtered = await db.search_documents("docs", "q", k=10, where={"v": 2},
+                                             query_embedding=[2.0, 1.0, 0.0])
+        assert sorted(doc for doc, _ in filtered) == ["a", "bbbbb", "e"]
+
+        # 删除比例超过阈值后后台压缩
+        await db.delete_documents("docs", ["3", "4", "5"])
+        assert await db.get_collection_count("docs") == 2
+        await db.compact_collection("docs")
+        collection = await db.get_collection("docs")
+        assert collection["index"].ntotal == len(collection["store"]) == 2
+        assert collection["store"].deleted_fraction == 0
+
+        results = await db.search_documents("docs", "q", k=10, query_embedding=[5.0, 1.0, 0.0])
+        assert [doc for doc, _ in results] == ["bbbbb", "a"]
+
+        reloaded = VectorDatabase(str(tmp_path), embedding_function=ef)
+        assert sorted(await reloaded.get_document_ids("docs")) == ["1", "2"]
+
+    asyncio.run(run())
+
+
+def test_writes_use_positions_current_under_the_lock(tmp_path, monkeypatch):
+    from rag.utils import vector_db_rebuild
+    monkeypatch.setattr(vector_db_rebuild, "COMPACT_THRESHOLD", 1.0)
+
+    class CompactingEmbeddingFunction(CountingEmbeddingFunction):
+        """Compacts the collection while documents are being embedded."""
+
+        def __call__(self, input):
+            db._compact_sync("docs", collection)
+            return super().__call__(input)
+
+    async def run():
+        nonlocal db, collection
+        db = VectorDatabase(str(tmp_path), embedding_function=CountingEmbeddingFunction())
+        await db.add_documents("docs", ["a", "bb", "ccc", "dddd"], ids=["1", "2", "3", "4"])
+        # 并发添加相同id时只写入一次
+        await asyncio.gather(*(db.add_documents("docs", ["eeeee"], ids=["5"]) for _ in range(4)))
+        assert await db.get_document_ids("docs") == ["1", "2", "3", "4", "5"]
+
+        await db.delete_documents("docs", ["1", "2"])
+        collection = await db.get_collection("docs")
+        db.embedding_function = CompactingEmbeddingFunction()
+        # 嵌入期间压缩改变了位置，写入仍落在正确的行上
+        await db.upsert_documents("docs", ["ccc", "dd"], ids=["3", "4"], metadatas=[{"v": 1}, {"v": 2}])
+        assert collection["store"].deleted_fraction > 0
+        store = collection["store"]
+        positions = store.positions_of(["3", "4", "5"])
+        assert store.get_documents([positions["3"], positions["4"], positions["5"]]) == ["ccc", "dd", "eeeee"]
+        assert store.get_metadatas([positions["3"], positions["4"]]) == [{"v": 1}, {"v": 2}]
+        results = await db.search_documents("docs", "q", k=3, query_embedding=[2.0, 1.0, 0.0])
+        assert results[0][0] == "dd"
+
+    db = collection = None
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_interrupted_compaction_keeps_files_consistent(tmp_path, monkeypatch, index_type):
+    import os
+
+    from rag.utils import doc_store, vector_db_rebuild
+    monkeypatch.setattr(vector_db_rebuild, "COMPACT_THRESHOLD", 1.0)
+
+    def interrupted_moves(moves):
+        source, target = next(iter(moves.items()))
+        os.replace(source, target)
+        raise KeyboardInterrupt
+
+    async def check(expected_count, expected_rows):
+        db = VectorDatabase(str(tmp_path), embedding_function=FailingEmbeddingFunction())
+        collection = await db.get_collection("docs")
+        assert collection["index"].ntotal == len(collection["store"]) == expected_rows
+        assert await db.get_collection_count("docs") == expected_count
+        if index_type != "flat":
+            assert os.path.getsize(tmp_path / "docs" / "vectors.f32") == expected_rows * 16 * 4
+        target = random_vectors(40, seed=5)[30]
+        results = await db.search_documents("docs", "q", k=1, query_embedding=target, ef_search=128)
+        assert results[0][0] == "doc 30"
+
+    async def run():
+        db = VectorDatabase(str(tmp_path), embedding_function=FailingEmbeddingFunction())
+        await db.create_collection("docs", index_spec={"type": index_type})
+        await add_random(db, "docs", 0, 40, seed=5)
+        await db.delete_documents("docs", [str(i) for i in range(10)])
+        collection = await db.get_collection("docs")
+
+        # 提交前中断：索引、向量和文档都保持压缩前的状态
+        monkeypatch.setattr(doc_store.DocumentStore, "append", lambda self, *args: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            db._compact_sync("docs", collection)
+        monkeypatch.undo()
+        await check(30, 40)
+
+        # 替换文件途中中断：重新加载时完成全部替换
+        monkeypatch.setattr(doc_store, "_apply_moves", interrupted_moves)
+        with pytest.raises(KeyboardInterrupt):
+            db._compact_sync("docs", collection)
+        monkeypatch.undo()
+        await check(30, 30)
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf_pq"])
+def test_mmapped_index_can_be_extended(tmp_path, index_type):
+    async def run():
+        db = VectorDatabase(str(tmp_path), embedding_function=FailingEmbeddingFunction())
+        await db.create_collection("docs", index_spec={"type": index_type, "min_train_size": 256, "nlist": 4, "pq_m": 4})
+        await add_random(db, "docs", 0, 300, seed=7)
+
+        reloaded = VectorDatabase(str(tmp_path), embedding_function=FailingEmbeddingFunction())
+        collection = await reloaded.get_collection("docs")
+        assert collection["mmapped"]
+
+        # 内存映射的索引是只读的，写入前换成内存副本
+        await add_random(reloaded, "docs", 300, 20, seed=8)
+        assert not collection["mmapped"]
+        assert collection["index"].ntotal == 320
+        target = random_vectors(20, seed=8)[3]
+        results = await reloaded.search_documents("docs", "q", k=1, query_embedding=target,
+                                                  nprobe=4, ef_search=128)
+        assert results[0][0] == "doc 303"
+
+    asyncio.run(run())
+
+
+def test_cold_collections_are_evicted_and_reloaded(tmp_path):
+    async def run():
+        db = VectorDatabase(str(tmp_path), embedding_function=FailingEmbeddingFunction())
+        for seed, name in enumerate(["kb_a", "kb_b", "kb_c"]):
+            await add_random(db, name, 0, 100, seed=seed)
+
+        db = VectorDatabase(str(tmp_path), embedding_function=FailingEmbeddingFunction())
+        # 每个集合约7KB（索引加文档偏移），预算只够放下两个
+        db.memory_budget_bytes = 16 * 1024
+        await db.get_collection("kb_a")
+        await db.get_collection("kb_b")
+        await db.get_collection("kb_c")
+
+        assert list(db.loaded_collections_cache) == ["kb_b", "kb_c"]
+        stats = db.memory_stats()
+        assert stats["collections"] == 2 and stats["bytes"] <= db.memory_budget_bytes
+        assert stats["evictions"] == 1
+
+        # 被淘汰的集合在下次访问时重新加载
+        target = random_vectors(100, seed=0)[42]
+        results = await db.search_documents("kb_a", "q", k=1, query_embedding=target)
+        assert results[0][0] == "doc 42"
+        assert list(db.loaded_collections_cache) == ["kb_c", "kb_a"]
+        assert await db.get_collection_count("kb_b") == 100
+
+    asyncio.run(run())
@@ -0,0 +1,89 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from models.rag_chat import KnowledgeBase
+from rag.application.knowledge_manager import KnowledgeManager
+from rag.utils.vector_db import VectorDatabase
+
+
+class CountingEmbeddingFunction:
+    def __init__(self):
+        self.embedded = []
+
+    def __call__(self, input):
+        self.embedded.extend(input)
+        return [[float(len(t)), 1.0] for t in input]
+
+    def name(self):
+        return "counting"
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    km = KnowledgeManager(knowledge_library_path=str(tmp_path / "library"),
+                          vector_db_path=str(tmp_path / "chroma"))
+    km.embedding_function = CountingEmbeddingFunction()
+    km.vector_db = VectorDatabase(str(tmp_path / "chroma"), embedding_function=km.embedding_function)
+    km.markdown_processor = MagicMock()
+    return km
+
+
+def add(km, tmp_path, documents):
+    source = tmp_path / "library" / "kb.md"
+    source.write_text("\n".join(documents), encoding="utf-8")
+    km.markdown_processor.process.return_value = documents
+    knowledge = KnowledgeBase(id=1, name="kb_test", path=str(source), type="md",
+                              assistant_id="terraria", description="test")
+    return asyncio.run(km.add_knowledge(knowledge))
+
+
+def test_reindex_only_embeds_changed_chunks(manager, tmp_path):
+    assert add(manager, tmp_path, ["# A\na", "# B\nb", "# C\nc", "# A\na"])
+    # 重复块只嵌入一次
+    assert manager.embedding_function.embedded == ["# A\na", "# B\nb", "# C\nc"]
+
+    manager.embedding_function.embedded.clear()
+    assert add(manager, tmp_path, ["# A\na", "# C\nc", "# D\nd"])
+
+    assert manager.embedding_function.embedded == ["# D\nd"]
+    collection = asyncio.run(manager.vector_db.get_collection("kb_test"))
+    stored = collection.get(include=["documents", "metadatas"])
+    chunks = sorted(zip(stored["documents"], (m["chunk_index"] for m in stored["metadatas"])))
+    assert chunks == [("# A\na", 0), ("# C\nc", 1), ("# D\nd", 2)]
+
+    # 关键词索引随集合同步增删
+    assert asyncio.run(manager.lexical_index.search_documents("kb_test", "B")) == []
+    hits = asyncio.run(manager.lexical_index.search_documents("kb_test", "D"))
+    assert [doc for doc, _ in hits] == ["# D\nd"]
+
+
+def test_entity_json_builds_entity_index(manager, tmp_path):
+    source = tmp_path / "library" / "weapons.json"
+    source.write_text('{"毒瓶": {"简介": "饰品"}, "铜短剑": {"简介": "短剑"}}', encoding="utf-8")
+    chunks = ["# 毒瓶\n## 简介\n饰品", "# 铜短剑\n## 简介\n短剑"]
+    manager.markdown_processor.process.return_value = chunks
+    knowledge = KnowledgeBase(id=2, name="kb_weapons", path=str(source), type="json",
+                              assistant_id="terraria", description="test")
+    assert asyncio.run(manager.add_knowledge(knowledge))
+
+    chunk_ids = asyncio.run(manager.entity_index.lookup("kb_weapons", "銅短劍厉害吗"))
+    scored = asyncio.run(manager.vector_db.score_documents("kb_weapons", chunk_ids, [1.0, 1.0]))
+    assert [doc for doc, _ in scored] == [chunks[1]]
+
+    assert asyncio.run(manager.delete_knowledge(knowledge))
+    assert asyncio.run(manager.entity_index.lookup("kb_weapons", "铜短剑")) == []
+
+
+def test_reindex_invalidates_cached_responses(manager, tmp_path):
+    from rag.utils.response_cache import response_cache
+
+    assert add(manager, tmp_path, ["# A\na"])
+    response_cache.put("model|kb_test", response_cache.versions(["kb_test"]), "A是什么", [1.0, 0.0], "旧回答", [])
+    assert response_cache.get("model|kb_test", [1.0, 0.0]) is not None
+
+    # 知识更新后，基于旧内容的回答不再命中
+    assert add(manager, tmp_path, ["# A\na2"])
+    assert response_cache.get("model|kb_test", [1.0, 0.0]) is None
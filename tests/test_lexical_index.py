@@ -0,0 +1,66 @@
+import asyncio
+
+from rag.utils.lexical_index import BM25Index, LexicalIndex, reciprocal_rank_fusion, tokenize
+from rag.utils.vector_store import create_vector_database, sync_lexical_indexes
+
+
+def test_tokenize_uses_bigrams_for_chinese():
+    assert tokenize("毒瓶怎么合成") == ["毒瓶", "瓶怎", "怎么", "么合", "合成"]
+    # 全角字符归一化，英文按词切分并转小写
+    assert tokenize("Ｔerraria 1.4 的毒") == ["terraria", "1", "4", "的毒"]
+    assert tokenize("亚 瑟") == ["亚", "瑟"]
+
+
+def test_bm25_ranks_exact_entity_first(tmp_path):
+    index = BM25Index(str(tmp_path / "kb.sqlite"))
+    index.add(
+        ["1", "2", "3"],
+        [
+            "毒瓶：合成后使近战攻击造成中毒效果",
+            "药水瓶可以装各种液体，也能用来酿造药水",
+            "剧毒瓶是毒瓶的升级，造成剧毒减益",
+        ],
+    )
+    hits = index.search("毒瓶怎么合成", k=3)
+    assert [doc_id for doc_id, _, _ in hits][0] == "1"
+    assert hits[0][1].startswith("毒瓶")
+
+    # 同id再次添加即替换，sync只增删变化的文档
+    index.add(["1"], ["完全无关的内容"])
+    assert index.search("毒瓶怎么合成", k=1)[0][0] == "3"
+    assert index.sync(["3", "4"], ["剧毒瓶是毒瓶的升级，造成剧毒减益", "新文档"]) == (1, 2)
+    assert sorted(index.ids()) == ["3", "4"]
+    index.close()
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    assert [key for key, _ in fused] == ["a", "c", "b"]
+    assert fused[0][1] == 1 / 61 + 1 / 62
+
+
+class CountingEmbeddingFunction:
+    def __call__(self, input):
+        return [[float(len(t)), 1.0] for t in input]
+
+    def name(self):
+        return "counting"
+
+
+def test_lexical_indexes_sync_from_vector_db(tmp_path):
+    async def run():
+        db = create_vector_database(str(tmp_path / "faiss"), "faiss", CountingEmbeddingFunction())
+        lexical = LexicalIndex(str(tmp_path / "lexical"))
+        await db.initialize()
+        await lexical.initialize()
+        await db.add_documents("kb_test", ["毒瓶的合成", "铁砧的合成"], ids=["a", "b"])
+
+        assert await lexical.search_documents("kb_test", "毒瓶") == []
+        assert await sync_lexical_indexes(db, lexical) == {"kb_test": 2}
+        results = await lexical.search_documents("kb_test", "毒瓶", k=1)
+        assert results[0][0] == "毒瓶的合成"
+
+        assert await lexical.delete_collection("kb_test")
+        assert await lexical.search_documents("kb_test", "毒瓶") == []
+
+    asyncio.run(run())
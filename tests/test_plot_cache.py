@@ -0,0 +1,86 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models.database import Base, upgrade_schema
+from models.Task import RAGEvaluation, TaskPlot
+from task import plot_cache
+from task.plot_cache import eval_set_version, get_cached_plot, save_plot
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(plot_cache, "PLOT_DIR", str(tmp_path))
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, bind=engine)()
+    yield session
+    session.close()
+
+
+def test_version_tracks_eval_changes(db):
+    empty = eval_set_version(db, RAGEvaluation, 1, "置信度")
+    db.add(RAGEvaluation(task_id=1, method="置信度", status="waiting"))
+    db.commit()
+    added = eval_set_version(db, RAGEvaluation, 1, "置信度")
+    db.query(RAGEvaluation).update({RAGEvaluation.finished: 100})
+    db.commit()
+    finished = eval_set_version(db, RAGEvaluation, 1, "置信度")
+
+    assert len({empty, added, finished}) == 3
+    assert eval_set_version(db, RAGEvaluation, 1, "Bleu分数") == empty
+
+
+def test_cached_plot_reused_until_version_changes(db, tmp_path):
+    (tmp_path / "old.png").write_bytes(b"png")
+    save_plot(db, 1, "置信度", "1:1:0", "old.png")
+    assert get_cached_plot(db, 1, "置信度", "1:1:0") == "old.png"
+    assert get_cached_plot(db, 1, "置信度", "2:2:0") is None
+
+    (tmp_path / "new.png").write_bytes(b"png")
+    save_plot(db, 1, "置信度", "2:2:0", "new.png")
+
+    # 上一版本的文件保留到下次生成，避免并发请求刚拿到的链接失效
+    assert [p.link for p in db.query(TaskPlot).order_by(TaskPlot.id)] == ["old.png", "new.png"]
+    assert (tmp_path / "old.png").exists()
+    assert get_cached_plot(db, 1, "置信度", "2:2:0") == "new.png"
+    assert get_cached_plot(db, 1, "置信度", "1:1:0") == "old.png"
+
+    (tmp_path / "newest.png").write_bytes(b"png")
+    save_plot(db, 1, "置信度", "3:3:0", "newest.png")
+
+    # 更早版本的记录和文件被清理
+    assert [p.link for p in db.query(TaskPlot).order_by(TaskPlot.id)] == ["new.png", "newest.png"]
+    assert not (tmp_path / "old.png").exists()
+    assert (tmp_path / "new.png").exists()
+
+
+def test_cached_plot_ignored_when_file_missing(db):
+    save_plot(db, 1, "置信度", "1:1:0", "missing.png")
+    assert get_cached_plot(db, 1, "置信度", "1:1:0") is None
+
+
+def test_upgrade_schema_adds_missing_columns():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE task_plot (id INTEGER PRIMARY KEY, task_id INTEGER, method VARCHAR(32), link VARCHAR)"))
+    upgrade_schema(engine)
+
+    columns = {c["name"] for c in inspect(engine).get_columns("task_plot")}
+    assert "version" in columns
+
+
+@pytest.mark.parametrize("fmt", ["png", "svg", "webp"])
+def test_render_score_plot_formats(tmp_path, monkeypatch, fmt):
+    from task import plot_render
+    monkeypatch.setattr(plot_render, "PLOT_DIR", str(tmp_path))
+    monkeypatch.setattr(plot_render, "PLOT_FORMAT", fmt)
+    monkeypatch.setattr(plot_render, "PLOT_DPI", 50)
+
+    filename = plot_render.render_score_plot([1, 2], [0.5, 0.7], "title", "score", (0, 1), "eval_rag_1_m")
+
+    assert filename.startswith("eval_rag_1_m_") and filename.endswith("." + fmt)
+    assert (tmp_path / filename).stat().st_size > 0
@@ -94,15 +94,15 @@ def test_process_prompt_task_optimization(mock_optimize_prompt, mock_session_loc
     mock_filter = mock_query.filter.return_value
     mock_group_by = mock_filter.group_by.return_value
     mock_group_by.all.return_value = [
-        ("通顺性", 1, "评估分数：6.5/10，理由1", "原始提示"),
-        ("明确性", 2, "评估分数：5.8/10，理由2", "原始提示"),
+        ("通顺性", 1, "评估分数：6.5/10，理由1", "原始提示", 6.5),
+        ("明确性", 2, "评估分数：5.8/10，理由2", "原始提示", None),
     ]
 
     evaluation = PromptEvaluation(id=-1, task_id=2)
     result = process_prompt_task(evaluation)
 
     # Verify optimization was called correctly
-    mock_optimize_prompt.assert_called_once()
+    mock_optimize_prompt.assert_called_once_with("原始提示", {"理由1": 6.5, "理由2": 5.8})
 
     # Check that Optimization was added to database
     mock_db.add.assert_called_once()
@@ -0,0 +1,46 @@
+from unittest.mock import patch
+
+from rag.utils.query_cache import QueryEmbeddingCache, normalize_query
+
+
+def test_lru_eviction_and_stats():
+    cache = QueryEmbeddingCache(capacity=2, ttl=0)
+    cache.put("m", "a", [1.0])
+    cache.put("m", "b", [2.0])
+    assert cache.get("m", "a") == [1.0]
+    cache.put("m", "c", [3.0])
+
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") == [1.0]
+    assert cache.get("other", "a") is None
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 2, 2, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_normalized_keys():
+    cache = QueryEmbeddingCache(capacity=10, ttl=0)
+    cache.put("m", " 泰拉瑞亚  boss？", [1.0])
+    assert normalize_query("泰拉瑞亚\tboss?") == "泰拉瑞亚 boss?"
+    assert cache.get("m", "泰拉瑞亚 boss?") == [1.0]
+
+
+def test_ttl_expiry():
+    cache = QueryEmbeddingCache(capacity=10, ttl=60)
+    with patch("rag.utils.query_cache.time.time", return_value=1000):
+        cache.put("m", "a", [1.0])
+    with patch("rag.utils.query_cache.time.time", return_value=1030):
+        assert cache.get("m", "a") == [1.0]
+    with patch("rag.utils.query_cache.time.time", return_value=1100):
+        assert cache.get("m", "a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_persistence(tmp_path):
+    path = str(tmp_path / "query_cache.pkl")
+    cache = QueryEmbeddingCache(capacity=10, ttl=0, persist_path=path)
+    cache.put("m", "a", [1.0, 2.0])
+    cache.save()
+
+    restored = QueryEmbeddingCache(capacity=10, ttl=0, persist_path=path)
+    assert restored.get("m", "a") == [1.0, 2.0]
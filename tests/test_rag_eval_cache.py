@@ -0,0 +1,67 @@
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models.database import Base
+from models.Task import RAGEmbeddingCache
+from rag_eval.embedding_cache import EmbeddingCache, CachedEmbeddingsWrapper
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, bind=engine)
+
+
+@pytest.fixture
+def mock_embeddings():
+    mock = MagicMock()
+    mock.model = "test-model"
+    mock.embed_documents.side_effect = lambda texts: [[float(len(t)), 1.0] for t in texts]
+    return mock
+
+
+def test_cache_roundtrip(session_factory):
+    cache = EmbeddingCache(max_entries=10, session_factory=session_factory)
+    cache.set_many("m", ["a", "bb"], [[1.0, 2.0], [3.0, 4.0]])
+
+    result = cache.get_many("m", ["bb", "c", "a"])
+
+    assert result == [[3.0, 4.0], None, [1.0, 2.0]]
+    # 不同模型的向量互不共享
+    assert cache.get_many("other", ["a"]) == [None]
+
+
+def test_cache_lru_eviction(session_factory):
+    cache = EmbeddingCache(max_entries=2, session_factory=session_factory)
+    cache.set_many("m", ["a"], [[1.0]])
+    cache.set_many("m", ["b"], [[2.0]])
+    db = session_factory()
+    db.query(RAGEmbeddingCache).update({RAGEmbeddingCache.last_used: 1})
+    db.commit()
+    db.close()
+    # 访问a使其成为最近使用
+    cache.get_many("m", ["a"])
+    cache.set_many("m", ["c"], [[3.0]])
+
+    assert cache.get_many("m", ["a", "b", "c"]) == [[1.0], None, [3.0]]
+
+
+def test_wrapper_skips_cached_texts(session_factory, mock_embeddings):
+    cache = EmbeddingCache(max_entries=10, session_factory=session_factory)
+    wrapper = CachedEmbeddingsWrapper(mock_embeddings, cache=cache)
+
+    first = wrapper.embed_documents(["hello", "hi", "hello"])
+    second = wrapper.embed_documents(["hi", "hello"])
+
+    assert first == [[5.0, 1.0], [2.0, 1.0], [5.0, 1.0]]
+    assert second == [[2.0, 1.0], [5.0, 1.0]]
+    # 第一次只嵌入去重后的文本，第二次全部命中缓存
+    mock_embeddings.embed_documents.assert_called_once_with(["hello", "hi"])
+    assert wrapper.embed_query("hi") == [2.0, 1.0]
+    assert mock_embeddings.embed_documents.call_count == 1
@@ -0,0 +1,40 @@
+import json
+import pytest
+from unittest.mock import patch
+
+from rag_eval import config
+from rag_eval.config import get_run_settings, EvalRunSettings
+
+
+@pytest.fixture
+def eval_config_file(tmp_path):
+    path = tmp_path / "eval_config.json"
+    with patch("rag_eval.config.EVAL_CONFIG_PATH", str(path)), \
+            patch.dict(config._config_cache, {"mtime": None, "data": {}}):
+        yield path
+
+
+def test_metric_defaults_without_config(eval_config_file, monkeypatch):
+    monkeypatch.delenv("RAG_EVAL_MAX_WORKERS", raising=False)
+    settings = get_run_settings("NoiseSensitivity")
+
+    assert settings.max_workers == 4
+    assert settings.timeout == 300
+    assert get_run_settings("UnknownMetric") == EvalRunSettings()
+
+
+def test_config_precedence(eval_config_file, monkeypatch):
+    monkeypatch.setenv("RAG_EVAL_MAX_WORKERS", "2")
+    eval_config_file.write_text(json.dumps({
+        "default": {"timeout": 90, "unknown": 1},
+        "metrics": {"Faithfulness": {"max_workers": 3, "batch_size": 10}},
+    }))
+
+    faithfulness = get_run_settings("Faithfulness")
+    bleu = get_run_settings("BleuScore")
+
+    assert (faithfulness.max_workers, faithfulness.timeout, faithfulness.batch_size) == (3, 90, 10)
+    assert (bleu.max_workers, bleu.timeout, bleu.batch_size) == (2, 90, None)
+    run_config = faithfulness.to_run_config()
+    assert run_config.max_workers == 3
+    assert run_config.timeout == 90
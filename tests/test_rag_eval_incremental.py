@@ -0,0 +1,92 @@
+import pandas as pd
+import pytest
+from unittest.mock import MagicMock, patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from langchain_openai import ChatOpenAI
+from ragas.llms import LangchainLLMWrapper
+from ragas.metrics import ExactMatch, Faithfulness
+
+from models.database import Base
+from rag_eval.score_store import RowScoreStore, row_fingerprint
+from rag_eval.utils import evaluate_and_store, generate_dataset
+
+
+@pytest.fixture
+def store():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return RowScoreStore(sessionmaker(autocommit=False, bind=engine))
+
+
+def fake_evaluate(dataset, **kwargs):
+    # 得分 = 回答长度，NaN表示失败
+    scores = [float("nan") if s.response == "bad" else float(len(s.response)) for s in dataset.samples]
+    result = MagicMock()
+    result.to_pandas.return_value = pd.DataFrame({"response": [s.response for s in dataset.samples],
+                                                  "bleu_score": scores})
+    return result
+
+
+def run(store, responses, metric=None, llm=None):
+    metric = metric or ExactMatch()
+    name = type(metric).__name__
+    df = pd.DataFrame({"response": responses})
+    dataset = generate_dataset([responses, ["ref"] * len(responses)], ["response", "reference"])
+    with patch("rag_eval.utils.evaluate", side_effect=fake_evaluate) as mock_eval, \
+            patch("rag_eval.utils.set_embeddings"):
+        evaluate_and_store(dataset, metric, llm, df, name, store=store)
+    return df.rename(columns={name: "score"}), mock_eval
+
+
+def judge(model):
+    return LangchainLLMWrapper(ChatOpenAI(model=model, api_key="test"))
+
+
+def test_fingerprint_depends_on_metric_and_fields():
+    sample = {"response": "a", "retrieved_contexts": ["x", "y"]}
+    assert row_fingerprint("BleuScore", sample) == row_fingerprint("BleuScore", dict(reversed(sample.items())))
+    assert row_fingerprint("BleuScore", sample) != row_fingerprint("RougeScore", sample)
+    assert row_fingerprint("BleuScore", sample) != row_fingerprint(
+        "BleuScore", {"response": "a", "retrieved_contexts": ["y", "x"]})
+    assert row_fingerprint("Faithfulness", sample, {"llm": "gpt-4o"}) != row_fingerprint(
+        "Faithfulness", sample, {"llm": "gpt-4o-mini"})
+
+
+def test_only_new_rows_are_evaluated(store):
+    df, mock_eval = run(store, ["a", "bb", "a"])
+    assert df["score"].tolist() == [1.0, 2.0, 1.0]
+    assert [s.response for s in mock_eval.call_args.kwargs["dataset"].samples] == ["a", "bb"]
+
+    df, mock_eval = run(store, ["bb", "ccc", "a"])
+    assert df["score"].tolist() == [2.0, 3.0, 1.0]
+    assert [s.response for s in mock_eval.call_args.kwargs["dataset"].samples] == ["ccc"]
+
+    df, mock_eval = run(store, ["a", "ccc"])
+    assert df["score"].tolist() == [1.0, 3.0]
+    mock_eval.assert_not_called()
+
+
+def test_failed_rows_are_not_stored(store):
+    run(store, ["bad", "a"])
+    _, mock_eval = run(store, ["bad", "a"])
+    assert [s.response for s in mock_eval.call_args.kwargs["dataset"].samples] == ["bad"]
+
+
+def test_changing_the_judge_model_reevaluates(store):
+    run(store, ["a", "bb"], Faithfulness(), judge("gpt-4o-mini"))
+    _, mock_eval = run(store, ["a", "bb"], Faithfulness(), judge("gpt-4o-mini"))
+    mock_eval.assert_not_called()
+
+    # 换用其他评估模型时旧得分不再复用
+    _, mock_eval = run(store, ["a", "bb"], Faithfulness(), judge("gpt-4o"))
+    assert [s.response for s in mock_eval.call_args.kwargs["dataset"].samples] == ["a", "bb"]
+
+    # 不使用LLM的指标不受评估模型影响
+    run(store, ["a"], ExactMatch(), judge("gpt-4o-mini"))
+    _, mock_eval = run(store, ["a"], ExactMatch(), judge("gpt-4o"))
+    mock_eval.assert_not_called()
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from rag.utils.reranker import (
+    LexicalReranker,
+    ListwiseLLMReranker,
+    Reranker,
+    create_reranker,
+    is_decisive,
+)
+
+
+def docs(*contents, similarities=None):
+    similarities = similarities or [0.5] * len(contents)
+    return [{"content": c, "similarity": s} for c, s in zip(contents, similarities)]
+
+
+def test_is_decisive():
+    assert is_decisive(docs("a"))
+    assert is_decisive(docs("a", "b", "c", similarities=[0.9, 0.7, 0.6]), margin=0.1)
+    assert not is_decisive(docs("a", "b", similarities=[0.9, 0.85]), margin=0.1)
+    # 首个候选不是相似度最高的，或有仅由关键词命中的候选时都需要重排
+    assert not is_decisive(docs("a", "b", similarities=[0.6, 0.9]), margin=0.1)
+    assert not is_decisive(docs("a", "b", similarities=[0.9, None]), margin=0.1)
+
+
+def test_lexical_reranker_promotes_exact_terms():
+    candidates = docs("药水瓶可以装各种液体", "剧毒瓶造成剧毒减益", "毒瓶在炼药桌合成")
+    ranked = asyncio.run(LexicalReranker().rerank("毒瓶怎么合成", candidates))
+    assert ranked[0]["content"] == "毒瓶在炼药桌合成"
+    assert ranked[0]["score"] > ranked[1]["score"]
+    # 都不包含问题中的词时保持检索顺序
+    ranked = asyncio.run(LexicalReranker().rerank("铁砧", docs("x", "y")))
+    assert [d["content"] for d in ranked] == ["x", "y"]
+
+
+class FakeLLM:
+    def __init__(self, response=None, error=None):
+        self.prompts = []
+        self.response = response
+        self.error = error
+
+    async def generate_response(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        if self.error:
+            raise self.error
+        return self.response
+
+
+def test_listwise_reranker_uses_one_call():
+    llm = FakeLLM("排序：3 > 1 > 3 > 9")
+    ranked = asyncio.run(ListwiseLLMReranker(llm).rerank("q", docs("a", "b", "c")))
+    assert len(llm.prompts) == 1
+    assert "[3] c" in llm.prompts[0]
+    # 重复和越界的编号被忽略，遗漏的候选按原顺序排在最后
+    assert [d["content"] for d in ranked] == ["c", "a", "b"]
+    assert [d["score"] for d in ranked] == [3.0, 2.0, 1.0]
+
+    ranked = asyncio.run(ListwiseLLMReranker(FakeLLM(error=RuntimeError("down"))).rerank("q", docs("a", "b")))
+    assert [d["content"] for d in ranked] == ["a", "b"]
+
+
+def test_create_reranker():
+    assert isinstance(create_reranker("lexical"), LexicalReranker)
+    assert type(create_reranker("none")) is Reranker
+    assert isinstance(create_reranker("LLM", FakeLLM()), ListwiseLLMReranker)
+    with pytest.raises(ValueError):
+        create_reranker("llm")
+    with pytest.raises(ValueError):
+        create_reranker("pairwise")
@@ -0,0 +1,78 @@
+import numpy as np
+
+from rag.utils import response_cache as response_cache_module
+from rag.utils.response_cache import ResponseCache
+
+
+def test_similar_question_hits_within_scope():
+    cache = ResponseCache(capacity=8, ttl=0, threshold=0.95)
+    documents = [{"index": 1, "content": "毒瓶", "similarity": 0.9}]
+    cache.put("m|kb", cache.versions(["kb"]), "毒瓶怎么合成", [1.0, 0.0], "在炼药桌合成", documents)
+
+    answer, cached_documents = cache.get("m|kb", [0.99, 0.05])
+    assert answer == "在炼药桌合成"
+    assert cached_documents == documents
+    # 返回的是副本，调用方修改不影响缓存
+    cached_documents[0]["content"] = "改动"
+    assert cache.get("m|kb", [1.0, 0.0])[1] == documents
+
+    # 不够相似或属于其他助手时不命中
+    assert cache.get("m|kb", [0.7, 0.7]) is None
+    assert cache.get("m|other", [1.0, 0.0]) is None
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 2
+
+
+def test_entries_expire_and_are_invalidated(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache_module.time, "time", lambda: now[0])
+    cache = ResponseCache(capacity=8, ttl=60, threshold=0.9)
+    cache.put("s", cache.versions(["kb_a", "kb_b"]), "q", [0.0, 1.0], "a", [])
+    cache.put("s", cache.versions(["kb_c"]), "q2", [1.0, 0.0], "b", [])
+
+    # 任一来源知识库重新索引后，缓存的回答失效
+    cache.invalidate_collection("kb_b")
+    assert cache.get("s", [0.0, 1.0]) is None
+    assert cache.get("s", [1.0, 0.0])[0] == "b"
+
+    now[0] += 61
+    assert cache.get("s", [1.0, 0.0]) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(capacity=2, ttl=0, threshold=0.99)
+    cache.put("s", {"kb": 0}, "q1", [1.0, 0.0, 0.0], "a1", [])
+    cache.put("s", {"kb": 0}, "q2", [0.0, 1.0, 0.0], "a2", [])
+    assert cache.get("s", [1.0, 0.0, 0.0])[0] == "a1"
+    cache.put("other", {"kb": 0}, "q3", [0.0, 0.0, 1.0], "a3", [])
+
+    assert cache.get("s", [0.0, 1.0, 0.0]) is None
+    assert cache.get("s", [1.0, 0.0, 0.0])[0] == "a1"
+    assert cache.get("other", [0.0, 0.0, 1.0])[0] == "a3"
+
+
+def test_reindex_during_generation_leaves_answer_stale():
+    cache = ResponseCache(capacity=8, ttl=0, threshold=0.9)
+    # 检索前记录版本，生成期间知识库被重新索引
+    versions = cache.versions(["kb"])
+    cache.invalidate_collection("kb")
+    cache.put("s", versions, "q", [1.0, 0.0], "基于旧文档的回答", [])
+    assert cache.get("s", [1.0, 0.0]) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_scope_matrix_stays_consistent_after_removals():
+    cache = ResponseCache(capacity=64, ttl=0, threshold=0.999)
+    vectors = np.eye(20, dtype="float32")
+    for i, vector in enumerate(vectors):
+        cache.put("s", {f"kb{i % 3}": 0}, f"q{i}", vector, f"a{i}", [])
+    # 失效条目被移除时用最后一行填补，其余条目仍命中自己的回答
+    cache.invalidate_collection("kb1")
+    for i, vector in enumerate(vectors):
+        hit = cache.get("s", vector)
+        assert (hit is None) if i % 3 == 1 else (hit[0] == f"a{i}")
+    for i, vector in enumerate(vectors):
+        hit = cache.get("s", vector)
+        assert (hit is None) if i % 3 == 1 else (hit[0] == f"a{i}")
+    assert cache.stats()["size"] == 13
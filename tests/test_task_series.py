@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models.database import Base
+from models.Task import RAGEvaluation, PromptEvaluation
+from rag_eval.score_store import save_eval_row_scores
+from task.series import get_task_series, series_etag, backfill_scores, get_row_scores, eval_score
+
+
+@pytest.fixture
+def db():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, bind=engine)()
+    yield session
+    session.close()
+
+
+def add_evals(db, method, scores):
+    for score in scores:
+        db.add(RAGEvaluation(task_id=1, method=method, score=score, status="success", finished=1))
+    db.commit()
+
+
+def test_series_points_and_stats(db):
+    add_evals(db, "置信度", [0.5, None, 0.9, 0.4])
+    add_evals(db, "Bleu分数", [0.2, 0.3])
+
+    series = get_task_series(db, "rag", 1)
+
+    assert [s["method"] for s in series] == ["Bleu分数", "置信度"]
+    faithfulness = series[1]
+    assert [p["round"] for p in faithfulness["points"]] == [1, 2, 3]
+    assert [p["delta"] for p in faithfulness["points"]] == pytest.approx([None, 0.4, -0.5], nan_ok=True)
+    stats = faithfulness["stats"]
+    assert stats["count"] == 3
+    assert stats["mean"] == pytest.approx(0.6)
+    assert (stats["p50"], stats["min"], stats["max"]) == (0.5, 0.4, 0.9)
+    assert series[0]["stats"]["p50"] == pytest.approx(0.25)
+
+
+def test_series_for_selected_methods(db):
+    add_evals(db, "置信度", [0.5])
+    assert get_task_series(db, "rag", 1, ["Bleu分数"]) == [{
+        "method": "Bleu分数", "points": [],
+        "stats": {"count": 0, "mean": None, "p50": None, "min": None, "max": None, "last_delta": None},
+    }]
+
+
+def test_etag_changes_with_evals(db):
+    add_evals(db, "置信度", [0.5])
+    etag = series_etag(db, RAGEvaluation, 1, ["置信度"])
+    assert series_etag(db, RAGEvaluation, 1, ["置信度"]) == etag
+
+    add_evals(db, "置信度", [0.7])
+    assert series_etag(db, RAGEvaluation, 1, ["置信度"]) != etag
+
+
+def test_backfill_scores(db):
+    db.add(PromptEvaluation(task_id=1, method="明确性", status="success", output_text="评估分数：7.5/10，清晰"))
+    db.add(PromptEvaluation(task_id=1, method="明确性", status="success", output_text="评估失败"))
+    db.add(RAGEvaluation(task_id=1, method="置信度", status="success", output_text=0.8))
+    db.commit()
+
+    backfill_scores(db)
+
+    assert [e.score for e in db.query(PromptEvaluation).order_by(PromptEvaluation.id)] == [7.5, None]
+    assert db.query(RAGEvaluation).one().score == 0.8
+
+
+def test_eval_score_falls_back_to_text():
+    # 未补全得分的旧数据（如非success状态）在绘图时从文本中解析
+    assert eval_score(PromptEvaluation(status="running", output_text="评估分数：6/10，一般")) == 6.0
+    assert eval_score(RAGEvaluation(status="failed", output_text="0.25")) == 0.25
+    assert eval_score(RAGEvaluation(status="failed", output_text="error")) is None
+    assert eval_score(RAGEvaluation(score=0.5, output_text="0.25")) == 0.5
+
+
+def test_row_scores_saved_and_ordered(db):
+    eval = RAGEvaluation(id=3, task_id=1, method="置信度")
+    save_eval_row_scores(db, eval, [0.9, float("nan"), 0.2])
+    db.commit()
+    # 重新评估时覆盖
+    save_eval_row_scores(db, eval, [0.9, float("nan"), 0.2, 0.5])
+    db.commit()
+
+    assert get_row_scores(db, 3) == [{"row": 1, "score": None}, {"row": 2, "score": 0.2},
+                                     {"row": 3, "score": 0.5}, {"row": 0, "score": 0.9}]
+    assert get_row_scores(db, 3, max_score=0.5) == [{"row": 2, "score": 0.2}, {"row": 3, "score": 0.5}]
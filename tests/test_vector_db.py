@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from rag.utils.vector_db import VectorDatabase
+
+
+class FakeEmbeddingFunction:
+    def __call__(self, input):
+        return [[float(len(t)), 1.0] for t in input]
+
+    def name(self):
+        return "fake"
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "chroma")
+
+
+def test_collection_handle_cached_and_invalidated(store_path):
+    async def run():
+        writer = VectorDatabase(store_path, embedding_function=FakeEmbeddingFunction())
+        reader = VectorDatabase(store_path, embedding_function=FakeEmbeddingFunction())
+        await writer.create_collection("docs", {"source": "test"})
+        await writer.add_documents("docs", ["x", "yy"], ids=["1", "2"])
+
+        assert await reader.search_documents("docs", "x", k=1) == [("x", 1.0)]
+        handle = await reader.get_collection("docs")
+        assert await reader.get_collection("docs") is handle
+
+        # 通过另一个实例删除后，缓存的句柄失效
+        await writer.delete_collection("docs")
+        assert await reader.get_collection("docs") is None
+
+        await writer.create_collection("docs", {"source": "test"})
+        await writer.add_documents("docs", ["zzz"], ids=["3"])
+        assert [doc for doc, _ in await reader.search_documents("docs", "x", k=1)] == ["zzz"]
+
+    asyncio.run(run())
+
+
+def test_search_with_precomputed_embedding(store_path):
+    async def run():
+        db = VectorDatabase(store_path, embedding_function=FakeEmbeddingFunction())
+        await db.create_collection("docs", {"source": "test"})
+        await db.add_documents("docs", ["x", "yyy"], ids=["1", "2"])
+
+        embedding = await db.embed_query("abc")
+        assert embedding == [3.0, 1.0]
+        # 传入查询向量时按向量检索，不再使用查询文本
+        results = await db.search_documents("docs", "ignored", k=1, query_embedding=embedding)
+        assert [doc for doc, _ in results] == ["yyy"]
+
+    asyncio.run(run())
+
+
+class CountingEmbeddingFunction(FakeEmbeddingFunction):
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, input):
+        self.calls.append(list(input))
+        return super().__call__(input)
+
+
+@pytest.mark.parametrize("backend", ["chroma", "faiss"])
+def test_search_documents_batch(tmp_path, backend):
+    if backend == "faiss":
+        pytest.importorskip("faiss")
+        from rag.utils.vector_db_rebuild import VectorDatabase as Database
+    else:
+        Database = VectorDatabase
+
+    async def run():
+        ef = CountingEmbeddingFunction()
+        db = Database(str(tmp_path / backend), embedding_function=ef)
+        await db.initialize()
+        await db.create_collection("docs", {"source": "test"})
+        await db.add_documents("docs", ["x", "yyyyyy"], ids=["1", "2"])
+        ef.calls.clear()
+
+        results = await db.search_documents_batch("docs", [f"{backend}-q1", f"{backend}-query-two"], k=1)
+
+        # 所有查询只发起一次嵌入请求
+        assert ef.calls == [[f"{backend}-q1", f"{backend}-query-two"]]
+        assert len(results) == 2 and all(len(r) == 1 for r in results)
+        assert await db.search_documents_batch("missing", ["a", "b"]) == [[], []]
+
+    asyncio.run(run())
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from rag.utils import vector_store
+from rag.utils.vector_store import create_vector_database, get_backend_class, migrate_collections
+
+
+class CountingEmbeddingFunction:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, input):
+        self.calls += 1
+        return [[float(len(t)), 1.0] for t in input]
+
+    def name(self):
+        return "counting"
+
+
+def test_backend_selection(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "VECTOR_BACKEND", "faiss")
+    monkeypatch.setattr(vector_store, "VECTOR_DB_PATH", str(tmp_path / "faiss"))
+    db = create_vector_database(embedding_function=CountingEmbeddingFunction())
+    assert type(db).__module__ == "rag.utils.vector_db_rebuild"
+    assert db.persist_directory == str(tmp_path / "faiss")
+
+    db = create_vector_database(backend="chroma", embedding_function=CountingEmbeddingFunction())
+    assert type(db).__module__ == "rag.utils.vector_db"
+    assert db.persist_directory == "./data/chroma"
+
+    with pytest.raises(ValueError):
+        get_backend_class("milvus")
+
+
+@pytest.mark.parametrize("source_backend,target_backend", [("chroma", "faiss"), ("faiss", "chroma")])
+def test_migration_copies_vectors_without_reembedding(tmp_path, source_backend, target_backend):
+    async def run():
+        source_ef, target_ef = CountingEmbeddingFunction(), CountingEmbeddingFunction()
+        source = create_vector_database(str(tmp_path / "src"), source_backend, source_ef)
+        target = create_vector_database(str(tmp_path / "dst"), target_backend, target_ef)
+        await source.initialize()
+        await target.initialize()
+        await source.create_collection("docs", {"source_hash": "abc"})
+        await source.add_documents("docs", ["x", "yyy", "zz"],
+                                   metadatas=[{"chunk_index": i} for i in range(3)],
+                                   ids=["1", "2", "3"])
+
+        assert await migrate_collections(source, target) == {"docs": 3}
+        assert target_ef.calls == 0
+        assert await target.get_collection_metadata("docs") == {"source_hash": "abc"}
+        assert sorted(await target.get_document_ids("docs")) == ["1", "2", "3"]
+
+        results = await target.search_documents("docs", "q", k=1, query_embedding=[3.0, 1.0])
+        assert [doc for doc, _ in results] == ["yyy"]
+        # 已存在的集合默认跳过
+        assert await migrate_collections(source, target) == {}
+
+    asyncio.run(run())
+
+
+def test_faiss_delete_and_update_metadata(tmp_path):
+    async def run():
+        db = create_vector_database(str(tmp_path / "faiss"), "faiss", CountingEmbeddingFunction())
+        await db.initialize()
+        await db.create_collection("docs")
+        await db.add_documents("docs", ["x", "yyy", "zz"], ids=["1", "2", "3"])
+
+        await db.delete_documents("docs", ["2"])
+        await db.update_metadatas("docs", ["3"], [{"chunk_index": 1}])
+        assert await db.get_document_ids("docs") == ["1", "3"]
+        assert await db.get_collection_count("docs") == 2
+        exported = await db.export_collection("docs")
+        assert exported["documents"] == ["x", "zz"]
+        assert exported["metadatas"] == [{}, {"chunk_index": 1}]
+
+    asyncio.run(run())